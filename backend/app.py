@@ -5,8 +5,12 @@ Minimal latency, maximum performance
 """
 
 import os
+import re
 import sys
 import asyncio
+import queue
+import logging
+import logging.handlers
 from pathlib import Path
 import json
 from typing import Dict, Any, List, Optional
@@ -22,8 +26,21 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
+# Fast JSON for the broadcast hot path (falls back to stdlib json)
+try:
+    import orjson
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def dumps_bytes(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
 load_dotenv()
 
+# Full tracebacks on command errors only when explicitly requested
+DEBUG = os.environ.get('SIGMA_DEBUG') == '1'
+
 print("🚀 SIGMA-OS Backend Starting...", flush=True)
 
 # Try to import automation features (optional - won't break if missing)
@@ -68,6 +85,16 @@ app.add_middleware(
 agents = {}
 workflow_engine = None
 active_websockets: List[WebSocket] = []
+main_loop: Optional[asyncio.AbstractEventLoop] = None
+agent_log_handler: Optional[logging.handlers.QueueHandler] = None
+agent_log_listener: Optional[logging.handlers.QueueListener] = None
+
+# Per-client outgoing queue bound (drop-on-overflow)
+WS_QUEUE_MAXSIZE = 1024
+
+# Agent routing keywords, matched case-insensitively anywhere in the command
+EMAIL_ROUTE = re.compile(r"mail", re.IGNORECASE)  # covers email / send email
+WEB_ROUTE = re.compile(r"web|browser|search", re.IGNORECASE)  # covers website
 
 # Models
 class CommandRequest(BaseModel):
@@ -87,13 +114,19 @@ def init_agents():
     print("🤖 INITIALIZING INTELLIGENT AGENTS", flush=True)
     print("="*80, flush=True)
     
-    def broadcast_update(update: AgentUpdate):
-        message = json.dumps(update.to_dict())
+    def enqueue_update(message: bytes):
         for ws in active_websockets:
             try:
-                asyncio.create_task(ws.send_text(message))
-            except:
-                pass
+                ws.state.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                pass  # Slow client - drop update instead of piling up
+    
+    def broadcast_update(update: AgentUpdate):
+        # Agents run in worker threads; hand the message to the event loop
+        if main_loop is None or not active_websockets:
+            return
+        message = dumps_bytes(update.to_dict())
+        main_loop.call_soon_threadsafe(enqueue_update, message)
     
     print("   Creating System Agent...", flush=True)
     agents['system'] = SystemAgent(update_callback=broadcast_update)
@@ -117,9 +150,34 @@ def init_agents():
     print("\n✅ All agents initialized successfully!", flush=True)
     print("="*80 + "\n", flush=True)
 
+def start_agent_logging():
+    """Print agent updates from a listener thread so agents never wait on stdout"""
+    global agent_log_handler, agent_log_listener
+    log_queue = queue.SimpleQueue()
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    agent_log_handler = logging.handlers.QueueHandler(log_queue)
+    agent_log_listener = logging.handlers.QueueListener(log_queue, console)
+    agent_logger = logging.getLogger('sigma.agent')
+    agent_logger.addHandler(agent_log_handler)
+    agent_logger.setLevel(logging.INFO)
+    agent_log_listener.start()
+
+def stop_agent_logging():
+    """Detach the queue handler and flush pending agent updates"""
+    global agent_log_handler, agent_log_listener
+    if agent_log_listener is None:
+        return
+    logging.getLogger('sigma.agent').removeHandler(agent_log_handler)
+    agent_log_listener.stop()
+    agent_log_handler = agent_log_listener = None
+
 @app.on_event("startup")
 async def on_startup():
     """Initialize agents on startup - keep it fast!"""
+    global main_loop
+    main_loop = asyncio.get_running_loop()
+    start_agent_logging()
     
     # Initialize agents first (core functionality)
     init_agents()
@@ -134,6 +192,11 @@ async def on_startup():
     
     print("✅ SIGMA-OS ready!")
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Flush agent log output before exit"""
+    stop_agent_logging()
+
 init_agents()
 
 # Health check
@@ -154,7 +217,7 @@ async def health():
 @app.get("/models")
 async def get_models():
     try:
-        model_manager._check_availability()
+        model_manager.refresh_availability()
         return {
             "models": model_manager.get_available_models(),
             "current_thinking": model_manager.current_thinking_model,
@@ -211,9 +274,9 @@ async def execute_command(request: CommandRequest):
     
     try:
         # Route to best agent (99% of time it's system agent)
-        if any(word in command.lower() for word in ['email', 'mail', 'send email']):
+        if EMAIL_ROUTE.search(command):
             agent_name = 'email'
-        elif any(word in command.lower() for word in ['web', 'browser', 'search', 'website']):
+        elif WEB_ROUTE.search(command):
             agent_name = 'web'
         else:
             agent_name = 'system'  # Default to system for 99% of tasks
@@ -223,8 +286,10 @@ async def execute_command(request: CommandRequest):
         print(f"🎯 Using Agent: {agent_name.upper()}", flush=True)
         print(f"⚡ Executing...", flush=True)
         
-        # Execute
-        result = agent.run(
+        # Blocking agent work (shell commands, screenshot tools, API calls)
+        # runs in worker threads so it doesn't stall websocket traffic;
+        # independent plan steps run concurrently
+        result = await agent.arun(
             task=command,
             context={"mode": request.mode, "command": command}
         )
@@ -273,9 +338,10 @@ async def execute_command(request: CommandRequest):
         )
         
     except Exception as e:
-        print(f"❌ Error: {str(e)}\n")
-        import traceback
-        traceback.print_exc()
+        print(f"❌ Error: {type(e).__name__}: {str(e)}\n")
+        if DEBUG:
+            import traceback
+            traceback.print_exc()
         
         error_output = {
             "type": "error",
@@ -298,23 +364,46 @@ async def execute_command(request: CommandRequest):
         )
 
 # WebSocket for real-time updates
+async def _ws_writer(websocket: WebSocket):
+    """
+    Single long-lived sender per client, fed by its queue; the only task that
+    sends on the socket (bytes are agent updates, str are text replies)
+    """
+    queue = websocket.state.queue
+    try:
+        while True:
+            message = await queue.get()
+            if isinstance(message, str):
+                await websocket.send_text(message)
+            else:
+                await websocket.send_bytes(message)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        pass  # Client went away - the receive loop handles cleanup
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """Real-time agent updates"""
     await websocket.accept()
+    websocket.state.queue = asyncio.Queue(maxsize=WS_QUEUE_MAXSIZE)
+    # Queued before any update so the greeting is always the first message
+    websocket.state.queue.put_nowait(json.dumps({
+        "type": "connection",
+        "message": "Connected to SIGMA-OS",
+        "agents": list(agents.keys())
+    }))
+    writer = asyncio.create_task(_ws_writer(websocket))
     active_websockets.append(websocket)
     
     try:
-        await websocket.send_json({
-            "type": "connection",
-            "message": "Connected to SIGMA-OS",
-            "agents": list(agents.keys())
-        })
-        
         while True:
             data = await websocket.receive_text()
             if data == "ping":
-                await websocket.send_text("pong")
+                try:
+                    websocket.state.queue.put_nowait("pong")
+                except asyncio.QueueFull:
+                    pass  # Slow client - it will ping again
                 
     except WebSocketDisconnect:
         active_websockets.remove(websocket)
@@ -322,6 +411,8 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f"WebSocket error: {e}")
         if websocket in active_websockets:
             active_websockets.remove(websocket)
+    finally:
+        writer.cancel()
 
 # Startup message
 if __name__ == "__main__":
@@ -330,4 +421,25 @@ if __name__ == "__main__":
     print("   HTTP: http://localhost:5000")
     print("   WebSocket: ws://localhost:5000/ws\n")
     
-    uvicorn.run(app, host="0.0.0.0", port=5000)
+    # C-accelerated event loop and HTTP parser when installed
+    try:
+        import uvloop  # noqa: F401
+        loop_impl = "uvloop"
+    except ImportError:
+        loop_impl = "asyncio"
+    try:
+        import httptools  # noqa: F401
+        http_impl = "httptools"
+    except ImportError:
+        http_impl = "h11"
+    
+    # Single worker: agents and websocket clients live in process memory
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=5000,
+        loop=loop_impl,
+        http=http_impl,
+        workers=1,
+        access_log=False
+    )
@@ -1,10 +1,18 @@
 """Enhanced Error Recovery - Auto-retry with intelligent backoff strategies"""
 
 import asyncio
+import logging
+import time
+from array import array
 from datetime import datetime, timedelta
-from typing import Dict, Any, Callable, Optional
+from collections import OrderedDict
+from typing import Dict, Any, Callable, List, Optional
 from enum import Enum
+from functools import lru_cache
 import random
+import re
+
+logger = logging.getLogger(__name__)
 
 
 class BackoffStrategy(str, Enum):
@@ -12,7 +20,8 @@ class BackoffStrategy(str, Enum):
     LINEAR = "linear"
     EXPONENTIAL = "exponential"
     FIBONACCI = "fibonacci"
-    JITTER = "jitter"  # Exponential with random jitter
+    JITTER = "jitter"  # Full jitter: random delay in [0, exponential]
+    DECORRELATED_JITTER = "decorrelated_jitter"  # random in [base, 3 * previous delay]
 
 
 class ErrorCategory(str, Enum):
@@ -25,6 +34,71 @@ class ErrorCategory(str, Enum):
     UNKNOWN = "unknown"
 
 
+# Category -> column in the per-context error count table
+_CATEGORIES = tuple(ErrorCategory)
+_NUM_CATEGORIES = len(_CATEGORIES)
+_CAT_INDEX = {category: index for index, category in enumerate(_CATEGORIES)}
+_EMPTY_CATEGORY_ROW = array('L', [0] * _NUM_CATEGORIES)
+
+# Circuit breaker states and defaults
+CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN = 0, 1, 2
+_CIRCUIT_STATE_NAMES = ("closed", "open", "half-open")
+CIRCUIT_THRESHOLD = 5  # failures before opening
+CIRCUIT_TIMEOUT = 60.0  # seconds before a half-open retry
+HALF_OPEN_SUCCESSES = 3  # consecutive probe successes needed to close
+
+# Retry sequences currently backing off, across all ErrorRecovery instances.
+# Above HERD_THRESHOLD the first retry gets an extra random phase so that
+# contexts failing together don't retry in lockstep. (random reseeds itself
+# after fork, so forked workers already draw different phases.)
+_inflight_retries = 0
+HERD_THRESHOLD = 8
+HERD_PHASE_FRACTION = 0.1
+
+# Upper bound on tracked contexts (least recently used are evicted)
+MAX_CONTEXTS = 10_000
+
+# Error message keywords per category, matched case-insensitively in one pass
+_CATEGORY_RE = re.compile(
+    r"(?P<TIMEOUT>timeout)"
+    r"|(?P<NETWORK>network|connection|unreachable)"
+    r"|(?P<RATE_LIMIT>rate limit|too many requests|429)"
+    r"|(?P<AUTH>auth|unauthorized|401|403)"
+    r"|(?P<RESOURCE>memory|disk|resource|quota)"
+    r"|(?P<VALIDATION>validation|invalid|bad request|400)",
+    re.IGNORECASE,
+)
+
+# When a message matches several categories, the first listed wins
+_CATEGORY_PRIORITY = (
+    ErrorCategory.TIMEOUT,
+    ErrorCategory.NETWORK,
+    ErrorCategory.RATE_LIMIT,
+    ErrorCategory.AUTH,
+    ErrorCategory.RESOURCE,
+    ErrorCategory.VALIDATION,
+)
+
+
+@lru_cache(maxsize=1024)
+def _categorize(error_type: str, message: str) -> ErrorCategory:
+    """Classify an error by type name and message (pure, so safe to memoize)"""
+    
+    if "timeout" in error_type.lower():
+        return ErrorCategory.TIMEOUT
+    
+    # Single scan collecting every category hit, then resolve by priority
+    found = {m.lastgroup for m in _CATEGORY_RE.finditer(message)}
+    if not found:
+        return ErrorCategory.UNKNOWN
+    
+    for category in _CATEGORY_PRIORITY:
+        if category.name in found:
+            return category
+    
+    return ErrorCategory.UNKNOWN
+
+
 class RetryPolicy:
     """Defines retry behavior for errors"""
     
@@ -47,9 +121,38 @@ class RetryPolicy:
             ErrorCategory.RATE_LIMIT,
         ]
         self.fallback_action = fallback_action
+        self._fallback_is_coroutine = asyncio.iscoroutinefunction(fallback_action)
+        
+        # Deterministic delays are fixed per policy - precompute one per attempt
+        self._delay_table = [
+            self._compute_delay(attempt) for attempt in range(1, max_attempts + 1)
+        ]
+    
+    def calculate_delay(self, attempt: int, prev_delay: Optional[float] = None) -> float:
+        """
+        Calculate delay before next retry
+        prev_delay is the delay this retry sequence used last time; decorrelated
+        jitter draws from it, so each caller threads its own value through
+        """
+        
+        if 1 <= attempt <= len(self._delay_table):
+            delay = self._delay_table[attempt - 1]
+        else:
+            delay = self._compute_delay(attempt)
+        
+        if self.backoff_strategy == BackoffStrategy.JITTER:
+            # Full jitter (including the first retry) so failing callers desynchronize
+            delay = random.uniform(0, delay)
+        
+        elif self.backoff_strategy == BackoffStrategy.DECORRELATED_JITTER:
+            if attempt <= 1 or prev_delay is None:
+                prev_delay = self.base_delay
+            delay = min(self.max_delay, random.uniform(self.base_delay, prev_delay * 3))
+        
+        return delay
     
-    def calculate_delay(self, attempt: int) -> float:
-        """Calculate delay before next retry"""
+    def _compute_delay(self, attempt: int) -> float:
+        """Deterministic part of the delay for an attempt, capped at max_delay"""
         
         if self.backoff_strategy == BackoffStrategy.CONSTANT:
             delay = self.base_delay
@@ -64,10 +167,8 @@ class RetryPolicy:
             delay = self._fibonacci(attempt) * self.base_delay
             
         elif self.backoff_strategy == BackoffStrategy.JITTER:
-            # Exponential with random jitter to prevent thundering herd
-            exp_delay = self.base_delay * (2 ** (attempt - 1))
-            jitter = random.uniform(0, exp_delay * 0.1)  # 10% jitter
-            delay = exp_delay + jitter
+            # Exponential ceiling; the random draw happens per call in calculate_delay
+            delay = self.base_delay * (2 ** (attempt - 1))
         
         else:
             delay = self.base_delay
@@ -99,11 +200,29 @@ class ErrorRecovery:
     - Smart retry decisions
     """
     
-    def __init__(self):
-        self.error_stats: Dict[str, Dict[str, Any]] = {}
-        self.circuit_breakers: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, max_contexts: int = MAX_CONTEXTS):
+        self.max_contexts = max_contexts
         self.default_policy = RetryPolicy()
-        self.custom_policies: Dict[str, RetryPolicy] = {}
+        self.custom_policies: "OrderedDict[str, RetryPolicy]" = OrderedDict()
+        
+        # Per-context state as parallel arrays indexed by an interned context slot.
+        # Both maps are LRU-ordered and capped at max_contexts.
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        
+        # Error statistics
+        self._total_errors = array('L')
+        self._errors_by_category = array('L')  # slot * _NUM_CATEGORIES + _CAT_INDEX[category]
+        self._last_error: List[Optional[str]] = []
+        self._last_error_time: List[Optional[datetime]] = []
+        
+        # Circuit breakers
+        self._state = array('B')
+        self._failures = array('L')
+        self._opened_at = array('d')  # monotonic seconds
+        self._threshold = array('L')
+        self._timeout = array('d')  # seconds
+        self._probe_inflight = array('B')  # half-open: a probe call is running
+        self._probe_successes = array('B')  # half-open: consecutive probe successes
     
     async def execute_with_retry(
         self,
@@ -124,49 +243,72 @@ class ErrorRecovery:
             context: Context identifier for circuit breaker
         """
         
+        global _inflight_retries
+        
         func_kwargs = func_kwargs or {}
         policy = policy or self.default_policy
         
         # Check circuit breaker
         if self._is_circuit_open(context):
             raise Exception(f"Circuit breaker open for context: {context}")
+        slot = self._slots[context]
+        is_probe = self._state[slot] == CIRCUIT_HALF_OPEN
         
         last_error = None
+        is_coroutine = asyncio.iscoroutinefunction(func)
+        in_backoff = False
+        prev_delay = None  # per sequence: policies are shared between callers
         
-        for attempt in range(1, policy.max_attempts + 1):
-            try:
-                # Execute function
-                if asyncio.iscoroutinefunction(func):
-                    result = await func(*func_args, **func_kwargs)
-                else:
-                    result = func(*func_args, **func_kwargs)
-                
-                # Success - reset circuit breaker
-                self._record_success(context)
-                return result
-                
-            except Exception as e:
-                last_error = e
-                error_category = self._categorize_error(e)
-                
-                # Record error
-                self._record_error(context, error_category, str(e))
-                
-                # Check if error is retryable
-                if error_category not in policy.retry_on_errors:
-                    print(f"❌ Non-retryable error ({error_category}): {e}")
-                    break
-                
-                # Last attempt?
-                if attempt >= policy.max_attempts:
-                    print(f"❌ Max retry attempts ({policy.max_attempts}) reached")
-                    break
-                
-                # Calculate delay and wait
-                delay = policy.calculate_delay(attempt)
-                print(f"⚠️  Attempt {attempt}/{policy.max_attempts} failed: {e}")
-                print(f"   Retrying in {delay:.2f}s...")
-                await asyncio.sleep(delay)
+        try:
+            for attempt in range(1, policy.max_attempts + 1):
+                try:
+                    # Execute function
+                    if is_coroutine:
+                        result = await func(*func_args, **func_kwargs)
+                    else:
+                        result = func(*func_args, **func_kwargs)
+                    
+                    # Success - reset circuit breaker
+                    self._record_success(context)
+                    return result
+                    
+                except Exception as e:
+                    last_error = e
+                    error_msg = str(e)
+                    error_category = _categorize(type(e).__name__, error_msg)
+                    
+                    # Record error
+                    self._record_error(context, error_category, error_msg)
+                    
+                    # Check if error is retryable
+                    if error_category not in policy.retry_on_errors:
+                        logger.warning("Non-retryable error (%s): %s", error_category.value, e)
+                        break
+                    
+                    # Last attempt?
+                    if attempt >= policy.max_attempts:
+                        logger.warning("Max retry attempts (%d) reached", policy.max_attempts)
+                        break
+                    
+                    # Calculate delay and wait
+                    delay = prev_delay = policy.calculate_delay(attempt, prev_delay)
+                    if attempt == 1:
+                        _inflight_retries += 1
+                        in_backoff = True
+                        if _inflight_retries > HERD_THRESHOLD:
+                            # Many sequences failing together: smear their first retry
+                            delay += random.uniform(0, policy.base_delay * HERD_PHASE_FRACTION)
+                    logger.warning(
+                        "Attempt %d/%d failed: %s - retrying in %.2fs",
+                        attempt, policy.max_attempts, e, delay
+                    )
+                    await asyncio.sleep(delay)
+        finally:
+            if in_backoff:
+                _inflight_retries -= 1
+            if is_probe and self._slots.get(context) == slot:
+                # Never leave the probe gate held (e.g. on cancellation)
+                self._probe_inflight[slot] = 0
         
         # All retries exhausted
         self._trip_circuit_breaker(context)
@@ -174,13 +316,13 @@ class ErrorRecovery:
         # Try fallback action
         if policy.fallback_action:
             try:
-                print("🔄 Executing fallback action...")
-                if asyncio.iscoroutinefunction(policy.fallback_action):
+                logger.info("Executing fallback action")
+                if policy._fallback_is_coroutine:
                     return await policy.fallback_action(last_error)
                 else:
                     return policy.fallback_action(last_error)
             except Exception as fallback_error:
-                print(f"❌ Fallback action failed: {fallback_error}")
+                logger.error("Fallback action failed: %s", fallback_error)
         
         # Re-raise last error
         raise last_error
@@ -188,111 +330,196 @@ class ErrorRecovery:
     def _categorize_error(self, error: Exception) -> ErrorCategory:
         """Categorize error type"""
         
-        error_str = str(error).lower()
-        error_type = type(error).__name__.lower()
-        
-        if "timeout" in error_str or "timeout" in error_type:
-            return ErrorCategory.TIMEOUT
-        
-        if any(word in error_str for word in ["network", "connection", "unreachable"]):
-            return ErrorCategory.NETWORK
+        return _categorize(type(error).__name__, str(error))
+    
+    def _slot(self, context: str) -> int:
+        """Return the array slot for a context, allocating (or recycling) one on first use"""
         
-        if any(word in error_str for word in ["rate limit", "too many requests", "429"]):
-            return ErrorCategory.RATE_LIMIT
+        slot = self._slots.get(context)
+        if slot is not None:
+            self._slots.move_to_end(context)
+            return slot
         
-        if any(word in error_str for word in ["auth", "unauthorized", "401", "403"]):
-            return ErrorCategory.AUTH
+        if len(self._slots) >= self.max_contexts:
+            # Recycle the least recently used context's slot
+            _, slot = self._slots.popitem(last=False)
+            self._reset_slot(slot)
+        else:
+            slot = len(self._total_errors)
+            self._total_errors.append(0)
+            self._errors_by_category.extend(_EMPTY_CATEGORY_ROW)
+            self._last_error.append(None)
+            self._last_error_time.append(None)
+            
+            self._state.append(CIRCUIT_CLOSED)
+            self._failures.append(0)
+            self._opened_at.append(0.0)
+            self._threshold.append(CIRCUIT_THRESHOLD)
+            self._timeout.append(CIRCUIT_TIMEOUT)
+            self._probe_inflight.append(0)
+            self._probe_successes.append(0)
         
-        if any(word in error_str for word in ["memory", "disk", "resource", "quota"]):
-            return ErrorCategory.RESOURCE
+        self._slots[context] = slot
+        return slot
+    
+    def _reset_slot(self, slot: int):
+        """Clear every column of a slot before it is reused"""
         
-        if any(word in error_str for word in ["validation", "invalid", "bad request", "400"]):
-            return ErrorCategory.VALIDATION
+        self._total_errors[slot] = 0
+        base = slot * _NUM_CATEGORIES
+        self._errors_by_category[base:base + _NUM_CATEGORIES] = _EMPTY_CATEGORY_ROW
+        self._last_error[slot] = None
+        self._last_error_time[slot] = None
         
-        return ErrorCategory.UNKNOWN
+        self._state[slot] = CIRCUIT_CLOSED
+        self._failures[slot] = 0
+        self._opened_at[slot] = 0.0
+        self._threshold[slot] = CIRCUIT_THRESHOLD
+        self._timeout[slot] = CIRCUIT_TIMEOUT
+        self._probe_inflight[slot] = 0
+        self._probe_successes[slot] = 0
     
     def _record_error(self, context: str, category: ErrorCategory, error_msg: str):
         """Record error statistics"""
         
-        if context not in self.error_stats:
-            self.error_stats[context] = {
-                "total_errors": 0,
-                "errors_by_category": {},
-                "last_error": None,
-                "last_error_time": None,
-            }
-        
-        stats = self.error_stats[context]
-        stats["total_errors"] += 1
-        stats["last_error"] = error_msg
-        stats["last_error_time"] = datetime.utcnow()
-        
-        if category.value not in stats["errors_by_category"]:
-            stats["errors_by_category"][category.value] = 0
-        stats["errors_by_category"][category.value] += 1
+        slot = self._slot(context)
+        self._total_errors[slot] += 1
+        self._errors_by_category[slot * _NUM_CATEGORIES + _CAT_INDEX[category]] += 1
+        self._last_error[slot] = error_msg
+        self._last_error_time[slot] = datetime.utcnow()
     
     def _record_success(self, context: str):
         """Record successful execution"""
         
+        slot = self._slots.get(context)
+        if slot is None:
+            return
+        
+        if self._state[slot] == CIRCUIT_HALF_OPEN:
+            # Close only after enough consecutive probes succeed
+            self._probe_inflight[slot] = 0
+            self._probe_successes[slot] += 1
+            if self._probe_successes[slot] < HALF_OPEN_SUCCESSES:
+                return
+        
         # Reset circuit breaker
-        if context in self.circuit_breakers:
-            self.circuit_breakers[context]["failures"] = 0
-            self.circuit_breakers[context]["state"] = "closed"
+        self._failures[slot] = 0
+        self._state[slot] = CIRCUIT_CLOSED
     
     def _is_circuit_open(self, context: str) -> bool:
         """Check if circuit breaker is open"""
         
-        if context not in self.circuit_breakers:
-            self.circuit_breakers[context] = {
-                "state": "closed",
-                "failures": 0,
-                "opened_at": None,
-                "threshold": 5,
-                "timeout": 60,  # seconds
-            }
+        slot = self._slot(context)
+        state = self._state[slot]
         
-        breaker = self.circuit_breakers[context]
-        
-        if breaker["state"] == "open":
+        if state == CIRCUIT_OPEN:
             # Check if timeout elapsed
-            if breaker["opened_at"]:
-                elapsed = (datetime.utcnow() - breaker["opened_at"]).total_seconds()
-                if elapsed > breaker["timeout"]:
-                    # Half-open: allow one retry
-                    breaker["state"] = "half-open"
-                    return False
+            if time.monotonic() - self._opened_at[slot] > self._timeout[slot]:
+                # Half-open: this caller becomes the single probe
+                self._state[slot] = CIRCUIT_HALF_OPEN
+                self._probe_inflight[slot] = 1
+                self._probe_successes[slot] = 0
+                return False
             return True
         
+        if state == CIRCUIT_HALF_OPEN:
+            # One probe at a time, admitting a growing share of traffic
+            # (25% / 50% / 75%) as consecutive probes succeed
+            if self._probe_inflight[slot]:
+                return True
+            admit = (self._probe_successes[slot] + 1) / (HALF_OPEN_SUCCESSES + 1)
+            if random.random() >= admit:
+                return True
+            self._probe_inflight[slot] = 1
+            return False
+        
         return False
     
     def _trip_circuit_breaker(self, context: str):
         """Trip circuit breaker after repeated failures"""
         
-        if context not in self.circuit_breakers:
+        slot = self._slots.get(context)
+        if slot is None:
             return
         
-        breaker = self.circuit_breakers[context]
-        breaker["failures"] += 1
+        self._failures[slot] += 1
         
-        if breaker["failures"] >= breaker["threshold"]:
-            breaker["state"] = "open"
-            breaker["opened_at"] = datetime.utcnow()
-            print(f"🔴 Circuit breaker OPEN for context: {context}")
+        # A failed half-open probe re-opens immediately
+        if self._state[slot] == CIRCUIT_HALF_OPEN or self._failures[slot] >= self._threshold[slot]:
+            self._probe_inflight[slot] = 0
+            self._state[slot] = CIRCUIT_OPEN
+            self._opened_at[slot] = time.monotonic()
+            logger.warning("Circuit breaker OPEN for context: %s", context)
     
     def set_custom_policy(self, context: str, policy: RetryPolicy):
         """Set custom retry policy for a context"""
         self.custom_policies[context] = policy
+        self.custom_policies.move_to_end(context)
+        if len(self.custom_policies) > self.max_contexts:
+            self.custom_policies.popitem(last=False)
+    
+    def _error_stats_for(self, slot: int) -> Dict[str, Any]:
+        """Build the statistics dict for one context slot"""
+        
+        base = slot * _NUM_CATEGORIES
+        counts = self._errors_by_category[base:base + _NUM_CATEGORIES]
+        
+        return {
+            "total_errors": self._total_errors[slot],
+            "errors_by_category": {
+                category.value: count
+                for category, count in zip(_CATEGORIES, counts)
+                if count
+            },
+            "last_error": self._last_error[slot],
+            "last_error_time": self._last_error_time[slot],
+        }
+    
+    @property
+    def error_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Read-only snapshot of per-context error statistics"""
+        return self.get_error_stats()
+    
+    @property
+    def circuit_breakers(self) -> Dict[str, Dict[str, Any]]:
+        """Read-only snapshot of per-context circuit breaker state"""
+        
+        now, now_monotonic = datetime.utcnow(), time.monotonic()
+        return {
+            ctx: {
+                "state": _CIRCUIT_STATE_NAMES[self._state[slot]],
+                "failures": self._failures[slot],
+                "opened_at": (
+                    now - timedelta(seconds=now_monotonic - self._opened_at[slot])
+                    if self._opened_at[slot] else None
+                ),
+                "threshold": self._threshold[slot],
+                "timeout": self._timeout[slot],
+            }
+            for ctx, slot in self._slots.items()
+        }
     
     def get_error_stats(self, context: str = None) -> Dict[str, Any]:
         """Get error statistics"""
         if context:
-            return self.error_stats.get(context, {})
-        return self.error_stats
+            slot = self._slots.get(context)
+            if slot is None or not self._total_errors[slot]:
+                return {}
+            return self._error_stats_for(slot)
+        
+        return {
+            ctx: self._error_stats_for(slot)
+            for ctx, slot in self._slots.items()
+            if self._total_errors[slot]
+        }
     
     def reset_circuit_breaker(self, context: str):
         """Manually reset circuit breaker"""
-        if context in self.circuit_breakers:
-            self.circuit_breakers[context]["state"] = "closed"
-            self.circuit_breakers[context]["failures"] = 0
-            self.circuit_breakers[context]["opened_at"] = None
-            print(f"🟢 Circuit breaker RESET for context: {context}")
+        slot = self._slots.get(context)
+        if slot is not None:
+            self._state[slot] = CIRCUIT_CLOSED
+            self._failures[slot] = 0
+            self._opened_at[slot] = 0.0
+            self._probe_inflight[slot] = 0
+            self._probe_successes[slot] = 0
+            logger.info("Circuit breaker RESET for context: %s", context)
@@ -4,8 +4,35 @@ import psutil
 import time
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
-from collections import deque
+from collections import OrderedDict, deque
+from itertools import islice
 import asyncio
+import json
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Monitor ticks between disk usage refreshes
+DISK_SAMPLE_EVERY = 10
+
+# Starting size of a MetricBuffer's value/timestamp rings (doubled up to max_size)
+INITIAL_RING_SIZE = 16
+
+# Default cap on tracked metric names / agents (least recently used are evicted)
+MAX_TRACKED = 10_000
+
+
+def _monotonic_to_datetime(mono: float) -> datetime:
+    """Convert a time.monotonic() reading to a naive UTC datetime"""
+    return datetime.utcfromtimestamp(time.time() - (time.monotonic() - mono))
+
+
+def _monotonic_to_iso(mono: float) -> str:
+    """Convert a time.monotonic() reading to a UTC ISO timestamp"""
+    return _monotonic_to_datetime(mono).isoformat()
 
 
 class MetricType:
@@ -39,40 +66,113 @@ class Metric:
 class MetricBuffer:
     """Ring buffer for storing time-series metrics"""
     
-    def __init__(self, max_size: int = 1000):
+    def __init__(self, max_size: int = 1000, name: str = None, metric_type: str = MetricType.GAUGE):
+        # Holds Metric objects, or (value, timestamp) pairs from add_value()
         self.buffer = deque(maxlen=max_size)
         self.max_size = max_size
+        self.name = name
+        self.metric_type = metric_type
+        
+        # Value and timestamp rings aligned with self.buffer (NaN marks a
+        # non-numeric value). Allocated on first use and doubled as the buffer
+        # fills, so short series don't pay for max_size slots
+        self._values = None
+        self._ts = None
+        self._head = 0  # next write position in both rings
+        self._last_ts = None
+        self._ts_sorted = True
     
     def add(self, metric: Metric):
-        self.buffer.append(metric)
+        self._append(metric, metric.value, metric.timestamp)
+    
+    def add_value(self, value: Any, timestamp: datetime):
+        """Record a raw value; a Metric is only built if it's read back"""
+        self._append((value, timestamp), value, timestamp)
+    
+    def _append(self, entry, value: Any, timestamp: datetime):
+        if self._ts is None:
+            self._grow(min(INITIAL_RING_SIZE, self.max_size))
+        elif self._head == len(self._ts) < self.max_size:
+            self._grow(min(2 * len(self._ts), self.max_size))
+        
+        self.buffer.append(entry)
+        
+        head = self._head
+        self._ts[head] = timestamp
+        self._values[head] = value if isinstance(value, (int, float)) else np.nan
+        self._head = (head + 1) % self.max_size
+        
+        if self._last_ts is not None and timestamp < self._last_ts:
+            self._ts_sorted = False  # explicit out-of-order timestamp: fall back to scanning
+        self._last_ts = timestamp
+    
+    def _grow(self, size: int):
+        """Resize both rings; they only grow before wrapping, so entries sit at [0, head)"""
+        values = np.empty(size, dtype=np.float64)
+        ts = np.empty(size, dtype="datetime64[us]")
+        if self._ts is not None:
+            values[:self._head] = self._values[:self._head]
+            ts[:self._head] = self._ts[:self._head]
+        self._values, self._ts = values, ts
     
     def get_recent(self, count: int = 10) -> List[Metric]:
         """Get most recent metrics"""
-        return list(self.buffer)[-count:]
+        # Walk back from the tail so the cost is O(count), not O(len(buffer))
+        recent = list(map(self._metric, islice(reversed(self.buffer), count)))
+        recent.reverse()
+        return recent
     
     def get_range(self, start_time: datetime, end_time: datetime) -> List[Metric]:
         """Get metrics in time range"""
-        return [
-            m for m in self.buffer
-            if start_time <= m.timestamp <= end_time
-        ]
+        if not self._ts_sorted:
+            return [
+                m for m in map(self._metric, self.buffer)
+                if start_time <= m.timestamp <= end_time
+            ]
+        
+        n = len(self.buffer)
+        if not n:
+            return []
+        
+        # Unwrap the timestamp ring into buffer order, then binary-search both bounds
+        size = len(self._ts)
+        start = (self._head - n) % size
+        if start + n <= size:
+            ts = self._ts[start:start + n]
+        else:
+            ts = np.concatenate((self._ts[start:], self._ts[:self._head]))
+        
+        lo = int(np.searchsorted(ts, np.datetime64(start_time, "us"), side="left"))
+        hi = int(np.searchsorted(ts, np.datetime64(end_time, "us"), side="right"))
+        return list(map(self._metric, islice(self.buffer, lo, hi)))
+    
+    def _metric(self, entry) -> Metric:
+        if isinstance(entry, Metric):
+            return entry
+        value, timestamp = entry
+        return Metric(self.name, self.metric_type, value, timestamp)
     
     def get_stats(self) -> Dict[str, Any]:
         """Calculate statistics"""
-        if not self.buffer:
+        n = len(self.buffer)
+        if not n:
             return {}
         
-        values = [m.value for m in self.buffer if isinstance(m.value, (int, float))]
-        
-        if not values:
+        # The ring holds exactly the buffered entries; order doesn't matter for
+        # these reductions, so no need to unwrap it
+        values = self._values[:n]
+        values = values[~np.isnan(values)]
+        count = len(values)
+        if not count:
             return {}
+        total = float(values.sum())
         
         return {
-            "count": len(values),
-            "min": min(values),
-            "max": max(values),
-            "avg": sum(values) / len(values),
-            "sum": sum(values),
+            "count": count,
+            "min": float(values.min()),
+            "max": float(values.max()),
+            "avg": total / count,
+            "sum": total,
         }
 
 
@@ -82,57 +182,58 @@ class AgentHealthStatus:
     def __init__(self, agent_name: str):
         self.agent_name = agent_name
         self.is_healthy = True
-        self.last_heartbeat = datetime.utcnow()
+        self.last_heartbeat = time.monotonic()
         self.total_tasks = 0
         self.successful_tasks = 0
         self.failed_tasks = 0
-        self.avg_response_time = 0.0
-        self.error_rate = 0.0
         self.last_error = None
         self.last_error_time = None
+        
+        # Response-time sum/count; the mean is only computed when read
+        self._rt_sum = 0.0
+        self._rt_count = 0
+        
+        # (tasks_total, response_time_ms, error_rate) metric names, built once
+        self.metric_names = tuple(
+            f"agent.{agent_name}.{suffix}"
+            for suffix in ("tasks_total", "response_time_ms", "error_rate")
+        )
+    
+    @property
+    def avg_response_time(self) -> float:
+        return self._rt_sum / self._rt_count if self._rt_count else 0.0
+    
+    @property
+    def error_rate(self) -> float:
+        return self.failed_tasks / self.total_tasks if self.total_tasks else 0.0
     
     def update_heartbeat(self):
-        self.last_heartbeat = datetime.utcnow()
+        self.last_heartbeat = time.monotonic()
     
     def record_success(self, response_time: float):
         self.total_tasks += 1
         self.successful_tasks += 1
-        self._update_avg_response_time(response_time)
-        self._update_error_rate()
+        self._rt_sum += response_time
+        self._rt_count += 1
         self.is_healthy = True
     
     def record_failure(self, error: str):
         self.total_tasks += 1
         self.failed_tasks += 1
         self.last_error = error
-        self.last_error_time = datetime.utcnow()
-        self._update_error_rate()
+        self.last_error_time = time.monotonic()
         
         # Mark unhealthy if error rate > 50%
-        if self.error_rate > 0.5:
+        if self.failed_tasks * 2 > self.total_tasks:
             self.is_healthy = False
     
-    def _update_avg_response_time(self, new_time: float):
-        """Update average response time"""
-        if self.successful_tasks == 1:
-            self.avg_response_time = new_time
-        else:
-            # Exponential moving average
-            alpha = 0.2
-            self.avg_response_time = (
-                alpha * new_time + (1 - alpha) * self.avg_response_time
-            )
-    
-    def _update_error_rate(self):
-        """Update error rate"""
-        if self.total_tasks > 0:
-            self.error_rate = self.failed_tasks / self.total_tasks
-    
-    def to_dict(self) -> Dict[str, Any]:
+    def to_dict(self, iso: bool = True) -> Dict[str, Any]:
+        # iso=False leaves datetimes for a serializer that encodes them natively
+        to_time = _monotonic_to_iso if iso else _monotonic_to_datetime
         return {
             "agent_name": self.agent_name,
             "is_healthy": self.is_healthy,
-            "last_heartbeat": self.last_heartbeat.isoformat(),
+            "last_heartbeat": to_time(self.last_heartbeat),
             "total_tasks": self.total_tasks,
             "successful_tasks": self.successful_tasks,
             "failed_tasks": self.failed_tasks,
@@ -140,7 +241,7 @@ class AgentHealthStatus:
             "error_rate": self.error_rate,
             "avg_response_time_ms": self.avg_response_time * 1000,
             "last_error": self.last_error,
-            "last_error_time": self.last_error_time.isoformat() if self.last_error_time else None,
+            "last_error_time": to_time(self.last_error_time) if self.last_error_time else None,
         }
 
 
@@ -157,9 +258,20 @@ class PerformanceMonitor:
     - Time-series data storage
     """
     
-    def __init__(self, alert_callback: Optional[callable] = None):
-        self.metrics: Dict[str, MetricBuffer] = {}
-        self.agent_health: Dict[str, AgentHealthStatus] = {}
+    def __init__(
+        self,
+        alert_callback: Optional[callable] = None,
+        max_metrics: int = MAX_TRACKED,
+        max_agents: int = MAX_TRACKED,
+    ):
+        # LRU-ordered and capped so dynamic metric/agent names can't grow without bound
+        self.metrics: "OrderedDict[str, MetricBuffer]" = OrderedDict()
+        self.agent_health: "OrderedDict[str, AgentHealthStatus]" = OrderedDict()
+        self.max_metrics = max_metrics
+        self.max_agents = max_agents
+        
+        # Agents currently over an error-rate / response-time threshold
+        self._agents_over_threshold = set()
         self.system_metrics = MetricBuffer(max_size=500)
         self.alert_callback = alert_callback
         
@@ -174,6 +286,17 @@ class PerformanceMonitor:
         
         self._monitoring = False
         self._monitor_task = None
+        
+        # Last (cpu, memory, disk) snapshot shared by one monitor tick
+        self._last_sample = None
+        self._sampled_at = 0.0
+        self._sample_interval = 30
+        self._disk_usage = None
+        self._tick = 0
+        self._boot_time = psutil.boot_time()
+        
+        # Prime psutil's CPU counter so later non-blocking reads are meaningful
+        psutil.cpu_percent(interval=None)
     
     async def start_monitoring(self, interval: int = 30):
         """Start background system monitoring"""
@@ -181,6 +304,7 @@ class PerformanceMonitor:
             return
         
         self._monitoring = True
+        self._sample_interval = interval
         self._monitor_task = asyncio.create_task(self._monitor_loop(interval))
         print("✅ Performance Monitor started")
     
@@ -199,29 +323,48 @@ class PerformanceMonitor:
         """Background monitoring loop"""
         while self._monitoring:
             try:
-                self.collect_system_metrics()
-                self._check_thresholds()
+                sample = self._sample_system()
+                self.collect_system_metrics(sample)
+                self._check_thresholds(sample)
                 await asyncio.sleep(interval)
             except Exception as e:
                 print(f"⚠️  Monitor error: {e}")
                 await asyncio.sleep(interval)
     
-    def collect_system_metrics(self):
+    def _sample_system(self) -> tuple:
+        """Take one non-blocking (cpu, memory, disk) snapshot"""
+        
+        cpu_percent = psutil.cpu_percent(interval=None)
+        memory = psutil.virtual_memory()
+        
+        # Disk usage changes slowly - refresh it every few ticks
+        if self._disk_usage is None or self._tick % DISK_SAMPLE_EVERY == 0:
+            self._disk_usage = psutil.disk_usage('/')
+        self._tick += 1
+        
+        self._last_sample = (cpu_percent, memory, self._disk_usage)
+        self._sampled_at = time.monotonic()
+        return self._last_sample
+    
+    def _current_sample(self) -> tuple:
+        """Last snapshot, re-sampled only if older than one monitor interval"""
+        if self._last_sample is None or time.monotonic() - self._sampled_at > self._sample_interval:
+            return self._sample_system()
+        return self._last_sample
+    
+    def collect_system_metrics(self, sample: tuple = None):
         """Collect system resource metrics"""
         
-        now = datetime.utcnow()
+        cpu_percent, memory, disk = sample or self._sample_system()
         
         # CPU
-        cpu_percent = psutil.cpu_percent(interval=1)
         self.record_metric("system.cpu_percent", cpu_percent, MetricType.GAUGE)
         
         # Memory
-        memory = psutil.virtual_memory()
         self.record_metric("system.memory_percent", memory.percent, MetricType.GAUGE)
         self.record_metric("system.memory_used_mb", memory.used / 1024 / 1024, MetricType.GAUGE)
         
         # Disk
-        disk = psutil.disk_usage('/')
         self.record_metric("system.disk_percent", disk.percent, MetricType.GAUGE)
         self.record_metric("system.disk_free_gb", disk.free / 1024 / 1024 / 1024, MetricType.GAUGE)
         
@@ -236,11 +379,8 @@ class PerformanceMonitor:
     def record_metric(self, name: str, value: Any, metric_type: str = MetricType.GAUGE):
         """Record a custom metric"""
         
-        if name not in self.metrics:
-            self.metrics[name] = MetricBuffer()
-        
         metric = Metric(name, metric_type, value)
-        self.metrics[name].add(metric)
+        self._register_buffer(name, metric_type).add(metric)
         
         if name.startswith("system."):
             self.system_metrics.add(metric)
@@ -254,10 +394,15 @@ class PerformanceMonitor:
     ):
         """Record agent task execution"""
         
-        if agent_name not in self.agent_health:
-            self.agent_health[agent_name] = AgentHealthStatus(agent_name)
+        health = self.agent_health.get(agent_name)
+        if health is None:
+            health = self.agent_health[agent_name] = AgentHealthStatus(agent_name)
+            if len(self.agent_health) > self.max_agents:
+                evicted, _ = self.agent_health.popitem(last=False)
+                self._agents_over_threshold.discard(evicted)
+        else:
+            self.agent_health.move_to_end(agent_name)
         
-        health = self.agent_health[agent_name]
         health.update_heartbeat()
         
         if success:
@@ -265,20 +410,44 @@ class PerformanceMonitor:
         else:
             health.record_failure(error or "Unknown error")
         
-        # Record metrics
-        self.record_metric(f"agent.{agent_name}.tasks_total", health.total_tasks, MetricType.COUNTER)
-        self.record_metric(f"agent.{agent_name}.response_time_ms", response_time * 1000, MetricType.TIMER)
-        self.record_metric(f"agent.{agent_name}.error_rate", health.error_rate, MetricType.GAUGE)
+        self._update_agent_threshold_flag(agent_name, health)
+        
+        # Looked up on every task so the LRU sees the agent's series as in use
+        # (and recreates any that were evicted)
+        tasks_name, rt_name, error_name = health.metric_names
+        now = datetime.utcnow()
+        self._register_buffer(tasks_name, MetricType.COUNTER).add_value(health.total_tasks, now)
+        self._register_buffer(rt_name, MetricType.TIMER).add_value(response_time * 1000, now)
+        self._register_buffer(error_name, MetricType.GAUGE).add_value(health.error_rate, now)
     
-    def get_agent_health(self, agent_name: str = None) -> Dict[str, Any]:
+    def _register_buffer(self, name: str, metric_type: str = MetricType.GAUGE) -> "MetricBuffer":
+        """Get (marking it recently used) or create the named buffer in self.metrics"""
+        buffer = self.metrics.get(name)
+        if buffer is None:
+            buffer = self.metrics[name] = MetricBuffer(name=name, metric_type=metric_type)
+            if len(self.metrics) > self.max_metrics:
+                self.metrics.popitem(last=False)
+        else:
+            self.metrics.move_to_end(name)
+        return buffer
+    
+    def _update_agent_threshold_flag(self, agent_name: str, health: AgentHealthStatus):
+        """Track whether an agent currently breaches an agent-level threshold"""
+        if (health.error_rate > self.thresholds["agent_error_rate"]
+                or health.avg_response_time * 1000 > self.thresholds["response_time_ms"]):
+            self._agents_over_threshold.add(agent_name)
+        else:
+            self._agents_over_threshold.discard(agent_name)
+    
+    def get_agent_health(self, agent_name: str = None, iso: bool = True) -> Dict[str, Any]:
         """Get agent health status"""
         if agent_name:
             if agent_name in self.agent_health:
-                return self.agent_health[agent_name].to_dict()
+                return self.agent_health[agent_name].to_dict(iso)
             return {}
         
         return {
-            name: health.to_dict()
+            name: health.to_dict(iso)
             for name, health in self.agent_health.items()
         }
     
@@ -286,9 +455,7 @@ class PerformanceMonitor:
         """Get overall system health"""
         
         try:
-            cpu = psutil.cpu_percent()
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
+            cpu, memory, disk = self._current_sample()
             
             return {
                 "status": "healthy" if all([
@@ -299,7 +466,7 @@ class PerformanceMonitor:
                 "cpu_percent": cpu,
                 "memory_percent": memory.percent,
                 "disk_percent": disk.percent,
-                "uptime_seconds": time.time() - psutil.boot_time(),
+                "uptime_seconds": time.time() - self._boot_time,
                 "agents_healthy": sum(1 for h in self.agent_health.values() if h.is_healthy),
                 "agents_total": len(self.agent_health),
             }
@@ -315,29 +482,28 @@ class PerformanceMonitor:
         
         return summary
     
-    def _check_thresholds(self):
+    def _check_thresholds(self, sample: tuple = None):
         """Check if any thresholds are exceeded"""
         
         alerts = []
         
         # Check system metrics
         try:
-            cpu = psutil.cpu_percent()
+            cpu, memory, disk = sample or self._current_sample()
             if cpu > self.thresholds["cpu_percent"]:
                 alerts.append(f"High CPU usage: {cpu:.1f}%")
             
-            memory = psutil.virtual_memory()
             if memory.percent > self.thresholds["memory_percent"]:
                 alerts.append(f"High memory usage: {memory.percent:.1f}%")
             
-            disk = psutil.disk_usage('/')
             if disk.percent > self.thresholds["disk_percent"]:
                 alerts.append(f"High disk usage: {disk.percent:.1f}%")
         except:
             pass
         
-        # Check agent health
-        for agent_name, health in self.agent_health.items():
+        # Check agent health (only agents flagged when their last task was recorded)
+        for agent_name in self._agents_over_threshold:
+            health = self.agent_health[agent_name]
             if health.error_rate > self.thresholds["agent_error_rate"]:
                 alerts.append(f"High error rate for {agent_name}: {health.error_rate:.1%}")
             
@@ -358,13 +524,24 @@ class PerformanceMonitor:
     def set_threshold(self, metric_name: str, value: float):
         """Set alert threshold"""
         self.thresholds[metric_name] = value
+        
+        if metric_name in ("agent_error_rate", "response_time_ms"):
+            for agent_name, health in self.agent_health.items():
+                self._update_agent_threshold_flag(agent_name, health)
     
-    def get_dashboard_data(self) -> Dict[str, Any]:
+    def get_dashboard_data(self, iso: bool = True) -> Dict[str, Any]:
         """Get comprehensive dashboard data"""
+        now = datetime.utcnow()
         return {
             "system_health": self.get_system_health(),
-            "agent_health": self.get_agent_health(),
+            "agent_health": self.get_agent_health(iso=iso),
             "metrics_summary": self.get_metrics_summary(),
             "thresholds": self.thresholds,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": now.isoformat() if iso else now,
         }
+    
+    def get_dashboard_json(self) -> bytes:
+        """Dashboard data serialized to JSON bytes (orjson encodes datetimes in C)"""
+        if orjson is not None:
+            return orjson.dumps(self.get_dashboard_data(iso=False))
+        return json.dumps(self.get_dashboard_data()).encode()
@@ -1,15 +1,48 @@
 """Agent Orchestrator - Coordinate and manage multiple agents"""
 
 import asyncio
+import heapq
+import itertools
+import logging
+import re
+import time
+from array import array
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Callable
-from collections import defaultdict
-import json
+from collections import OrderedDict, defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_HISTORY_LIMIT = 10_000  # messages kept for get_message_history
+MAX_PARALLEL_AGENTS = 8  # agent worker threads at once in coordinate_agents
+ROUTE_CACHE_SIZE = 10_000  # task -> agent routes remembered after a success
+
+# Keyword routing table in priority order: agent name -> trigger substrings
+ROUTING_KEYWORDS = {
+    "email": ("email", "mail", "send message"),
+    "web": ("web", "browser", "search", "scrape", "website"),
+    "system": ("file", "folder", "directory", "screenshot", "system", "terminal"),
+}
+_ROUTE_PRIORITY = {name: i for i, name in enumerate(ROUTING_KEYWORDS)}
+
+# One pass over the task finds every keyword hit; the lookahead makes matches
+# overlap so a hit is never hidden inside a longer lower-priority keyword.
+_ROUTER_RE = re.compile(
+    "(?=" + "|".join(
+        f"(?P<{name}>{'|'.join(map(re.escape, words))})"
+        for name, words in ROUTING_KEYWORDS.items()
+    ) + ")",
+    re.IGNORECASE,
+)
 
 
 class AgentMessage:
     """Message passed between agents"""
     
+    __slots__ = (
+        "message_id", "from_agent", "to_agent", "message_type", "payload", "timestamp", "_ts_iso",
+    )
+    
     def __init__(
         self,
         from_agent: str,
@@ -18,27 +51,60 @@ class AgentMessage:
         payload: Dict[str, Any],
         message_id: str = None,
     ):
-        self.message_id = message_id or f"msg_{datetime.utcnow().timestamp()}"
+        self.message_id = message_id or f"msg_{time.time_ns()}"
         self.from_agent = from_agent
         self.to_agent = to_agent
         self.message_type = message_type
         self.payload = payload
         self.timestamp = datetime.utcnow()
+        self._ts_iso: Optional[str] = None
     
     def to_dict(self) -> Dict[str, Any]:
+        if self._ts_iso is None:
+            self._ts_iso = self.timestamp.isoformat()
         return {
             "message_id": self.message_id,
             "from": self.from_agent,
             "to": self.to_agent,
             "type": self.message_type,
             "payload": self.payload,
-            "timestamp": self.timestamp.isoformat(),
+            "timestamp": self._ts_iso,
         }
 
 
+class SPSCMailbox:
+    """
+    Unbounded mailbox for one producer and one consumer on the same event loop
+    
+    A deque plus an Event: put never awaits and get only creates a waiter
+    when the mailbox is empty, unlike asyncio.Queue's per-call futures.
+    """
+    
+    __slots__ = ("_buf", "_ev")
+    
+    def __init__(self):
+        self._buf = deque()
+        self._ev = asyncio.Event()
+    
+    def put(self, item: Any):
+        self._buf.append(item)
+        self._ev.set()
+    
+    async def get(self) -> Any:
+        while not self._buf:
+            self._ev.clear()
+            await self._ev.wait()
+        return self._buf.popleft()
+    
+    def qsize(self) -> int:
+        return len(self._buf)
+
+
 class AgentCapability:
     """Represents what an agent can do"""
     
+    __slots__ = ("name", "description", "parameters")
+    
     def __init__(self, name: str, description: str, parameters: List[str] = None):
         self.name = name
         self.description = description
@@ -59,18 +125,34 @@ class AgentOrchestrator:
     - Agent collaboration on complex tasks
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        history_limit: int = MESSAGE_HISTORY_LIMIT,
+        max_parallel_agents: int = MAX_PARALLEL_AGENTS,
+    ):
         self.agents: Dict[str, Any] = {}  # agent_name -> agent instance
         self.capabilities: Dict[str, List[AgentCapability]] = {}  # agent_name -> capabilities
-        self.message_queues: Dict[str, asyncio.Queue] = {}  # agent_name -> message queue
-        self.message_history: List[AgentMessage] = []
-        self.agent_stats: Dict[str, Dict[str, Any]] = defaultdict(lambda: {
-            "tasks_completed": 0,
-            "tasks_failed": 0,
-            "messages_sent": 0,
-            "messages_received": 0,
-            "avg_response_time": 0.0,
-        })
+        # Reverse capability index: capability name (exact and lowercased) -> agent names
+        self._cap_exact: Dict[str, set] = defaultdict(set)
+        self._cap_index: Dict[str, set] = defaultdict(set)
+        self.message_queues: Dict[str, SPSCMailbox] = {}  # agent_name -> message queue
+        self.message_history: deque = deque(maxlen=history_limit)
+        # Per-agent counters as columns indexed by a stats slot; see agent_stats
+        self._stat_slots: Dict[str, int] = {}
+        self._completed = array('Q')
+        self._failed = array('Q')
+        self._sent = array('Q')
+        self._received = array('Q')
+        self._avg_rt = array('d')
+        # Min-heap of (load, seq, agent_name); stale entries are dropped lazily
+        self._load_heap: List[tuple] = []
+        self._load_counter = itertools.count()
+        # agent_name -> invoker(task, context), resolved once at registration
+        self._agent_invokers: Dict[str, Optional[Callable]] = {}
+        # LRU of keyword routes that led to a successful task
+        self._route_cache: OrderedDict = OrderedDict()
+        self.max_parallel_agents = max_parallel_agents
+        self._agent_semaphore = asyncio.Semaphore(max_parallel_agents)
     
     def register_agent(
         self,
@@ -80,33 +162,71 @@ class AgentOrchestrator:
     ):
         """Register an agent with the orchestrator"""
         
+        if name in self.capabilities:
+            self._unindex_capabilities(name)
+        
         self.agents[name] = agent_instance
+        self._agent_invokers[name] = self._resolve_invoker(agent_instance)
         self.capabilities[name] = capabilities or []
-        self.message_queues[name] = asyncio.Queue()
+        for cap in self.capabilities[name]:
+            self._cap_exact[cap.name].add(name)
+            self._cap_index[cap.name.lower()].add(name)
+        self.message_queues[name] = SPSCMailbox()
+        self._push_load(name)
         
-        print(f"✅ Agent registered: {name} with {len(capabilities or [])} capabilities")
+        logger.info("Agent registered: %s with %d capabilities", name, len(capabilities or []))
     
     def unregister_agent(self, name: str):
         """Unregister an agent"""
         
         if name in self.agents:
+            self._unindex_capabilities(name)
             del self.agents[name]
+            del self._agent_invokers[name]
+            self._route_cache.clear()
             del self.capabilities[name]
             del self.message_queues[name]
-            print(f"🗑️  Agent unregistered: {name}")
+            logger.info("Agent unregistered: %s", name)
+    
+    @staticmethod
+    def _resolve_invoker(agent_instance: Any) -> Optional[Callable]:
+        """How execute_task calls an agent: its run() method, the agent itself, or not at all"""
+        
+        run = getattr(agent_instance, "run", None)
+        if run is not None:
+            return lambda task, context: run(task=task, context=context)
+        if callable(agent_instance):
+            return agent_instance
+        return None
     
     def find_capable_agents(self, required_capability: str) -> List[str]:
-        """Find agents that have a specific capability"""
+        """
+        Find agents that have a specific capability
+        An agent matches when one of its capability names equals the request
+        or contains it (case-insensitive); exact names come from the index
+        """
         
-        capable_agents = []
+        matched = set(self._cap_exact.get(required_capability, ()))
+        for cap_name, agent_names in self._cap_index.items():
+            if required_capability in cap_name:
+                matched |= agent_names
         
-        for agent_name, caps in self.capabilities.items():
-            for cap in caps:
-                if cap.name == required_capability or required_capability in cap.name.lower():
-                    capable_agents.append(agent_name)
-                    break
+        if not matched:
+            return []
         
-        return capable_agents
+        # Keep registration order
+        return [agent_name for agent_name in self.capabilities if agent_name in matched]
+    
+    def _unindex_capabilities(self, name: str):
+        """Drop an agent from the reverse capability index"""
+        
+        for cap in self.capabilities.get(name, []):
+            for index, key in ((self._cap_exact, cap.name), (self._cap_index, cap.name.lower())):
+                agent_names = index.get(key)
+                if agent_names is not None:
+                    agent_names.discard(name)
+                    if not agent_names:
+                        del index[key]
     
     def select_best_agent(self, task: str, context: Dict[str, Any] = None) -> Optional[str]:
         """
@@ -117,39 +237,78 @@ class AgentOrchestrator:
         - Context hints
         """
         
-        task_lower = task.lower()
-        context = context or {}
+        return self._select_agent(task, context or {})[0]
+    
+    def _select_agent(self, task: str, context: Dict[str, Any]) -> tuple:
+        """select_best_agent, also reporting whether the route may be cached"""
         
         # Check for explicit agent preference in context
         if "preferred_agent" in context:
             agent_name = context["preferred_agent"]
             if agent_name in self.agents:
-                return agent_name
+                return agent_name, False
         
-        # Keyword-based routing (fast path)
-        if any(word in task_lower for word in ['email', 'mail', 'send message']):
-            return "email" if "email" in self.agents else None
+        # Repeat tasks skip the keyword scan
+        route = self._route_cache.get(task)
+        if route is not None:
+            self._route_cache.move_to_end(task)
+            return route, False
         
-        if any(word in task_lower for word in ['web', 'browser', 'search', 'scrape', 'website']):
-            return "web" if "web" in self.agents else None
+        # Keyword-based routing (fast path)
+        for match in _ROUTER_RE.finditer(task):
+            name = match.lastgroup
+            if route is None or _ROUTE_PRIORITY[name] < _ROUTE_PRIORITY[route]:
+                route = name
+                if _ROUTE_PRIORITY[name] == 0:
+                    break
         
-        if any(word in task_lower for word in ['file', 'folder', 'directory', 'screenshot', 'system', 'terminal']):
-            return "system" if "system" in self.agents else None
+        if route is not None:
+            return (route, True) if route in self.agents else (None, False)
         
         # Fallback: use least loaded agent with general capability
-        if self.agents:
-            # Simple load balancing: use agent stats
-            agent_loads = {
-                name: stats["tasks_completed"] + stats["tasks_failed"]
-                for name, stats in self.agent_stats.items()
-                if name in self.agents
-            }
-            
-            if agent_loads:
-                return min(agent_loads, key=agent_loads.get)
-            
-            # Return first available agent
-            return list(self.agents.keys())[0]
+        return self._least_loaded_agent(), False
+    
+    def _cache_route(self, task: str, agent_name: str):
+        """Remember a keyword route once it has produced a successful task"""
+        
+        cache = self._route_cache
+        cache[task] = agent_name
+        if len(cache) > ROUTE_CACHE_SIZE:
+            cache.popitem(last=False)
+    
+    def _agent_load(self, name: str) -> int:
+        """Tasks handled so far by an agent"""
+        slot = self._stat_slots.get(name)
+        if slot is None:
+            return 0
+        return self._completed[slot] + self._failed[slot]
+    
+    def _push_load(self, name: str):
+        """Record an agent's current load in the load heap"""
+        
+        heap = self._load_heap
+        if len(heap) > 4 * len(self.agents) + 16:
+            # Too many stale entries: rebuild from the live agents
+            heap[:] = [
+                (self._agent_load(agent), next(self._load_counter), agent)
+                for agent in self.agents
+            ]
+            heapq.heapify(heap)
+            if name not in self.agents:
+                return
+        
+        heapq.heappush(heap, (self._agent_load(name), next(self._load_counter), name))
+    
+    def _least_loaded_agent(self) -> Optional[str]:
+        """Registered agent with the fewest handled tasks"""
+        
+        heap = self._load_heap
+        while heap:
+            load, _, name = heap[0]
+            if name in self.agents and load == self._agent_load(name):
+                return name
+            # Unregistered agent or outdated load
+            heapq.heappop(heap)
         
         return None
     
@@ -157,7 +316,8 @@ class AgentOrchestrator:
         self,
         task: str,
         context: Dict[str, Any] = None,
-        agent_name: Optional[str] = None
+        agent_name: Optional[str] = None,
+        in_thread: bool = False,
     ) -> Dict[str, Any]:
         """
         Execute a task using the best available agent
@@ -166,6 +326,8 @@ class AgentOrchestrator:
             task: Task description/command
             context: Additional context
             agent_name: Specific agent to use (optional)
+            in_thread: Call the (blocking) agent in a worker thread instead
+                of on the event loop
         
         Returns:
             Task result with metadata
@@ -174,8 +336,9 @@ class AgentOrchestrator:
         context = context or {}
         
         # Select agent if not specified
+        cacheable = False
         if not agent_name:
-            agent_name = self.select_best_agent(task, context)
+            agent_name, cacheable = self._select_agent(task, context)
         
         if not agent_name or agent_name not in self.agents:
             return {
@@ -184,26 +347,30 @@ class AgentOrchestrator:
                 "task": task,
             }
         
-        agent = self.agents[agent_name]
-        stats = self.agent_stats[agent_name]
+        invoker = self._agent_invokers[agent_name]
+        slot = self._stat_slot(agent_name)
         
-        print(f"🎯 Routing task to agent: {agent_name}")
+        logger.debug("Routing task to agent: %s", agent_name)
         
-        start_time = datetime.utcnow()
+        start_time = time.perf_counter()
         
         try:
             # Execute task
-            if hasattr(agent, 'run'):
-                result = agent.run(task=task, context=context)
-            elif callable(agent):
-                result = agent(task, context)
-            else:
+            if invoker is None:
                 result = {"success": False, "error": "Agent not callable"}
+            elif in_thread:
+                result = await asyncio.to_thread(invoker, task, context)
+            else:
+                result = invoker(task, context)
+            
+            response_time = time.perf_counter() - start_time
             
             # Update stats
-            stats["tasks_completed"] += 1
-            response_time = (datetime.utcnow() - start_time).total_seconds()
+            self._completed[slot] += 1
             self._update_avg_response_time(agent_name, response_time)
+            if cacheable:
+                self._cache_route(task, agent_name)
+            self._push_load(agent_name)
             
             return {
                 "success": True,
@@ -213,7 +380,9 @@ class AgentOrchestrator:
             }
             
         except Exception as e:
-            stats["tasks_failed"] += 1
+            self._failed[slot] += 1
+            self._route_cache.pop(task, None)
+            self._push_load(agent_name)
             return {
                 "success": False,
                 "agent": agent_name,
@@ -225,16 +394,19 @@ class AgentOrchestrator:
         """Send message from one agent to another"""
         
         if message.to_agent not in self.message_queues:
-            print(f"⚠️  Unknown agent: {message.to_agent}")
+            logger.warning("Unknown agent: %s", message.to_agent)
             return
         
-        await self.message_queues[message.to_agent].put(message)
+        self.message_queues[message.to_agent].put(message)
         self.message_history.append(message)
         
-        self.agent_stats[message.from_agent]["messages_sent"] += 1
-        self.agent_stats[message.to_agent]["messages_received"] += 1
+        self._sent[self._stat_slot(message.from_agent)] += 1
+        self._received[self._stat_slot(message.to_agent)] += 1
         
-        print(f"📨 Message sent: {message.from_agent} -> {message.to_agent} ({message.message_type})")
+        logger.debug(
+            "Message sent: %s -> %s (%s)",
+            message.from_agent, message.to_agent, message.message_type,
+        )
     
     async def receive_message(self, agent_name: str, timeout: float = 1.0) -> Optional[AgentMessage]:
         """Receive message for an agent (non-blocking with timeout)"""
@@ -273,7 +445,8 @@ class AgentOrchestrator:
         self,
         task: str,
         agents_needed: List[str],
-        coordination_strategy: str = "sequential"
+        coordination_strategy: str = "sequential",
+        dependencies: Optional[Dict[str, List[str]]] = None,
     ) -> Dict[str, Any]:
         """
         Coordinate multiple agents to complete a complex task
@@ -282,6 +455,8 @@ class AgentOrchestrator:
             task: Overall task description
             agents_needed: List of agent names to coordinate
             coordination_strategy: "sequential", "parallel", or "pipeline"
+            dependencies: For "sequential", agent_name -> agents whose results
+                it needs. Agents with no pending dependencies run concurrently.
         
         Returns:
             Combined results from all agents
@@ -289,7 +464,20 @@ class AgentOrchestrator:
         
         results = {}
         
-        if coordination_strategy == "sequential":
+        if coordination_strategy == "sequential" and dependencies is not None:
+            # Run dependency layers in order, fanning out within each layer
+            for layer in self._dependency_layers(agents_needed, dependencies):
+                contexts = []
+                for agent_name in layer:
+                    deps = [d for d in dependencies.get(agent_name, []) if d in results]
+                    context = {}
+                    if deps:
+                        context["dependency_results"] = {d: results[d] for d in deps}
+                        context["previous_result"] = results[deps[-1]]
+                    contexts.append(context)
+                results.update(await self._run_agents(task, layer, contexts))
+        
+        elif coordination_strategy == "sequential":
             # Execute agents one after another
             context = {}
             for agent_name in agents_needed:
@@ -299,21 +487,18 @@ class AgentOrchestrator:
                 context["previous_result"] = result
         
         elif coordination_strategy == "parallel":
-            # Execute all agents simultaneously
-            tasks = [
-                self.execute_task(task, {}, agent_name)
-                for agent_name in agents_needed
-            ]
-            agent_results = await asyncio.gather(*tasks)
-            results = dict(zip(agents_needed, agent_results))
+            # Execute all agents simultaneously, at most max_parallel_agents at a time
+            results = await self._run_agents(task, agents_needed, [{} for _ in agents_needed])
         
         elif coordination_strategy == "pipeline":
-            # Each agent processes output of previous agent
+            # Each agent processes output of previous agent, handed over
+            # in context["input"] as-is rather than round-tripped through JSON
             current_data = {"task": task}
             for agent_name in agents_needed:
+                stage_task = current_data.get("task", task) if isinstance(current_data, dict) else task
                 result = await self.execute_task(
-                    json.dumps(current_data),
-                    {"pipeline_mode": True},
+                    stage_task,
+                    {"pipeline_mode": True, "input": current_data},
                     agent_name
                 )
                 results[agent_name] = result
@@ -326,19 +511,100 @@ class AgentOrchestrator:
             "results": results,
         }
     
+    async def _run_agents(
+        self,
+        task: str,
+        agent_names: List[str],
+        contexts: List[Dict[str, Any]],
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Execute a task on several agents concurrently, bounded by the semaphore
+        Agents are blocking callables, so each runs in a worker thread
+        """
+        
+        async def run(agent_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+            async with self._agent_semaphore:
+                return await self.execute_task(task, context, agent_name, in_thread=True)
+        
+        agent_results = await asyncio.gather(
+            *(run(name, ctx) for name, ctx in zip(agent_names, contexts)),
+            return_exceptions=True,
+        )
+        
+        return {
+            name: (
+                {"success": False, "agent": name, "error": str(result), "task": task}
+                if isinstance(result, BaseException) else result
+            )
+            for name, result in zip(agent_names, agent_results)
+        }
+    
+    @staticmethod
+    def _dependency_layers(
+        agent_names: List[str],
+        dependencies: Dict[str, List[str]],
+    ) -> List[List[str]]:
+        """Group agents into layers that only depend on earlier layers"""
+        
+        pending = {
+            name: {d for d in dependencies.get(name, []) if d in agent_names and d != name}
+            for name in agent_names
+        }
+        layers = []
+        
+        while pending:
+            layer = [name for name, deps in pending.items() if not deps]
+            if not layer:
+                raise ValueError(f"Circular agent dependencies: {sorted(pending)}")
+            for name in layer:
+                del pending[name]
+            for deps in pending.values():
+                deps.difference_update(layer)
+            layers.append(layer)
+        
+        return layers
+    
     def _update_avg_response_time(self, agent_name: str, new_time: float):
         """Update average response time for an agent"""
         
-        stats = self.agent_stats[agent_name]
+        slot = self._stat_slot(agent_name)
         
-        if stats["tasks_completed"] == 1:
-            stats["avg_response_time"] = new_time
+        if self._completed[slot] == 1:
+            self._avg_rt[slot] = new_time
         else:
             # Exponential moving average
             alpha = 0.2
-            stats["avg_response_time"] = (
-                alpha * new_time + (1 - alpha) * stats["avg_response_time"]
-            )
+            self._avg_rt[slot] = alpha * new_time + (1 - alpha) * self._avg_rt[slot]
+    
+    def _stat_slot(self, agent_name: str) -> int:
+        """Counter slot for an agent, allocated on first use"""
+        
+        slot = self._stat_slots.get(agent_name)
+        if slot is None:
+            slot = self._stat_slots[agent_name] = len(self._completed)
+            for column in (self._completed, self._failed, self._sent, self._received):
+                column.append(0)
+            self._avg_rt.append(0.0)
+        return slot
+    
+    def _stats_for(self, agent_name: str) -> Dict[str, Any]:
+        """Counters for one agent as a dict, or {} if it has none yet"""
+        
+        slot = self._stat_slots.get(agent_name)
+        if slot is None:
+            return {}
+        return {
+            "tasks_completed": self._completed[slot],
+            "tasks_failed": self._failed[slot],
+            "messages_sent": self._sent[slot],
+            "messages_received": self._received[slot],
+            "avg_response_time": self._avg_rt[slot],
+        }
+    
+    @property
+    def agent_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Snapshot of every agent's counters, keyed by agent name"""
+        return {name: self._stats_for(name) for name in self._stat_slots}
     
     def get_agent_stats(self, agent_name: str = None) -> Dict[str, Any]:
         """Get statistics for agent(s)"""
@@ -348,7 +614,7 @@ class AgentOrchestrator:
                 "agent": agent_name,
                 "registered": agent_name in self.agents,
                 "capabilities": [cap.name for cap in self.capabilities.get(agent_name, [])],
-                "stats": self.agent_stats.get(agent_name, {}),
+                "stats": self._stats_for(agent_name),
             }
         
         return {
@@ -358,4 +624,7 @@ class AgentOrchestrator:
     
     def get_message_history(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get recent message history"""
-        return [msg.to_dict() for msg in self.message_history[-limit:]]
+        # Walk back from the tail so the cost is O(limit), not O(len(history))
+        recent = [msg.to_dict() for msg in itertools.islice(reversed(self.message_history), max(0, limit))]
+        recent.reverse()
+        return recent
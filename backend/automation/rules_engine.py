@@ -1,10 +1,21 @@
 """Automation Rules Engine - Define and evaluate complex automation rules"""
 
+import asyncio
+import bisect
+import inspect
+from collections import ChainMap
 from datetime import datetime, time
-from typing import Dict, Any, List, Optional, Callable
+from typing import Dict, Any, List, Mapping, Optional, Callable, Tuple
 from enum import Enum
+from functools import lru_cache
+from operator import eq, ne, gt, ge, lt, le
+import logging
 import re
 
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_ACTIONS = 8  # coroutine actions run at once by evaluate_all_rules_async
+
 
 class RuleType(str, Enum):
     TRIGGER = "trigger"  # Event-based triggers
@@ -27,6 +38,125 @@ class RuleOperator(str, Enum):
     NOT_IN = "not_in"
 
 
+@lru_cache(maxsize=4096)
+def _regex(pattern: str) -> "re.Pattern":
+    """Compiled pattern cache of our own, so rule regexes are not evicted by re's"""
+    return re.compile(pattern)
+
+
+def _matches(actual: Any, expected: Any) -> bool:
+    return bool(_regex(expected).search(str(actual)))
+
+
+Comparison = Callable[[Any, Any], bool]
+# (condition, field keys, comparison) as resolved by Rule.__init__
+ConditionCheck = Tuple[Dict[str, Any], Optional[Tuple[str, ...]], Optional[Comparison]]
+
+# Operator -> comparison(actual, expected), resolved once per condition
+OPS: Dict[str, Comparison] = {
+    "==": eq,
+    "!=": ne,
+    ">": gt,
+    ">=": ge,
+    "<": lt,
+    "<=": le,
+    "contains": lambda actual, expected: expected in str(actual),
+    "not_contains": lambda actual, expected: expected not in str(actual),
+    "matches": _matches,
+    "in": lambda actual, expected: actual in expected,
+    "not_in": lambda actual, expected: actual not in expected,
+}
+
+
+def _compile_operator(operator: Any, expected: Any) -> Optional[Comparison]:
+    """Look up a condition's comparison, precompiling the regex for MATCHES"""
+    
+    operator = getattr(operator, "value", operator)  # RuleOperator or plain string
+    
+    if operator == "matches" and isinstance(expected, str):
+        try:
+            pattern = _regex(expected)
+        except re.error:
+            return _matches  # raises again at evaluation and fails the condition
+        return lambda actual, _expected: bool(pattern.search(str(actual)))
+    
+    return OPS.get(operator)
+
+
+@lru_cache(maxsize=1024)
+def _path_keys(path: str) -> Tuple[str, ...]:
+    """Split a dotted field path into its keys"""
+    return tuple(path.split("."))
+
+
+# Source templates for operators that can be inlined by _compile_conditions;
+# {v} is the looked-up value and {e} the expected value
+_INLINE_OPS = {
+    "==": "{v} == {e}",
+    "!=": "{v} != {e}",
+    ">": "{v} > {e}",
+    ">=": "{v} >= {e}",
+    "<": "{v} < {e}",
+    "<=": "{v} <= {e}",
+    "contains": "{e} in str({v})",
+    "not_contains": "{e} not in str({v})",
+    "in": "{v} in {e}",
+    "not_in": "{v} not in {e}",
+}
+
+
+def _fails_on_missing(compare: Optional[Comparison], expected: Any) -> bool:
+    """Whether a condition is false when its field is absent (reads as None)"""
+    if compare is None:
+        return True
+    try:
+        return not compare(None, expected)
+    except Exception:
+        return True
+
+
+def _compile_conditions(
+    checks: List[ConditionCheck],
+    rule_id: str,
+) -> Optional[Callable[[Mapping[str, Any]], bool]]:
+    """
+    Generate one function that evaluates every condition of a rule
+    
+    Only rules whose conditions all read from the context with a known
+    operator are compiled; anything else returns None and is evaluated
+    condition by condition. Missing keys read as None, like _get_by_keys.
+    """
+    
+    lines = ["def _rule_fn(ctx, _values=_values, _ops=_ops):"]
+    values = []
+    ops = []
+    
+    for i, (condition, keys, compare) in enumerate(checks):
+        if condition.get("source", "context") != "context" or keys is None or compare is None:
+            return None
+        
+        lines.append(f"    v = ctx.get({keys[0]!r})")
+        for key in keys[1:]:
+            lines.append(f"    v = v.get({key!r}) if isinstance(v, dict) else None")
+        
+        operator = condition.get("operator")
+        template = _INLINE_OPS.get(getattr(operator, "value", operator))
+        values.append(condition.get("value"))
+        ops.append(compare)
+        if template is None:
+            test = f"_ops[{i}](v, _values[{i}])"
+        else:
+            test = template.format(v="v", e=f"_values[{i}]")
+        lines.append(f"    if not ({test}):")
+        lines.append("        return False")
+    
+    lines.append("    return True")
+    
+    namespace = {"_values": tuple(values), "_ops": tuple(ops)}
+    exec(compile("\n".join(lines), f"<rule {rule_id}>", "exec"), namespace)
+    return namespace["_rule_fn"]
+
+
 class Rule:
     """Represents an automation rule"""
     
@@ -50,6 +180,24 @@ class Rule:
         self.evaluation_count = 0
         self.trigger_count = 0
         self.last_triggered = None
+        # (condition, field keys, comparison); comparison is None for unknown operators
+        self._checks: List[ConditionCheck] = [
+            (
+                condition,
+                _path_keys(condition["field"]) if isinstance(condition.get("field"), str) else None,
+                _compile_operator(condition.get("operator"), condition.get("value")),
+            )
+            for condition in conditions
+        ]
+        self._compiled = _compile_conditions(self._checks, rule_id)
+        # Top-level context keys that must be present for the rule to pass
+        self._required_roots = frozenset(
+            keys[0]
+            for condition, keys, compare in self._checks
+            if keys is not None
+            and condition.get("source", "context") == "context"
+            and _fails_on_missing(compare, condition.get("value"))
+        )
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -85,25 +233,64 @@ class RulesEngine:
     4. "If workflow fails 3 times, pause and escalate"
     """
     
-    def __init__(self, action_executor: Optional[Callable] = None):
+    def __init__(
+        self,
+        action_executor: Optional[Callable] = None,
+        max_concurrent_actions: int = MAX_CONCURRENT_ACTIONS,
+    ):
         """
         Args:
-            action_executor: Function to execute actions when rules trigger
+            action_executor: Function or coroutine function to execute actions
+                when rules trigger
+            max_concurrent_actions: Cap on concurrently running coroutine actions
         """
         self.rules: Dict[str, Rule] = {}
-        self.action_executor = action_executor
+        self._by_priority: List[Rule] = []  # all rules, kept sorted by priority
+        self._field_index: Dict[str, set] = {}  # required context key -> rules
+        self._global_ready: Optional[set] = None  # rules satisfiable from self.context alone
+        self._global_ready_keys: frozenset = frozenset()  # self.context keys it was built for
+        self.action_executor = action_executor  # also sets self._async_executor
+        self.max_concurrent_actions = max_concurrent_actions
         self.context: Dict[str, Any] = {}
     
+    @property
+    def action_executor(self) -> Optional[Callable]:
+        return self._action_executor
+    
+    @action_executor.setter
+    def action_executor(self, executor: Optional[Callable]):
+        # Re-checked on every assignment so a swapped-in coroutine executor is awaited
+        self._action_executor = executor
+        self._async_executor = inspect.iscoroutinefunction(executor)
+    
     def add_rule(self, rule: Rule):
         """Add a new rule"""
+        if rule.rule_id in self.rules:
+            self._drop_rule(self.rules[rule.rule_id])
         self.rules[rule.rule_id] = rule
-        print(f"✅ Rule added: {rule.name} ({rule.rule_id})")
+        bisect.insort(self._by_priority, rule, key=lambda r: r.priority)
+        for root in rule._required_roots:
+            self._field_index.setdefault(root, set()).add(rule)
+        self._global_ready = None
+        logger.info("Rule added: %s (%s)", rule.name, rule.rule_id)
     
     def remove_rule(self, rule_id: str):
         """Remove a rule"""
         if rule_id in self.rules:
-            del self.rules[rule_id]
-            print(f"🗑️  Rule removed: {rule_id}")
+            self._drop_rule(self.rules.pop(rule_id))
+            logger.info("Rule removed: %s", rule_id)
+    
+    def _drop_rule(self, rule: Rule):
+        """Remove a rule from the priority list and field index"""
+        
+        self._by_priority.remove(rule)
+        for root in rule._required_roots:
+            rules = self._field_index.get(root)
+            if rules is not None:
+                rules.discard(rule)
+                if not rules:
+                    del self._field_index[root]
+        self._global_ready = None
     
     def enable_rule(self, rule_id: str):
         """Enable a rule"""
@@ -118,55 +305,175 @@ class RulesEngine:
     def update_context(self, context: Dict[str, Any]):
         """Update global context for rule evaluation"""
         self.context.update(context)
+        self._global_ready = None
     
-    def evaluate_all_rules(self, event_context: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    def _candidate_rules(self, event_context: Dict[str, Any]) -> set:
+        """
+        Rules whose required context keys are all present
+        
+        Any other rule has a condition on a missing key that cannot pass,
+        so it is skipped without being evaluated.
+        """
+        
+        # self.context is a public dict, so changes made without update_context
+        # are caught by comparing its key set
+        context = self.context
+        if self._global_ready is None or context.keys() != self._global_ready_keys:
+            self._global_ready = {
+                rule for rule in self.rules.values()
+                if all(root in context for root in rule._required_roots)
+            }
+            self._global_ready_keys = frozenset(context)
+        
+        if not event_context:
+            return self._global_ready
+        
+        extra = {
+            rule
+            for key in event_context
+            for rule in self._field_index.get(key, ())
+            if rule not in self._global_ready
+            and all(root in event_context or root in context for root in rule._required_roots)
+        }
+        return self._global_ready | extra if extra else self._global_ready
+    
+    def evaluate_all_rules(
+        self,
+        event_context: Dict[str, Any] = None,
+        stop_on_first: bool = False,
+    ) -> List[Dict[str, Any]]:
         """
         Evaluate all enabled rules against current context
         
         Args:
             event_context: Additional context for this evaluation
+            stop_on_first: Stop after the highest-priority rule that triggers
         
         Returns:
             List of triggered rules with their actions
         """
         
-        # Merge contexts
-        full_context = {**self.context, **(event_context or {})}
+        if not self._async_executor:
+            # A plain executor runs each rule's actions as soon as it triggers,
+            # before lower-priority rules are evaluated
+            on_trigger = self._execute_rule_actions if self.action_executor else None
+            return self._match_rules(event_context, stop_on_first, on_trigger)
         
-        triggered_rules = []
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError(
+                "evaluate_all_rules() cannot run coroutine actions inside a running "
+                "event loop; await evaluate_all_rules_async() instead"
+            )
         
-        # Get enabled rules sorted by priority
-        enabled_rules = [
-            rule for rule in self.rules.values()
-            if rule.enabled
+        # Coroutine actions run together once matching is done
+        triggered_rules = self._match_rules(event_context, stop_on_first)
+        if triggered_rules:
+            asyncio.run(self._execute_actions_async(triggered_rules))
+        return triggered_rules
+    
+    async def evaluate_all_rules_async(
+        self,
+        event_context: Dict[str, Any] = None,
+        stop_on_first: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Evaluate all enabled rules and run triggered actions concurrently
+        
+        A coroutine action_executor has all actions of all triggered rules
+        gathered after matching, at most max_concurrent_actions at a time; a
+        plain function executor runs each rule's actions as it triggers, as
+        evaluate_all_rules does.
+        """
+        
+        if not self._async_executor:
+            return self.evaluate_all_rules(event_context, stop_on_first)
+        
+        triggered_rules = self._match_rules(event_context, stop_on_first)
+        if triggered_rules:
+            await self._execute_actions_async(triggered_rules)
+        return triggered_rules
+    
+    def _execute_rule_actions(self, triggered: Dict[str, Any]):
+        """Run one triggered rule's actions in order through a plain function executor"""
+        
+        try:
+            for action in triggered["actions"]:
+                self.action_executor(action, triggered["context"])
+        except Exception as e:
+            logger.error("Error executing actions for rule %s: %s", triggered["rule_id"], e)
+    
+    async def _execute_actions_async(self, triggered_rules: List[Dict[str, Any]]):
+        """Run every triggered action through the coroutine executor concurrently"""
+        
+        semaphore = asyncio.Semaphore(self.max_concurrent_actions)
+        
+        async def run(action: Dict[str, Any], context: Dict[str, Any]):
+            async with semaphore:
+                return await self.action_executor(action, context)
+        
+        pending = [
+            (triggered["rule_id"], run(action, triggered["context"]))
+            for triggered in triggered_rules
+            for action in triggered["actions"]
         ]
-        enabled_rules.sort(key=lambda r: r.priority)
+        results = await asyncio.gather(*(coro for _, coro in pending), return_exceptions=True)
         
-        for rule in enabled_rules:
+        for (rule_id, _), result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.error("Error executing actions for rule %s: %s", rule_id, result)
+    
+    def _match_rules(
+        self,
+        event_context: Optional[Dict[str, Any]],
+        stop_on_first: bool,
+        on_trigger: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Evaluate candidate rules in priority order and update their counters
+        on_trigger, if given, is called with each triggered rule before the next is evaluated
+        """
+        
+        # Lazy view for evaluation; copied to a dict only once a rule triggers
+        full_context = ChainMap(event_context or {}, self.context)
+        triggered_context = None
+        candidates = self._candidate_rules(event_context)
+        
+        triggered_rules = []
+        
+        # Rules are kept sorted by priority as they are added
+        for rule in self._by_priority:
+            if not rule.enabled or rule not in candidates:
+                continue
+            
             rule.evaluation_count += 1
             
             if self.evaluate_rule(rule, full_context):
                 rule.trigger_count += 1
                 rule.last_triggered = datetime.utcnow()
                 
-                triggered_rules.append({
+                if triggered_context is None:
+                    triggered_context = dict(full_context)
+                
+                triggered = {
                     "rule_id": rule.rule_id,
                     "rule_name": rule.name,
                     "actions": rule.actions,
-                    "context": full_context,
-                })
+                    "context": triggered_context,
+                }
+                triggered_rules.append(triggered)
+                if on_trigger is not None:
+                    on_trigger(triggered)
                 
-                # Execute actions
-                if self.action_executor:
-                    try:
-                        for action in rule.actions:
-                            self.action_executor(action, full_context)
-                    except Exception as e:
-                        print(f"❌ Error executing actions for rule {rule.rule_id}: {e}")
+                if stop_on_first:
+                    break
         
         return triggered_rules
     
-    def evaluate_rule(self, rule: Rule, context: Dict[str, Any]) -> bool:
+    def evaluate_rule(self, rule: Rule, context: Mapping[str, Any]) -> bool:
         """
         Evaluate a single rule against context
         
@@ -177,15 +484,22 @@ class RulesEngine:
         if not rule.enabled:
             return False
         
+        if rule._compiled is not None:
+            try:
+                return rule._compiled(context)
+            except Exception as e:
+                logger.warning("Condition evaluation error: %s", e)
+                return False
+        
         # All conditions must be true (AND logic)
         # For OR logic, create multiple rules
-        for condition in rule.conditions:
-            if not self.evaluate_condition(condition, context):
+        for condition, keys, compare in rule._checks:
+            if not self._check_condition(condition, keys, compare, context):
                 return False
         
         return True
     
-    def evaluate_condition(self, condition: Dict[str, Any], context: Dict[str, Any]) -> bool:
+    def evaluate_condition(self, condition: Dict[str, Any], context: Mapping[str, Any]) -> bool:
         """
         Evaluate a single condition
         
@@ -198,15 +512,31 @@ class RulesEngine:
         }
         """
         
+        field = condition.get("field")
+        operator = condition.get("operator")
+        return self._check_condition(
+            condition,
+            _path_keys(field) if isinstance(field, str) else None,
+            OPS.get(getattr(operator, "value", operator)),
+            context,
+        )
+    
+    def _check_condition(
+        self,
+        condition: Dict[str, Any],
+        keys: Optional[Tuple[str, ...]],
+        compare: Optional[Comparison],
+        context: Mapping[str, Any],
+    ) -> bool:
+        """Evaluate a condition with already resolved field keys and comparison"""
+        
         try:
             field = condition.get("field")
-            operator = condition.get("operator")
-            expected_value = condition.get("value")
             source = condition.get("source", "context")
             
             # Get actual value from context
             if source == "context":
-                actual_value = self._get_nested_value(context, field)
+                actual_value = self._get_by_keys(context, keys)
             elif source == "metrics":
                 actual_value = self._get_metric_value(field)
             elif source == "time":
@@ -214,65 +544,42 @@ class RulesEngine:
             else:
                 actual_value = context.get(field)
             
-            # Evaluate operator
-            return self._evaluate_operator(actual_value, operator, expected_value)
+            if compare is None:
+                logger.warning("Unknown operator: %s", condition.get("operator"))
+                return False
+            
+            return compare(actual_value, condition.get("value"))
             
         except Exception as e:
-            print(f"⚠️  Condition evaluation error: {e}")
+            logger.warning("Condition evaluation error: %s", e)
             return False
     
     def _evaluate_operator(self, actual: Any, operator: str, expected: Any) -> bool:
         """Evaluate comparison operator"""
         
+        compare = OPS.get(getattr(operator, "value", operator))
+        if compare is None:
+            logger.warning("Unknown operator: %s", operator)
+            return False
+        
         try:
-            if operator == RuleOperator.EQUALS or operator == "==":
-                return actual == expected
-            
-            elif operator == RuleOperator.NOT_EQUALS or operator == "!=":
-                return actual != expected
-            
-            elif operator == RuleOperator.GREATER or operator == ">":
-                return actual > expected
-            
-            elif operator == RuleOperator.GREATER_EQUAL or operator == ">=":
-                return actual >= expected
-            
-            elif operator == RuleOperator.LESS or operator == "<":
-                return actual < expected
-            
-            elif operator == RuleOperator.LESS_EQUAL or operator == "<=":
-                return actual <= expected
-            
-            elif operator == RuleOperator.CONTAINS or operator == "contains":
-                return expected in str(actual)
-            
-            elif operator == RuleOperator.NOT_CONTAINS or operator == "not_contains":
-                return expected not in str(actual)
-            
-            elif operator == RuleOperator.MATCHES or operator == "matches":
-                return bool(re.search(expected, str(actual)))
-            
-            elif operator == RuleOperator.IN or operator == "in":
-                return actual in expected
-            
-            elif operator == RuleOperator.NOT_IN or operator == "not_in":
-                return actual not in expected
-            
-            else:
-                print(f"⚠️  Unknown operator: {operator}")
-                return False
-                
+            return compare(actual, expected)
         except Exception as e:
-            print(f"⚠️  Operator evaluation error: {e}")
+            logger.warning("Operator evaluation error: %s", e)
             return False
     
-    def _get_nested_value(self, data: Dict[str, Any], path: str) -> Any:
+    def _get_nested_value(self, data: Mapping[str, Any], path: str) -> Any:
         """Get value from nested dict using dot notation"""
+        return self._get_by_keys(data, _path_keys(path))
+    
+    @staticmethod
+    def _get_by_keys(data: Mapping[str, Any], keys: Tuple[str, ...]) -> Any:
+        """Get value from nested dict using pre-split keys"""
         
-        keys = path.split(".")
-        value = data
+        # The root may be any mapping (evaluate_all_rules passes a ChainMap)
+        value = data.get(keys[0])
         
-        for key in keys:
+        for key in keys[1:]:
             if isinstance(value, dict):
                 value = value.get(key)
             else:
@@ -1,12 +1,21 @@
 """Smart Task Scheduler - Schedule and queue tasks intelligently"""
 
 import asyncio
+import logging
+import time
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional, Callable
 from collections import deque
+from functools import lru_cache
+from operator import attrgetter
 import heapq
+import itertools
 from enum import Enum
 
+from .workflow_engine import start_task
+
+logger = logging.getLogger(__name__)
+
 
 class ScheduleType(str, Enum):
     ONCE = "once"
@@ -15,9 +24,89 @@ class ScheduleType(str, Enum):
     CONDITIONAL = "conditional"
 
 
+# Bitmasks with every value allowed for each cron field
+ALL_MINUTES = (1 << 60) - 1
+ALL_HOURS = (1 << 24) - 1
+ALL_DAYS = (1 << 7) - 1  # day_of_week, 0 = Sunday as in cron
+
+
+def _cron_mask(value: Any, high: int) -> int:
+    """
+    Parse a cron field into a bitmask with bit k set if value k is allowed
+    
+    Accepts an int or a string of comma-separated "*", "n", "a-b", "*/s"
+    and "a-b/s" parts, with values in 0..high (day_of_week also takes 7
+    for Sunday).
+    """
+    
+    if isinstance(value, int):
+        parts = [str(value)]
+    else:
+        parts = str(value).split(",")
+    
+    limit = 7 if high == 6 else high
+    mask = 0
+    for part in parts:
+        span, _, step = part.strip().partition("/")
+        if span == "*":
+            start, end = 0, high
+        elif "-" in span:
+            start, end = (int(v) for v in span.split("-", 1))
+        else:
+            start = end = int(span)
+        
+        if not 0 <= start <= end <= limit:
+            raise ValueError(f"Invalid cron field: {value!r}")
+        
+        for k in range(start, end + 1, int(step) if step else 1):
+            mask |= 1 << k
+    
+    if mask >> 7 and high == 6:
+        mask = (mask & ALL_DAYS) | 1  # 7 is Sunday
+    
+    return mask
+
+
+@lru_cache(maxsize=4096)
+def _cron_walk(minute_mask: int, hour_mask: int, dow_mask: int, from_minute: datetime) -> datetime:
+    """First minute after a minute-aligned time allowed by all three masks"""
+    
+    t = from_minute + timedelta(minutes=1)
+    for _ in range(8 * 24):  # any satisfiable mask matches within a week
+        if (dow_mask >> ((t.weekday() + 1) % 7)) & 1 and (hour_mask >> t.hour) & 1:
+            later = minute_mask >> t.minute
+            if later:
+                return t.replace(minute=t.minute + (later & -later).bit_length() - 1)
+        t = t.replace(minute=0) + timedelta(hours=1)
+    
+    raise ValueError("Cron schedule never matches")
+
+
+@lru_cache(maxsize=4096)
+def _cron_next_run(minute: int, hour: Optional[int], from_minute: datetime) -> datetime:
+    """Next daily (hour set) or hourly run after a minute-aligned time"""
+    
+    if hour is None:
+        next_run = from_minute.replace(minute=minute)
+        step = timedelta(hours=1)
+    else:
+        next_run = from_minute.replace(hour=hour, minute=minute)
+        step = timedelta(days=1)
+    
+    if next_run <= from_minute:
+        next_run += step
+    return next_run
+
+
 class ScheduledTask:
     """Represents a scheduled task"""
     
+    __slots__ = (
+        "task_id", "workflow_id", "schedule_type", "schedule_config", "enabled",
+        "max_runs", "run_count", "last_run", "next_run", "last_run_ts", "next_run_ts",
+        "priority", "_minute_mask", "_hour_mask", "_dow_mask", "_cron_minute", "_cron_hour",
+    )
+    
     def __init__(
         self,
         task_id: str,
@@ -36,78 +125,112 @@ class ScheduledTask:
         self.run_count = 0
         self.last_run = None
         self.next_run = None
+        # time.monotonic() deadlines; the datetimes above are for display
+        self.last_run_ts: Optional[float] = None
+        self.next_run_ts: Optional[float] = None
         self.priority = schedule_config.get("priority", 5)
         
-    def should_run(self) -> bool:
-        """Check if task should run now"""
+        if schedule_type == ScheduleType.CRON:
+            self._compile_cron()
+    
+    def _compile_cron(self):
+        """Parse the cron config into field bitmasks once"""
+        
+        config = self.schedule_config
+        self._minute_mask = _cron_mask(config.get("minute", "*"), 59)
+        self._hour_mask = _cron_mask(config.get("hour", "*"), 23)
+        self._dow_mask = _cron_mask(config.get("day_of_week", "*"), 6)
+        
+        # Single minute (and at most a single hour) on any day: hourly or
+        # daily pattern with a closed-form next run
+        self._cron_minute: Optional[int] = None
+        self._cron_hour: Optional[int] = None
+        single_minute = self._minute_mask & (self._minute_mask - 1) == 0
+        single_hour = self._hour_mask & (self._hour_mask - 1) == 0
+        if self._dow_mask == ALL_DAYS and single_minute and (single_hour or self._hour_mask == ALL_HOURS):
+            self._cron_minute = self._minute_mask.bit_length() - 1
+            if single_hour:
+                self._cron_hour = self._hour_mask.bit_length() - 1
+        
+    def should_run(self, now: Optional[float] = None) -> bool:
+        """Check if task should run at monotonic time `now` (default: current)"""
         if not self.enabled:
             return False
         
         if self.max_runs and self.run_count >= self.max_runs:
             return False
         
-        if not self.next_run:
+        if self.next_run_ts is None:
             return True
         
-        return datetime.utcnow() >= self.next_run
+        return (time.monotonic() if now is None else now) >= self.next_run_ts
+    
+    def mark_run(self, now: Optional[float] = None):
+        """Record the start of a run"""
+        self.run_count += 1
+        self.last_run = datetime.utcnow()
+        self.last_run_ts = time.monotonic() if now is None else now
     
-    def calculate_next_run(self):
-        """Calculate next run time"""
-        now = datetime.utcnow()
+    def calculate_next_run(self, now: Optional[float] = None):
+        """Calculate next run time from monotonic time `now` (default: current)"""
+        if now is None:
+            now = time.monotonic()
+        wall = datetime.utcnow()
         
         if self.schedule_type == ScheduleType.ONCE:
             # One-time execution
             if self.run_count == 0:
                 scheduled_time = self.schedule_config.get("datetime")
                 if scheduled_time:
-                    self.next_run = datetime.fromisoformat(scheduled_time)
+                    self._set_next_run(datetime.fromisoformat(scheduled_time), now, wall)
                 else:
-                    self.next_run = now
+                    self.next_run, self.next_run_ts = wall, now
             else:
-                self.next_run = None  # Already ran
+                self.next_run, self.next_run_ts = None, None  # Already ran
                 
         elif self.schedule_type == ScheduleType.INTERVAL:
             # Interval-based (e.g., every 5 minutes)
             interval_seconds = self.schedule_config.get("interval_seconds", 300)
-            if self.last_run:
+            if self.last_run_ts is not None:
                 self.next_run = self.last_run + timedelta(seconds=interval_seconds)
+                self.next_run_ts = self.last_run_ts + interval_seconds
             else:
-                self.next_run = now + timedelta(seconds=interval_seconds)
+                self.next_run = wall + timedelta(seconds=interval_seconds)
+                self.next_run_ts = now + interval_seconds
                 
         elif self.schedule_type == ScheduleType.CRON:
             # Cron-like scheduling (simplified)
             # Format: {"minute": 0, "hour": 12, "day_of_week": "*"}
             # This is simplified - use APScheduler for full cron support
-            self.next_run = self._calculate_cron_next_run(now)
+            self._set_next_run(self._calculate_cron_next_run(wall), now, wall)
             
         elif self.schedule_type == ScheduleType.CONDITIONAL:
             # Run when condition is met
             # Checked externally by rules engine
-            self.next_run = now
+            self.next_run, self.next_run_ts = wall, now
+    
+    def _set_next_run(self, next_run: datetime, now: float, wall: datetime):
+        """Set next_run and its monotonic deadline from a wall-clock time"""
+        self.next_run = next_run
+        self.next_run_ts = now + (next_run - wall).total_seconds()
     
     def _calculate_cron_next_run(self, from_time: datetime) -> datetime:
         """Calculate next run based on cron-like config"""
         # Simplified cron calculation
         # In production, use APScheduler's CronTrigger
         
-        minute = self.schedule_config.get("minute", "*")
-        hour = self.schedule_config.get("hour", "*")
+        if self._minute_mask == ALL_MINUTES and self._hour_mask == ALL_HOURS and self._dow_mask == ALL_DAYS:
+            # Every minute
+            return from_time + timedelta(minutes=1)
         
-        next_run = from_time + timedelta(minutes=1)
+        # Results depend only on the minute, so tasks sharing a config share the cache
+        from_minute = from_time.replace(second=0, microsecond=0)
         
-        # Simple logic for hourly/daily patterns
-        if hour != "*" and minute != "*":
-            # Daily at specific time
-            next_run = from_time.replace(hour=int(hour), minute=int(minute), second=0)
-            if next_run <= from_time:
-                next_run += timedelta(days=1)
-        elif minute != "*":
-            # Hourly at specific minute
-            next_run = from_time.replace(minute=int(minute), second=0)
-            if next_run <= from_time:
-                next_run += timedelta(hours=1)
+        if self._cron_minute is not None:
+            # Daily at a specific time, or hourly at a specific minute
+            return _cron_next_run(self._cron_minute, self._cron_hour, from_minute)
         
-        return next_run
+        return _cron_walk(self._minute_mask, self._hour_mask, self._dow_mask, from_minute)
 
 
 class TaskQueue:
@@ -123,10 +246,19 @@ class TaskQueue:
             priority = task.priority
         
         # Lower number = higher priority
-        # Counter ensures FIFO for same priority
+        # Counter ensures FIFO for same priority, and since it is unique the
+        # heap never falls through to comparing ScheduledTask objects
         heapq.heappush(self._queue, (priority, self._counter, task))
         self._counter += 1
     
+    def extend(self, tasks: List[ScheduledTask]):
+        """Add many tasks at their own priority with a single heapify"""
+        queue = self._queue
+        for task in tasks:
+            queue.append((task.priority, self._counter, task))
+            self._counter += 1
+        heapq.heapify(queue)
+    
     def pop(self) -> Optional[ScheduledTask]:
         """Get highest priority task"""
         if self._queue:
@@ -168,7 +300,8 @@ class TaskScheduler:
         Args:
             workflow_executor: Function to execute workflows
             max_concurrent: Max concurrent workflow executions
-            check_interval: Seconds between schedule checks
+            check_interval: Seconds between runs of conditional tasks, and the
+                back-off after a scheduler error; due tasks are woken on time
         """
         self.workflow_executor = workflow_executor
         self.max_concurrent = max_concurrent
@@ -178,6 +311,13 @@ class TaskScheduler:
         self.task_queue = TaskQueue()
         self.running_tasks: Dict[str, asyncio.Task] = {}
         
+        # Timer heap of (next_run timestamp, seq, task_id); _armed holds the live
+        # timestamp per task so superseded heap entries are skipped lazily
+        self._timer_heap: List[tuple] = []
+        self._timer_seq = itertools.count()
+        self._armed: Dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+        
         self._running = False
         self._scheduler_task = None
     
@@ -187,8 +327,8 @@ class TaskScheduler:
             return
         
         self._running = True
-        self._scheduler_task = asyncio.create_task(self._scheduler_loop())
-        print("✅ Task Scheduler started")
+        self._scheduler_task = start_task(self._scheduler_loop())
+        logger.info("Task Scheduler started")
     
     async def stop(self):
         """Stop the scheduler"""
@@ -199,17 +339,61 @@ class TaskScheduler:
                 await self._scheduler_task
             except asyncio.CancelledError:
                 pass
-        print("🛑 Task Scheduler stopped")
+        logger.info("Task Scheduler stopped")
+    
+    def _arm(self, task: ScheduledTask):
+        """Put a task on the timer heap for its next_run and wake the loop"""
+        
+        if not task.enabled or task.next_run_ts is None:
+            self._armed.pop(task.task_id, None)
+            return
+        
+        when = task.next_run_ts
+        if task.schedule_type == ScheduleType.CONDITIONAL and task.last_run_ts is not None:
+            # Conditional tasks are always due; keep them to one run per check_interval
+            when = max(when, task.last_run_ts + self.check_interval)
+        
+        self._armed[task.task_id] = when
+        heap = self._timer_heap
+        if len(heap) > 2 * len(self._armed) + 16:
+            # Mostly superseded entries: rebuild from the live deadlines
+            heap[:] = [(ts, next(self._timer_seq), task_id) for task_id, ts in self._armed.items()]
+            heapq.heapify(heap)
+        else:
+            heapq.heappush(heap, (when, next(self._timer_seq), task.task_id))
+        self._wakeup.set()
     
     async def _scheduler_loop(self):
-        """Main scheduler loop"""
+        """Main scheduler loop: sleep until the earliest next_run or a wakeup"""
+        heap = self._timer_heap
         while self._running:
             try:
-                # Check for tasks ready to run
-                for task in list(self.scheduled_tasks.values()):
-                    if task.should_run():
-                        self.task_queue.push(task)
-                        task.calculate_next_run()
+                self._wakeup.clear()
+                
+                # Collect tasks whose time has come
+                now = time.monotonic()
+                ready = []
+                while heap and heap[0][0] <= now:
+                    when, _, task_id = heapq.heappop(heap)
+                    if self._armed.get(task_id) != when:
+                        continue  # removed, disabled or rescheduled since
+                    del self._armed[task_id]
+                    
+                    task = self.scheduled_tasks.get(task_id)
+                    if task is not None and task.should_run(now):
+                        ready.append(task)
+                
+                if ready:
+                    # One stable sort keeps priority order, FIFO within a priority
+                    ready.sort(key=attrgetter("priority"))
+                    if self.task_queue.size() == 0:
+                        # Nothing backlogged: dispatch straight from the batch
+                        free = max(0, self.max_concurrent - len(self.running_tasks))
+                        for scheduled_task in ready[:free]:
+                            await self._execute_scheduled_task(scheduled_task)
+                        ready = ready[free:]
+                    if ready:
+                        self.task_queue.extend(ready)
                 
                 # Execute queued tasks (respecting concurrency limit)
                 while (
@@ -220,11 +404,15 @@ class TaskScheduler:
                     if scheduled_task:
                         await self._execute_scheduled_task(scheduled_task)
                 
-                # Wait before next check
-                await asyncio.sleep(self.check_interval)
+                # Sleep until the next deadline; add/enable/completion set _wakeup
+                timeout = max(0.0, heap[0][0] - time.monotonic()) if heap else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
                 
             except Exception as e:
-                print(f"⚠️  Scheduler error: {e}")
+                logger.warning("Scheduler error: %s", e)
                 await asyncio.sleep(self.check_interval)
     
     async def _execute_scheduled_task(self, scheduled_task: ScheduledTask):
@@ -232,69 +420,78 @@ class TaskScheduler:
         
         async def run():
             try:
-                scheduled_task.run_count += 1
-                scheduled_task.last_run = datetime.utcnow()
+                scheduled_task.mark_run()
                 
                 # Execute the workflow
                 await self.workflow_executor(scheduled_task.workflow_id)
                 
             except Exception as e:
-                print(f"❌ Scheduled task {scheduled_task.task_id} failed: {e}")
+                logger.error("Scheduled task %s failed: %s", scheduled_task.task_id, e)
             finally:
                 # Remove from running tasks
-                if scheduled_task.task_id in self.running_tasks:
-                    del self.running_tasks[scheduled_task.task_id]
+                self.running_tasks.pop(scheduled_task.task_id, None)
                 
                 # Reschedule if needed
                 if scheduled_task.enabled:
                     scheduled_task.calculate_next_run()
+                    self._arm(scheduled_task)
+                self._wakeup.set()  # a concurrency slot is free
         
-        # Start task execution
-        task = asyncio.create_task(run())
-        self.running_tasks[scheduled_task.task_id] = task
+        # Start task execution; an eager task may already be finished here
+        task = start_task(run())
+        if not task.done():
+            self.running_tasks[scheduled_task.task_id] = task
     
     def add_scheduled_task(self, scheduled_task: ScheduledTask):
         """Add a new scheduled task"""
         scheduled_task.calculate_next_run()
         self.scheduled_tasks[scheduled_task.task_id] = scheduled_task
-        print(f"✅ Scheduled task added: {scheduled_task.task_id} (next run: {scheduled_task.next_run})")
+        self._arm(scheduled_task)
+        logger.info(
+            "Scheduled task added: %s (next run: %s)",
+            scheduled_task.task_id, scheduled_task.next_run,
+        )
     
     def remove_scheduled_task(self, task_id: str):
         """Remove a scheduled task"""
-        if task_id in self.scheduled_tasks:
-            del self.scheduled_tasks[task_id]
-            print(f"🗑️  Scheduled task removed: {task_id}")
+        if self.scheduled_tasks.pop(task_id, None) is not None:
+            self._armed.pop(task_id, None)
+            logger.info("Scheduled task removed: %s", task_id)
     
     def enable_task(self, task_id: str):
         """Enable a scheduled task"""
-        if task_id in self.scheduled_tasks:
-            self.scheduled_tasks[task_id].enabled = True
-            self.scheduled_tasks[task_id].calculate_next_run()
+        task = self.scheduled_tasks.get(task_id)
+        if task is not None:
+            task.enabled = True
+            task.calculate_next_run()
+            self._arm(task)
     
     def disable_task(self, task_id: str):
         """Disable a scheduled task"""
-        if task_id in self.scheduled_tasks:
-            self.scheduled_tasks[task_id].enabled = False
+        task = self.scheduled_tasks.get(task_id)
+        if task is not None:
+            task.enabled = False
+            self._armed.pop(task_id, None)
     
     def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
         """Get scheduled task status"""
-        if task_id in self.scheduled_tasks:
-            task = self.scheduled_tasks[task_id]
-            return {
-                "task_id": task.task_id,
-                "workflow_id": task.workflow_id,
-                "schedule_type": task.schedule_type.value,
-                "enabled": task.enabled,
-                "run_count": task.run_count,
-                "last_run": task.last_run.isoformat() if task.last_run else None,
-                "next_run": task.next_run.isoformat() if task.next_run else None,
-                "is_running": task.task_id in self.running_tasks,
-            }
-        return None
+        task = self.scheduled_tasks.get(task_id)
+        if task is None:
+            return None
+        return self._task_status(task)
+    
+    def _task_status(self, task: ScheduledTask) -> Dict[str, Any]:
+        return {
+            "task_id": task.task_id,
+            "workflow_id": task.workflow_id,
+            "schedule_type": task.schedule_type.value,
+            "enabled": task.enabled,
+            "run_count": task.run_count,
+            "last_run": task.last_run.isoformat() if task.last_run else None,
+            "next_run": task.next_run.isoformat() if task.next_run else None,
+            "is_running": task.task_id in self.running_tasks,
+        }
     
     def list_scheduled_tasks(self) -> List[Dict[str, Any]]:
         """List all scheduled tasks"""
-        return [
-            self.get_task_status(task_id)
-            for task_id in self.scheduled_tasks.keys()
-        ]
+        return [self._task_status(task) for task in self.scheduled_tasks.values()]
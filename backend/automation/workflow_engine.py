@@ -1,10 +1,36 @@
 """Advanced Workflow Engine - Chain and execute multiple tasks automatically"""
 
+import ast
 import json
 import asyncio
+import logging
+import operator
+from contextvars import ContextVar
+from collections import OrderedDict, deque
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Callable
 from enum import Enum
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Update callback of the engine running the current workflow; set per
+# execute_workflow call and inherited by the step tasks it starts
+_update_cb: ContextVar[Optional[Callable]] = ContextVar("_update_cb", default=None)
+
+# Finished workflows kept for status queries before the oldest are dropped
+MAX_WORKFLOW_HISTORY = 256
+
+# Python 3.12+: eager tasks run synchronously until their first real await,
+# so steps that finish without suspending skip the event-loop round-trip
+_eager_task_factory = getattr(asyncio, "eager_task_factory", None)
+
+
+def start_task(coro) -> asyncio.Task:
+    """Create a task on the running loop, eagerly where supported"""
+    if _eager_task_factory is None:
+        return asyncio.create_task(coro)
+    return _eager_task_factory(asyncio.get_running_loop(), coro)
 
 
 class WorkflowStatus(str, Enum):
@@ -16,6 +42,11 @@ class WorkflowStatus(str, Enum):
     CANCELLED = "cancelled"
 
 
+_TERMINAL_STATUSES = frozenset(
+    (WorkflowStatus.SUCCESS, WorkflowStatus.FAILED, WorkflowStatus.CANCELLED)
+)
+
+
 class TaskStatus(str, Enum):
     PENDING = "pending"
     RUNNING = "running"
@@ -24,9 +55,113 @@ class TaskStatus(str, Enum):
     SKIPPED = "skipped"
 
 
+# Step condition DSL: step fields compared with constants or searched with
+# .contains(), e.g. "fetch.status == 'success' and not fetch.result.contains('error')"
+_STEP_FIELDS = frozenset(("status", "result", "error", "attempts"))
+
+_COMPARE_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+
+def _contains(value: Any, needle: Any) -> bool:
+    if value is None:
+        return False
+    return needle in (value if isinstance(value, str) else str(value))
+
+
+def _compile_node(node: ast.AST) -> Callable[["Workflow"], Any]:
+    """Turn one whitelisted AST node into a closure over the workflow"""
+    
+    if isinstance(node, ast.Constant):
+        value = node.value
+        return lambda workflow: value
+    
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+        step_id, field = node.value.id, node.attr
+        if field not in _STEP_FIELDS:
+            raise ValueError(f"Unknown step field: {step_id}.{field}")
+        if field == "status":
+            return lambda workflow: workflow.steps[step_id].status.value
+        get_field = operator.attrgetter(field)
+        return lambda workflow: get_field(workflow.steps[step_id])
+    
+    if (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "contains"
+        and len(node.args) == 1
+        and not node.keywords
+    ):
+        target = _compile_node(node.func.value)
+        needle = _compile_node(node.args[0])
+        return lambda workflow: _contains(target(workflow), needle(workflow))
+    
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_node(value) for value in node.values]
+        if isinstance(node.op, ast.And):
+            return lambda workflow: all(part(workflow) for part in parts)
+        return lambda workflow: any(part(workflow) for part in parts)
+    
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        operand = _compile_node(node.operand)
+        return lambda workflow: not operand(workflow)
+    
+    if isinstance(node, ast.Compare):
+        left = _compile_node(node.left)
+        try:
+            pairs = [
+                (_COMPARE_OPS[type(op)], _compile_node(comparator))
+                for op, comparator in zip(node.ops, node.comparators)
+            ]
+        except KeyError as e:
+            raise ValueError(f"Unsupported comparison: {e.args[0].__name__}") from None
+        
+        def compare(workflow) -> bool:
+            a = left(workflow)
+            for op, right in pairs:
+                b = right(workflow)
+                if not op(a, b):
+                    return False
+                a = b
+            return True
+        
+        return compare
+    
+    if isinstance(node, (ast.Tuple, ast.List)):
+        items = [_compile_node(item) for item in node.elts]
+        return lambda workflow: [item(workflow) for item in items]
+    
+    raise ValueError(f"Unsupported condition syntax: {type(node).__name__}")
+
+
+@lru_cache(maxsize=1024)
+def _compile_condition(expr: str) -> Callable[["Workflow"], bool]:
+    """Parse a step condition once into a predicate; raises ValueError if invalid"""
+    try:
+        tree = ast.parse(expr.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid condition {expr!r}: {e.msg}") from None
+    
+    predicate = _compile_node(tree.body)
+    return lambda workflow: bool(predicate(workflow))
+
+
 class WorkflowStep:
     """Represents a single step in a workflow"""
     
+    __slots__ = (
+        "step_id", "command", "agent", "depends_on", "retry_count", "_backoff_schedule",
+        "timeout", "condition", "_condition_fn", "status", "result", "error", "attempts",
+    )
+    
     def __init__(
         self,
         step_id: str,
@@ -42,8 +177,17 @@ class WorkflowStep:
         self.agent = agent
         self.depends_on = depends_on or []
         self.retry_count = retry_count
+        # Seconds to wait after each failed attempt but the last: 1, 2, 4, ...
+        self._backoff_schedule = tuple(1 << i for i in range(max(0, retry_count - 1)))
         self.timeout = timeout
         self.condition = condition
+        self._condition_fn = None
+        if condition:
+            try:
+                self._condition_fn = _compile_condition(condition)
+            except ValueError as e:
+                # Unparseable conditions never block a step, as before
+                logger.warning("Ignoring condition of step %s: %s", step_id, e)
         self.status = TaskStatus.PENDING
         self.result = None
         self.error = None
@@ -53,6 +197,12 @@ class WorkflowStep:
 class Workflow:
     """Represents a complete workflow with multiple steps"""
     
+    __slots__ = (
+        "workflow_id", "name", "description", "steps", "parallel", "status",
+        "started_at", "finished_at", "results", "_levels", "_dependents",
+        "_indegree", "_status_cache", "_update_base",
+    )
+    
     def __init__(
         self,
         workflow_id: str,
@@ -70,16 +220,36 @@ class Workflow:
         self.started_at = None
         self.finished_at = None
         self.results = {}
+        self._levels: Optional[Dict[int, List["WorkflowStep"]]] = None
+        self._build_graph()
+        self._build_status_cache()
+        # Static head of every workflow_update payload
+        self._update_base = {"type": "workflow_update", "workflow_id": workflow_id}
+    
+    def _build_graph(self):
+        """Index dependents and dependency counts once for scheduling"""
         
-    def to_dict(self) -> Dict[str, Any]:
-        return {
+        # step_id -> steps that depend on it, in step order
+        self._dependents: Dict[str, List[str]] = {step_id: [] for step_id in self.steps}
+        self._indegree: Dict[str, int] = {}
+        
+        for step_id, step in self.steps.items():
+            self._indegree[step_id] = len(step.depends_on)
+            for dep in step.depends_on:
+                if dep in self._dependents:
+                    self._dependents[dep].append(step_id)
+        
+    def _build_status_cache(self):
+        """Pre-build the to_dict() payload; the engine patches it as steps change"""
+        
+        self._status_cache: Dict[str, Any] = {
             "workflow_id": self.workflow_id,
             "name": self.name,
             "description": self.description,
             "status": self.status.value,
             "parallel": self.parallel,
-            "started_at": self.started_at.isoformat() if self.started_at else None,
-            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "started_at": None,
+            "finished_at": None,
             "steps": {
                 step_id: {
                     "command": step.command,
@@ -92,6 +262,67 @@ class Workflow:
                 for step_id, step in self.steps.items()
             },
         }
+    
+    def _sync_step(self, step: WorkflowStep):
+        """Copy a step's mutable fields into the status cache"""
+        entry = self._status_cache["steps"][step.step_id]
+        entry["status"] = step.status.value
+        entry["result"] = step.result
+        entry["error"] = step.error
+        entry["attempts"] = step.attempts
+    
+    def _sync_times(self):
+        """Copy started_at/finished_at into the status cache"""
+        cache = self._status_cache
+        cache["started_at"] = self.started_at.isoformat() if self.started_at else None
+        cache["finished_at"] = self.finished_at.isoformat() if self.finished_at else None
+    
+    def dependency_levels(self) -> Dict[int, List[WorkflowStep]]:
+        """Steps grouped by dependency depth, in level order; computed once"""
+        
+        if self._levels is None:
+            # Kahn's algorithm; a step's level is one past its deepest dependency.
+            # Steps on a cycle or with a missing dependency never reach
+            # indegree 0 and are left out
+            indegree = dict(self._indegree)
+            depth = {step_id: 0 for step_id, count in indegree.items() if count == 0}
+            queue = deque(depth)
+            
+            while queue:
+                step_id = queue.popleft()
+                for dependent in self._dependents[step_id]:
+                    indegree[dependent] -= 1
+                    if indegree[dependent] == 0:
+                        depth[dependent] = max(depth[dep] for dep in self.steps[dependent].depends_on) + 1
+                        queue.append(dependent)
+            
+            levels = {}
+            for step_id, step in self.steps.items():
+                if step_id in depth:
+                    levels.setdefault(depth[step_id], []).append(step)
+            
+            self._levels = dict(sorted(levels.items()))
+        
+        return self._levels
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Snapshot of the status cache; later step updates don't change it"""
+        snapshot = dict(self._status_cache)
+        snapshot["status"] = self.status.value
+        snapshot["steps"] = {step_id: dict(entry) for step_id, entry in snapshot["steps"].items()}
+        return snapshot
+
+
+def _safe_wrap(callback: Callable) -> Callable:
+    """Wrap an update callback so its errors are logged, never raised"""
+    
+    def safe_callback(update: Dict[str, Any]):
+        try:
+            callback(update)
+        except Exception:
+            logger.debug("Workflow update callback failed", exc_info=True)
+    
+    return safe_callback
 
 
 class WorkflowEngine:
@@ -107,23 +338,43 @@ class WorkflowEngine:
     - Workflow pause/resume/cancel
     """
     
-    def __init__(self, agent_executor: Callable, update_callback: Optional[Callable] = None):
+    def __init__(
+        self,
+        agent_executor: Callable,
+        update_callback: Optional[Callable] = None,
+        max_history: int = MAX_WORKFLOW_HISTORY,
+    ):
         """
         Args:
             agent_executor: Function to execute commands (e.g., your /command endpoint logic)
             update_callback: Optional callback for status updates
+            max_history: Workflows to retain before finished ones are evicted (oldest first)
         """
         self.agent_executor = agent_executor
         self.update_callback = update_callback
-        self.active_workflows: Dict[str, Workflow] = {}
+        self.max_history = max_history
+        # Least recently used first; only finished workflows are evicted
+        self.active_workflows: "OrderedDict[str, Workflow]" = OrderedDict()
         
+    @property
+    def update_callback(self) -> Optional[Callable]:
+        return self._update_callback
+    
+    @update_callback.setter
+    def update_callback(self, callback: Optional[Callable]):
+        # Wrapped once here so _send_update can call it without a try block
+        self._update_callback = _safe_wrap(callback) if callback is not None else None
+    
     async def execute_workflow(self, workflow: Workflow) -> Dict[str, Any]:
         """Execute a complete workflow"""
         
         workflow.status = WorkflowStatus.RUNNING
         workflow.started_at = datetime.utcnow()
+        workflow._sync_times()
         self.active_workflows[workflow.workflow_id] = workflow
+        self.active_workflows.move_to_end(workflow.workflow_id)
         
+        token = _update_cb.set(self._update_callback)
         self._send_update(workflow, "Workflow started")
         
         try:
@@ -142,69 +393,84 @@ class WorkflowEngine:
                 
         except Exception as e:
             workflow.status = WorkflowStatus.FAILED
-            self._send_update(workflow, f"Workflow failed: {str(e)}")
+            self._send_update(workflow, "Workflow failed: %s", e)
         finally:
             workflow.finished_at = datetime.utcnow()
+            workflow._sync_times()
+            self._evict_if_needed()
+            _update_cb.reset(token)
             
         return workflow.to_dict()
     
     async def _execute_sequential(self, workflow: Workflow):
         """Execute steps sequentially respecting dependencies"""
         
-        completed = set()
+        # Kahn's algorithm in rounds: a round runs every step whose
+        # dependencies all finished (in any state) in earlier rounds
+        indegree = dict(workflow._indegree)
+        order = {step_id: i for i, step_id in enumerate(workflow.steps)}
+        ready = [step_id for step_id, count in indegree.items() if count == 0]
         
-        while len(completed) < len(workflow.steps):
-            # Find steps ready to execute
-            ready_steps = [
-                step for step in workflow.steps.values()
-                if step.status == TaskStatus.PENDING
-                and all(dep in completed for dep in step.depends_on)
-            ]
-            
-            if not ready_steps:
-                # Check if we're stuck (circular dependency or all failed)
-                remaining = [s for s in workflow.steps.values() if s.status == TaskStatus.PENDING]
-                if remaining:
-                    for step in remaining:
-                        step.status = TaskStatus.SKIPPED
-                        step.error = "Dependencies not met"
-                        completed.add(step.step_id)
-                break
+        while ready:
+            next_ready = []
             
             # Execute ready steps
-            for step in ready_steps:
-                if self._check_condition(step, workflow):
-                    await self._execute_step(workflow, step)
-                else:
-                    step.status = TaskStatus.SKIPPED
-                    step.error = "Condition not met"
+            for step_id in ready:
+                step = workflow.steps[step_id]
+                if step.status == TaskStatus.PENDING:
+                    if self._check_condition(step, workflow):
+                        await self._execute_step(workflow, step)
+                    else:
+                        step.status = TaskStatus.SKIPPED
+                        step.error = "Condition not met"
+                        workflow._sync_step(step)
                 
-                completed.add(step.step_id)
+                for dependent in workflow._dependents[step_id]:
+                    indegree[dependent] -= 1
+                    if indegree[dependent] == 0:
+                        next_ready.append(dependent)
+            
+            ready = sorted(next_ready, key=order.__getitem__)
+        
+        # Anything left is stuck (circular or missing dependency)
+        for step_id, count in indegree.items():
+            step = workflow.steps[step_id]
+            if count > 0 and step.status == TaskStatus.PENDING:
+                step.status = TaskStatus.SKIPPED
+                step.error = "Dependencies not met"
+                workflow._sync_step(step)
     
     async def _execute_parallel(self, workflow: Workflow):
         """Execute independent steps in parallel"""
         
-        # Group steps by dependency level
-        levels = self._compute_dependency_levels(workflow)
-        
-        for level, steps in sorted(levels.items()):
+        # Group steps by dependency level (cached on the workflow)
+        for steps in workflow.dependency_levels().values():
             # Execute all steps at this level in parallel
             tasks = []
             for step in steps:
                 if self._check_condition(step, workflow):
-                    tasks.append(self._execute_step(workflow, step))
+                    tasks.append(start_task(self._execute_step(workflow, step)))
                 else:
                     step.status = TaskStatus.SKIPPED
                     step.error = "Condition not met"
+                    workflow._sync_step(step)
             
             if tasks:
                 await asyncio.gather(*tasks, return_exceptions=True)
+        
+        # Steps left out of the levels are stuck (circular or missing dependency)
+        for step in workflow.steps.values():
+            if step.status == TaskStatus.PENDING:
+                step.status = TaskStatus.SKIPPED
+                step.error = "Dependencies not met"
+                workflow._sync_step(step)
     
     async def _execute_step(self, workflow: Workflow, step: WorkflowStep):
         """Execute a single workflow step with retry logic"""
         
         step.status = TaskStatus.RUNNING
-        self._send_update(workflow, f"Executing step: {step.step_id}")
+        workflow._sync_step(step)
+        self._send_update(workflow, "Executing step: %s", step.step_id)
         
         for attempt in range(step.retry_count):
             step.attempts = attempt + 1
@@ -220,100 +486,103 @@ class WorkflowEngine:
                 step.result = result
                 step.status = TaskStatus.SUCCESS
                 workflow.results[step.step_id] = result
+                workflow._sync_step(step)
                 
-                self._send_update(workflow, f"Step {step.step_id} completed")
+                self._send_update(workflow, "Step %s completed", step.step_id)
                 return
                 
             except Exception as e:
                 step.error = str(e)
+                workflow._sync_step(step)
                 
                 if attempt < step.retry_count - 1:
                     # Wait before retry (exponential backoff)
-                    wait_time = 2 ** attempt
+                    wait_time = step._backoff_schedule[attempt]
                     self._send_update(
                         workflow,
-                        f"Step {step.step_id} failed, retrying in {wait_time}s (attempt {attempt + 1}/{step.retry_count})"
+                        "Step %s failed, retrying in %ss (attempt %d/%d)",
+                        step.step_id, wait_time, attempt + 1, step.retry_count,
                     )
                     await asyncio.sleep(wait_time)
                 else:
                     step.status = TaskStatus.FAILED
-                    self._send_update(workflow, f"Step {step.step_id} failed after {step.retry_count} attempts")
+                    workflow._sync_step(step)
+                    self._send_update(
+                        workflow, "Step %s failed after %d attempts", step.step_id, step.retry_count
+                    )
     
     def _check_condition(self, step: WorkflowStep, workflow: Workflow) -> bool:
         """Check if step condition is met"""
-        if not step.condition:
+        condition_fn = step._condition_fn
+        if condition_fn is None:
             return True
         
         try:
-            # Simple condition evaluation based on previous results
             # Format: "step_id.status == 'success'" or "step_id.result.contains('text')"
-            # This is a simplified version - can be extended
-            return True  # Default to true for now
-        except:
+            return condition_fn(workflow)
+        except (KeyError, TypeError) as e:
+            # Unknown step id or incomparable values
+            logger.warning("Condition of step %s could not be evaluated: %r", step.step_id, e)
             return True
     
     def _compute_dependency_levels(self, workflow: Workflow) -> Dict[int, List[WorkflowStep]]:
         """Compute execution levels based on dependencies"""
-        levels = {}
-        computed = {}
-        
-        def get_level(step_id: str) -> int:
-            if step_id in computed:
-                return computed[step_id]
-            
-            step = workflow.steps[step_id]
-            if not step.depends_on:
-                level = 0
-            else:
-                level = max(get_level(dep) for dep in step.depends_on) + 1
-            
-            computed[step_id] = level
-            return level
-        
-        for step_id, step in workflow.steps.items():
-            level = get_level(step_id)
-            if level not in levels:
-                levels[level] = []
-            levels[level].append(step)
-        
-        return levels
+        return workflow.dependency_levels()
     
-    def _send_update(self, workflow: Workflow, message: str):
-        """Send status update"""
-        if self.update_callback:
-            try:
-                self.update_callback({
-                    "type": "workflow_update",
-                    "workflow_id": workflow.workflow_id,
-                    "status": workflow.status.value,
-                    "message": message,
-                    "timestamp": datetime.utcnow().isoformat(),
-                })
-            except:
-                pass
+    def _send_update(self, workflow: Workflow, message: str, *args):
+        """Send status update; ``message`` is %-formatted only if someone listens"""
+        callback = _update_cb.get()
+        if callback is None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[%s] " + message, workflow.workflow_id, *args)
+            return
+        
+        callback({
+            **workflow._update_base,
+            "status": workflow.status.value,
+            "message": message % args if args else message,
+            "timestamp": datetime.utcnow().isoformat(),
+        })
     
     def pause_workflow(self, workflow_id: str):
         """Pause a running workflow"""
-        if workflow_id in self.active_workflows:
-            self.active_workflows[workflow_id].status = WorkflowStatus.PAUSED
+        workflow = self.active_workflows.get(workflow_id)
+        if workflow is not None:
+            workflow.status = WorkflowStatus.PAUSED
     
     def resume_workflow(self, workflow_id: str):
         """Resume a paused workflow"""
-        if workflow_id in self.active_workflows:
-            workflow = self.active_workflows[workflow_id]
-            if workflow.status == WorkflowStatus.PAUSED:
-                workflow.status = WorkflowStatus.RUNNING
+        workflow = self.active_workflows.get(workflow_id)
+        if workflow is not None and workflow.status == WorkflowStatus.PAUSED:
+            workflow.status = WorkflowStatus.RUNNING
     
     def cancel_workflow(self, workflow_id: str):
         """Cancel a running workflow"""
-        if workflow_id in self.active_workflows:
-            self.active_workflows[workflow_id].status = WorkflowStatus.CANCELLED
+        workflow = self.active_workflows.get(workflow_id)
+        if workflow is not None:
+            workflow.status = WorkflowStatus.CANCELLED
     
     def get_workflow_status(self, workflow_id: str) -> Optional[Dict[str, Any]]:
         """Get current workflow status"""
-        if workflow_id in self.active_workflows:
-            return self.active_workflows[workflow_id].to_dict()
-        return None
+        workflow = self.active_workflows.get(workflow_id)
+        if workflow is None:
+            return None
+        self.active_workflows.move_to_end(workflow_id)
+        return workflow.to_dict()
+    
+    def _evict_if_needed(self):
+        """Drop least recently used finished workflows beyond max_history"""
+        excess = len(self.active_workflows) - self.max_history
+        if excess <= 0:
+            return
+        
+        finished = [
+            workflow_id
+            for workflow_id, workflow in self.active_workflows.items()
+            if workflow.status in _TERMINAL_STATUSES
+        ]
+        for workflow_id in finished[:excess]:
+            del self.active_workflows[workflow_id]
     
     @staticmethod
     def from_config(config: Dict[str, Any]) -> Workflow:
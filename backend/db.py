@@ -4,18 +4,42 @@ Uses SQLite file `sigma.db` in the backend folder for development.
 Switch to PostgreSQL by changing DATABASE_URL.
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, StaticPool
 import os
 
 # Default: SQLite file in backend directory
 DATABASE_URL = os.getenv("SIGMA_DATABASE_URL", "sqlite:///./sigma.db")
 
+# Connections are checked back in and reused across requests
+DB_POOL_SIZE = int(os.getenv("SIGMA_DB_POOL_SIZE", "10"))
+
+if DATABASE_URL in ("sqlite://", "sqlite:///:memory:"):
+    # An in-memory database only exists on its one connection
+    pool_args = {"poolclass": StaticPool}
+else:
+    pool_args = {"poolclass": QueuePool, "pool_size": DB_POOL_SIZE}
+
 engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+    **pool_args,
 )
 
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL journal + NORMAL sync: one fsync per checkpoint instead of per commit"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA cache_size=-64000")  # 64 MB
+        cursor.close()
+
+# A plain session per request: FastAPI may run a sync dependency's setup and
+# teardown on different threads, so thread-scoped sessions can't be used here
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
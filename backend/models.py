@@ -27,7 +27,7 @@ class AutomationTask(Base):
     __tablename__ = "automation_tasks"
 
     id = Column(Integer, primary_key=True, index=True)
-    workflow_id = Column(Integer, ForeignKey("automation_workflows.id"), nullable=False)
+    workflow_id = Column(Integer, ForeignKey("automation_workflows.id"), nullable=False, index=True)
 
     # high-level state, e.g. pending/running/success/failed
     status = Column(String(50), default="pending", index=True)
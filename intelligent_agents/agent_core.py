@@ -7,15 +7,121 @@ Supports multiple AI models with hot-swapping
 import os
 import json
 import time
-from typing import Dict, Any, List, Optional
-from dataclasses import dataclass, asdict
+import asyncio
+import random
+import logging
+import itertools
+from collections import deque
+from typing import Callable, Dict, Any, List, Optional, TypedDict
+from dataclasses import dataclass, field
 from enum import Enum
 from dotenv import load_dotenv
 
+# Fast JSON for prompt building and reply parsing (falls back to stdlib json)
+try:
+    import orjson
+
+    def dumps_pretty(obj: Any) -> str:
+        return orjson.dumps(
+            obj, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        ).decode()
+
+    loads = orjson.loads
+except ImportError:
+    def dumps_pretty(obj: Any) -> str:
+        return json.dumps(obj, indent=2, default=str)
+
+    loads = json.loads
+
+# Backoff for transient step failures (falls back to a plain sleep loop)
+try:
+    from tenacity import Retrying, stop_after_attempt, wait_exponential_jitter, retry_if_exception
+except ImportError:
+    Retrying = None
+
 load_dotenv()
 
 # Import model manager
 from .model_manager import model_manager
+from .semantic_cache import semantic_cache
+
+# Agent updates are logged here; the backend attaches the console handler
+logger = logging.getLogger('sigma.agent')
+
+ERROR_MEMORY_LIMIT = 16
+CONVERSATION_HISTORY_LIMIT = 32
+
+# Exponential backoff (seconds) between retries of transient step failures
+RETRY_INITIAL_WAIT = 0.5
+RETRY_MAX_WAIT = 8
+
+# Seconds a cached think() plan stays valid; plans depend on live system
+# state, so only quick repeats of the same task reuse one
+THINK_CACHE_TTL = 60
+
+# HTTP statuses that signal quota exhaustion or a server-side hiccup
+TRANSIENT_HTTP_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Prompts keep their static instructions first and the per-call details last,
+# so providers that cache prompt prefixes can reuse the shared head
+THINK_INSTRUCTIONS = """Think deeply about the task below. Provide a detailed execution plan in JSON format:
+{
+    "understanding": "What the user wants to achieve",
+    "approach": "Your strategy to accomplish this",
+    "steps": [
+        {"step": 1, "action": "description", "tool": "tool_name", "expected_outcome": "what should happen", "depends_on": []},
+        ...
+    ],
+    "potential_issues": ["issue1", "issue2"],
+    "fallback_plan": "What to do if primary approach fails"
+}
+
+Be specific and actionable. Consider edge cases and error scenarios.
+In "depends_on" list the numbers of earlier steps a step needs; leave it empty for steps that can run independently.
+"""
+
+SELF_HEAL_PREAMBLE = """You are an intelligent agent recovering from a failed step.
+Analyze the error below and provide:
+1. Root cause analysis
+2. Alternative approach to achieve the same goal
+3. Specific fix or workaround
+
+Respond in JSON:
+{
+    "root_cause": "why this happened",
+    "alternative_approach": "different way to do it",
+    "new_step": {"step": 1, "action": "...", "tool": "...", "expected_outcome": "..."},
+    "confidence": 0.0-1.0
+}
+"""
+
+# Reply schemas for JSON-mode generation (Gemini enforces them via response_schema)
+class PlanStepSchema(TypedDict):
+    step: int
+    action: str
+    tool: str
+    expected_outcome: str
+    depends_on: List[int]
+
+class PlanSchema(TypedDict):
+    understanding: str
+    approach: str
+    steps: List[PlanStepSchema]
+    potential_issues: List[str]
+    fallback_plan: str
+
+class RecoverySchema(TypedDict):
+    root_cause: str
+    alternative_approach: str
+    new_step: PlanStepSchema
+    confidence: float
+
+def json_config(schema: Optional[type] = None) -> Dict[str, Any]:
+    """generation_config asking the model for a raw JSON reply, shaped by `schema` where supported"""
+    config = {"response_mime_type": "application/json"}
+    if schema is not None:
+        config["response_schema"] = schema
+    return config
 
 class AgentStatus(Enum):
     IDLE = "idle"
@@ -25,7 +131,7 @@ class AgentStatus(Enum):
     ERROR = "error"
     RETRYING = "retrying"
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AgentUpdate:
     """Real-time update from agent to UI"""
     agent_name: str
@@ -34,15 +140,100 @@ class AgentUpdate:
     thinking_process: Optional[str] = None
     action_taken: Optional[str] = None
     progress: Optional[int] = None  # 0-100
-    timestamp: float = time.time()
+    timestamp: float = field(default_factory=time.time)
     
     def to_dict(self):
+        # Built field-by-field: asdict() deep-copies every value per update
         return {
-            **asdict(self),
+            'agent_name': self.agent_name,
             'status': self.status.value,
+            'message': self.message,
+            'thinking_process': self.thinking_process,
+            'action_taken': self.action_taken,
+            'progress': self.progress,
             'timestamp': self.timestamp
         }
 
+def extract_json(text: str) -> str:
+    """Body of the first ```json (or plain ```) fence in an LLM reply, else the reply"""
+    _, fence, rest = text.partition("```json")
+    if not fence:
+        _, fence, rest = text.partition("```")
+        if not fence:
+            return text.strip()
+    return rest.partition("```")[0].strip()
+
+def stream_text(model, prompt: str, on_text: Optional[Callable[[str], bool]] = None, **kwargs) -> str:
+    """
+    Generate a reply chunk by chunk via generate_content(prompt, stream=True, **kwargs)
+    on_text(text_so_far) sees the reply as it grows; returning True stops reading early
+    """
+    text = ""
+    stream = model.generate_content(prompt, stream=True, **kwargs)
+    try:
+        for chunk in stream:
+            try:
+                text += chunk.text
+            except ValueError:
+                continue  # Gemini chunks without text parts (e.g. the final one)
+            if on_text is not None and on_text(text):
+                break
+    finally:
+        close = getattr(stream, 'close', None)
+        if close is not None:
+            close()
+    return text
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    True for timeouts, connection drops and retryable HTTP errors (e.g. a Gmail
+    HttpError 429/503), also when wrapped by another exception via "raise ... from"
+    """
+    while error is not None:
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        resp = getattr(error, 'resp', None)  # googleapiclient HttpError
+        status = (
+            getattr(resp, 'status', None)
+            or getattr(getattr(error, 'response', None), 'status_code', None)  # httpx HTTPStatusError
+            or getattr(error, 'status_code', None)
+        )
+        if status is not None:
+            try:
+                if int(status) in TRANSIENT_HTTP_STATUSES:
+                    return True
+            except (TypeError, ValueError):
+                pass
+        error = error.__cause__
+    return False
+
+def _plan_levels(steps: List[Dict[str, Any]]) -> List[List[int]]:
+    """
+    Group plan steps (as 0-based positions in `steps`) into levels that can run concurrently
+    Steps without "depends_on" information anywhere in the plan run one by one
+    """
+    if not any('depends_on' in step for step in steps):
+        return [[pos] for pos in range(len(steps))]
+    
+    numbers = {step.get('step', idx): idx for idx, step in enumerate(steps, 1)}
+    level_of = {}
+    for idx, step in enumerate(steps, 1):
+        deps = [numbers[dep] for dep in step.get('depends_on') or [] if numbers.get(dep, idx) < idx]
+        # Only earlier steps count, so plans can't form cycles
+        level_of[idx] = max((level_of[dep] + 1 for dep in deps), default=0)
+    
+    levels = [[] for _ in range(max(level_of.values(), default=-1) + 1)]
+    for idx in level_of:
+        levels[level_of[idx]].append(idx - 1)
+    return levels
+
+class StepTimeoutError(Exception):
+    """A step's deadline passed before another attempt could start"""
+
+def _check_deadline(deadline: Optional[float]):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise StepTimeoutError("Step timed out")
+
 class IntelligentAgent:
     """
     Base class for intelligent agents that can:
@@ -53,24 +244,53 @@ class IntelligentAgent:
     - Provide real-time updates
     """
     
+    # Reply schema for think(); subclasses extend it when they accept a direct_result
+    PLAN_SCHEMA = PlanSchema
+    # Extra think() instructions for agents that can finish a single-tool task
+    # straight from the plan's "direct_result" (see _fuse_direct_result)
+    DIRECT_RESULT_PROMPT: Optional[str] = None
+    
     def __init__(self, name: str, capabilities: List[str], update_callback=None):
         self.name = name
         self.capabilities = capabilities
         self.update_callback = update_callback
         
-        # Store reference to model manager (don't cache models!)
+        # Store reference to model manager; resolved model clients are reused
+        # only while model_manager.version is unchanged (hot-swaps bump it)
         self.model_manager = model_manager
+        self._thinking_model = (-1, None)  # (model_manager.version, client)
+        self._execution_model = (-1, None)
         
-        self.conversation_history = []
-        self.error_memory = []  # Learn from past failures
+        # Bounded: long-running agents only ever look at the recent entries
+        self.conversation_history = deque(maxlen=CONVERSATION_HISTORY_LIMIT)
+        self.error_memory = deque(maxlen=ERROR_MEMORY_LIMIT)  # Learn from past failures
+        
+        # think() prompt with the static head (identity, capabilities, output
+        # schema) filled in once; only the task details vary per call
+        self._capabilities_str = ', '.join(capabilities)
+        think_preamble = f"You are {name}, an intelligent AI agent with these capabilities:\n{self._capabilities_str}\n\n{THINK_INSTRUCTIONS}{self.DIRECT_RESULT_PROMPT or ''}"
+        self._think_prompt_template = (
+            think_preamble.replace('{', '{{').replace('}', '}}')
+            + "\nTask: {task}\n{context_str}\n{error_context}"
+        )
     
     def _get_thinking_model(self):
-        """Get current thinking model dynamically"""
-        return self.model_manager.get_thinking_model()
+        """Get current thinking model, re-resolved after a model_manager change"""
+        version, model = self._thinking_model
+        if version != self.model_manager.version:
+            version = self.model_manager.version
+            model = self.model_manager.get_thinking_model()
+            self._thinking_model = (version, model)
+        return model
     
     def _get_execution_model(self):
-        """Get current execution model dynamically"""
-        return self.model_manager.get_execution_model()
+        """Get current execution model, re-resolved after a model_manager change"""
+        version, model = self._execution_model
+        if version != self.model_manager.version:
+            version = self.model_manager.version
+            model = self.model_manager.get_execution_model()
+            self._execution_model = (version, model)
+        return model
         
     def _send_update(self, status: AgentStatus, message: str, **kwargs):
         """Send real-time update to UI"""
@@ -84,7 +304,7 @@ class IntelligentAgent:
         if self.update_callback:
             self.update_callback(update)
         
-        print(f"[{self.name}] {status.value.upper()}: {message}")
+        logger.info("[%s] %s: %s", self.name, status.value.upper(), message)
         return update
     
     def think(self, task: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
@@ -101,44 +321,34 @@ class IntelligentAgent:
         # Build context-aware prompt
         context_str = ""
         if context:
-            context_str = f"\nContext: {json.dumps(context, indent=2)}"
+            context_str = f"\nContext: {dumps_pretty(context)}"
         
         error_context = ""
         if self.error_memory:
-            error_context = f"\nPrevious failures to avoid:\n{json.dumps(self.error_memory[-3:], indent=2)}"
+            error_context = f"\nPrevious failures to avoid:\n{dumps_pretty(list(itertools.islice(self.error_memory, max(0, len(self.error_memory) - 3), None)))}"
         
-        prompt = f"""You are {self.name}, an intelligent AI agent with these capabilities:
-{', '.join(self.capabilities)}
-
-Task: {task}
-{context_str}
-{error_context}
-
-Think deeply about this task. Provide a detailed execution plan in JSON format:
-{{
-    "understanding": "What the user wants to achieve",
-    "approach": "Your strategy to accomplish this",
-    "steps": [
-        {{"step": 1, "action": "description", "tool": "tool_name", "expected_outcome": "what should happen"}},
-        ...
-    ],
-    "potential_issues": ["issue1", "issue2"],
-    "fallback_plan": "What to do if primary approach fails"
-}}
-
-Be specific and actionable. Consider edge cases and error scenarios."""
+        prompt = self._think_prompt_template.format(task=task, context_str=context_str, error_context=error_context)
 
+        # Plans get executed (and may carry a finished email), so only an exact
+        # repeat of the task, context and recent failures reuses one
+        cache_namespace = f"{self.name}.think"
+        cache_key = f"{task}\n{context_str}\n{error_context}"
         try:
-            response = self._get_thinking_model().generate_content(prompt)
-            thinking_text = response.text
-            
-            # Extract JSON from response (handle markdown code blocks)
-            if "```json" in thinking_text:
-                thinking_text = thinking_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in thinking_text:
-                thinking_text = thinking_text.split("```")[1].split("```")[0].strip()
+            thinking_text = semantic_cache.get(cache_namespace, cache_key)
+            cached = thinking_text is not None
+            if not cached:
+                thinking_text = stream_text(
+                    self._get_thinking_model(), prompt, self._plan_progress(),
+                    generation_config=json_config(self.PLAN_SCHEMA)
+                )
             
-            plan = json.loads(thinking_text)
+            # JSON mode replies are bare; providers without it may still fence the JSON
+            thinking_text = extract_json(thinking_text)
+            plan = loads(thinking_text)
+            # A direct_result carries output to send (e.g. an email body); never replay it
+            if not cached and not plan.get('direct_result'):
+                semantic_cache.put(cache_namespace, cache_key, thinking_text, ttl=THINK_CACHE_TTL)
+            plan = self._fuse_direct_result(plan, task)
             
             self._send_update(
                 AgentStatus.THINKING,
@@ -164,6 +374,43 @@ Be specific and actionable. Consider edge cases and error scenarios."""
                 "fallback_plan": "Retry with different approach"
             }
     
+    def _fuse_direct_result(self, plan: Dict[str, Any], task: str) -> Dict[str, Any]:
+        """
+        Turn a plan that answered the task itself ("direct_result", no steps) into a
+        single "direct_result" step, so execute_step can act on the payload without
+        a second LLM call
+        """
+        direct_result = plan.get('direct_result')
+        if self.DIRECT_RESULT_PROMPT is None or not direct_result or plan.get('steps'):
+            return plan
+        
+        plan['steps'] = [{
+            "step": 1,
+            "action": task,
+            "tool": "direct_result",
+            "payload": direct_result,
+            "expected_outcome": "Task completed"
+        }]
+        return plan
+    
+    def _plan_progress(self) -> Callable[[str], bool]:
+        """stream_text() hook that reports each plan step as the model starts writing it"""
+        seen = 0
+        
+        def on_text(text: str) -> bool:
+            nonlocal seen
+            drafted = text.count('"step"')
+            if drafted > seen:
+                seen = drafted
+                self._send_update(
+                    AgentStatus.THINKING,
+                    f"Drafting step {drafted} of the plan...",
+                    progress=min(5 + 2 * drafted, 19)
+                )
+            return False
+        
+        return on_text
+    
     def execute_step(self, step: Dict[str, Any], context: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         Execute a single step with error handling
@@ -189,34 +436,17 @@ Be specific and actionable. Consider edge cases and error scenarios."""
             "timestamp": time.time()
         })
         
-        prompt = f"""An error occurred while executing this step:
-Step: {json.dumps(step, indent=2)}
+        prompt = f"""{SELF_HEAL_PREAMBLE}
+An error occurred while executing this step:
+Step: {dumps_pretty(step)}
 Error: {str(error)}
-Context: {json.dumps(context, indent=2)}
-
-As an intelligent agent, analyze this error and provide:
-1. Root cause analysis
-2. Alternative approach to achieve the same goal
-3. Specific fix or workaround
-
-Respond in JSON:
-{{
-    "root_cause": "why this happened",
-    "alternative_approach": "different way to do it",
-    "new_step": {{"step": 1, "action": "...", "tool": "...", "expected_outcome": "..."}},
-    "confidence": 0.0-1.0
-}}"""
+Context: {dumps_pretty(context)}"""
 
         try:
-            response = self._get_execution_model().generate_content(prompt)
-            recovery_text = response.text
-            
-            if "```json" in recovery_text:
-                recovery_text = recovery_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in recovery_text:
-                recovery_text = recovery_text.split("```")[1].split("```")[0].strip()
-            
-            recovery_plan = json.loads(recovery_text)
+            response = self._get_execution_model().generate_content(
+                prompt, generation_config=json_config(RecoverySchema)
+            )
+            recovery_plan = loads(extract_json(response.text))
             
             self._send_update(
                 AgentStatus.RETRYING,
@@ -269,27 +499,7 @@ Respond in JSON:
                     progress=step_progress
                 )
                 
-                retry_count = 0
-                step_result = None
-                
-                while retry_count < max_retries:
-                    try:
-                        step_result = self.execute_step(step, context or {})
-                        results.append(step_result)
-                        break  # Success!
-                        
-                    except Exception as e:
-                        retry_count += 1
-                        if retry_count >= max_retries:
-                            raise  # Give up after max retries
-                        
-                        # Try self-healing
-                        try:
-                            step_result = self.self_heal(e, step, context or {})
-                            results.append(step_result)
-                            break  # Self-healing worked!
-                        except:
-                            continue  # Try again
+                results.append(self._execute_with_recovery(step, context or {}, max_retries))
             
             # Step 3: Success!
             self._send_update(
@@ -319,3 +529,159 @@ Respond in JSON:
                 "error": str(e),
                 "agent": self.name
             }
+    
+    def _execute_with_recovery(
+        self,
+        step: Dict[str, Any],
+        context: Dict[str, Any],
+        max_retries: int,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run one step, raising after max_retries attempts
+        - Transient errors (timeouts, quota, 5xx) are retried as-is with exponential backoff
+        - Other errors go through self_heal between attempts
+        - No new attempt starts once time.monotonic() passes `deadline`
+        """
+        retry_count = 0
+        
+        while True:
+            try:
+                return self._execute_with_backoff(step, context, max_retries, deadline)
+                
+            except Exception as e:
+                retry_count += 1
+                # A rewritten step would hit the same outage, so transient
+                # errors that outlasted the backoff are not worth an LLM call
+                if retry_count >= max_retries or is_transient_error(e):
+                    raise  # Give up after max retries
+                
+                # Try self-healing
+                _check_deadline(deadline)
+                try:
+                    return self.self_heal(e, step, context)
+                except Exception as heal_error:
+                    logger.warning("[%s] Self-heal attempt %d failed: %s", self.name, retry_count, heal_error)
+                    continue  # Try again
+    
+    def _execute_with_backoff(
+        self,
+        step: Dict[str, Any],
+        context: Dict[str, Any],
+        max_attempts: int,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """execute_step(), retrying transient errors with jittered exponential backoff"""
+        if Retrying is not None:
+            for attempt in Retrying(
+                stop=stop_after_attempt(max_attempts),
+                wait=wait_exponential_jitter(initial=RETRY_INITIAL_WAIT, max=RETRY_MAX_WAIT),
+                retry=retry_if_exception(is_transient_error),
+                reraise=True,
+            ):
+                with attempt:
+                    _check_deadline(deadline)
+                    return self.execute_step(step, context)
+        
+        for attempt in range(max(1, max_attempts)):
+            _check_deadline(deadline)
+            try:
+                return self.execute_step(step, context)
+            except Exception as e:
+                if attempt + 1 >= max_attempts or not is_transient_error(e):
+                    raise
+                time.sleep(min(RETRY_INITIAL_WAIT * 2 ** attempt + random.uniform(0, 1), RETRY_MAX_WAIT))
+    
+    async def arun(
+        self,
+        task: str,
+        context: Dict[str, Any] = None,
+        max_retries: int = 3,
+        step_timeout: float = 30,
+    ) -> Dict[str, Any]:
+        """
+        Async variant of run(): independent plan steps execute concurrently
+        Steps run in worker threads; each level waits for the one before it
+        results[i] belongs to plan['steps'][i], whatever order the levels ran in;
+        a failed step fails the task once the rest of its level has finished
+        
+        step_timeout fails the task but cannot interrupt a call already running in
+        the worker thread (e.g. a Gmail send in flight may still complete); the
+        thread only stops starting new attempts or self-heals once it has passed
+        
+        Agents that override run() (e.g. SystemAgent's instant paths) keep
+        their own loop; it runs in a worker thread
+        """
+        if type(self).run is not IntelligentAgent.run:
+            return await asyncio.to_thread(self.run, task, context)
+        
+        self._send_update(
+            AgentStatus.THINKING,
+            f"Starting task: {task}",
+            progress=0
+        )
+        
+        try:
+            plan = await asyncio.to_thread(self.think, task, context)
+            steps = plan.get('steps', [])
+            levels = _plan_levels(steps)
+            
+            self._send_update(
+                AgentStatus.EXECUTING,
+                f"Executing plan with {len(steps)} steps in {len(levels)} stages",
+                progress=25
+            )
+            
+            results = [None] * len(steps)
+            for idx, level in enumerate(levels, 1):
+                self._send_update(
+                    AgentStatus.EXECUTING,
+                    f"Stage {idx}/{len(levels)}: " + "; ".join(steps[pos].get('action', 'Processing...') for pos in level),
+                    progress=25 + int((idx / len(levels)) * 65)
+                )
+                
+                outcomes = await asyncio.gather(
+                    *(self._aexecute_step(steps[pos], context or {}, max_retries, step_timeout) for pos in level),
+                    return_exceptions=True
+                )
+                for pos, outcome in zip(level, outcomes):
+                    if isinstance(outcome, BaseException):
+                        raise outcome
+                    results[pos] = outcome
+            
+            self._send_update(
+                AgentStatus.SUCCESS,
+                "Task completed successfully!",
+                progress=100
+            )
+            
+            return {
+                "success": True,
+                "task": task,
+                "plan": plan,
+                "results": results,
+                "agent": self.name
+            }
+            
+        except Exception as e:
+            message = str(e) or type(e).__name__  # e.g. a step TimeoutError
+            self._send_update(
+                AgentStatus.ERROR,
+                f"Task failed: {message}",
+                progress=0
+            )
+            
+            return {
+                "success": False,
+                "task": task,
+                "error": message,
+                "agent": self.name
+            }
+    
+    async def _aexecute_step(self, step: Dict[str, Any], context: Dict[str, Any], max_retries: int, step_timeout: float) -> Dict[str, Any]:
+        """Run a blocking step (with recovery) in a worker thread under a timeout"""
+        deadline = time.monotonic() + step_timeout
+        return await asyncio.wait_for(
+            asyncio.to_thread(self._execute_with_recovery, step, context, max_retries, deadline),
+            step_timeout
+        )
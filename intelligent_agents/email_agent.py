@@ -5,23 +5,134 @@ Uses Gmail API + Langchain LLM for intelligent email automation
 """
 
 import os
-import json
 import time
 import base64
+import threading
 from pathlib import Path
-from typing import Dict, Any, List, Optional
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from typing import Dict, Any, List, Optional, TypedDict
+from email.header import Header
+from email.headerregistry import Address
+from email.utils import formataddr, formatdate, getaddresses
 from datetime import datetime
-from .agent_core import IntelligentAgent, AgentStatus
+from .agent_core import IntelligentAgent, AgentStatus, PlanSchema, dumps_pretty, extract_json, json_config, loads, stream_text
+from .semantic_cache import semantic_cache
 
-# Langchain imports (optional - for advanced features)
-try:
-    from langchain_openai import ChatOpenAI
-    from langchain_community.chat_message_histories import ChatMessageHistory
-    LANGCHAIN_AVAILABLE = True
-except ImportError:
-    LANGCHAIN_AVAILABLE = False
+GMAIL_HTTP_TIMEOUT = 20  # seconds
+
+# Sends bypass the discovery client: a pooled httpx client (HTTP/2 when h2 is
+# installed) lets concurrent steps share one connection instead of queueing
+GMAIL_SEND_URL = 'https://gmail.googleapis.com/gmail/v1/users/me/messages/send'
+GMAIL_MAX_CONNECTIONS = 20
+
+# Partial response for message summaries: just the three requested headers
+# and the snippet, not labels, size, history id or the payload's MIME details
+SUMMARY_FIELDS = 'snippet,payload/headers(name,value)'
+
+EMAIL_OPERATIONS = ('send_email', 'read_email', 'search_email')
+
+# Similarity needed to reuse a cached operation choice for a new task;
+# composed emails are never cached, each send gets freshly written text
+DECIDE_CACHE_THRESHOLD = 0.88
+
+# Local routing (opt-in: only active when the optional sentence-transformers
+# package is installed; otherwise every decision goes to the LLM). A task is
+# matched against these phrasings by embedding similarity, and the LLM is
+# still asked unless the best operation is a clear winner
+OPERATION_EXEMPLARS = {
+    'send_email': ("send a new email", "email someone a message", "write and send a reminder email"),
+    'read_email': ("read inbox messages", "check my latest emails", "show my unread mail"),
+    'search_email': ("search for emails matching query", "find emails from a sender", "look up messages about a topic"),
+}
+# all-MiniLM-L6-v2 scores loosely related email sentences around 0.3-0.5, so a
+# floor that low would accept nearly anything; a paraphrase of an exemplar
+# scores well above 0.6. The margin over the runner-up operation rejects tasks
+# that fit two operations (e.g. "find bob's email and reply")
+LOCAL_ROUTING_MIN_SCORE = 0.6
+LOCAL_ROUTING_MIN_MARGIN = 0.1
+
+# Static instructions go first so providers can reuse the cached prompt prefix
+DECIDE_OPERATION_PREAMBLE = """Decide which operation handles the email task below. Choose from:
+- send_email: Send a new email
+- read_email: Read existing emails
+- search_email: Search for specific emails
+
+Respond with just the operation name.
+"""
+
+# JSON-mode reply schema for _ai_compose_and_send
+class EmailComposeSchema(TypedDict):
+    to: List[str]
+    subject: str
+    body: str
+    tone: str
+    cc: List[str]
+    bcc: List[str]
+
+
+class EmailPlanSchema(PlanSchema, total=False):
+    direct_result: EmailComposeSchema
+
+
+# Lets think() compose a plain "send an email" task in the same call that plans it
+DIRECT_SEND_PROMPT = """
+If the task is only to send one email, leave "steps" empty and instead put the finished email in "direct_result":
+{"to": ["email@example.com"], "subject": "email subject", "body": "email body content - be professional and clear", "tone": "professional|casual|urgent", "cc": [], "bcc": []}
+"""
+
+
+def _operation_complete(text: str) -> bool:
+    """True once a streamed _decide_operation reply holds a full operation name"""
+    normalized = text.strip().lower().replace(' ', '_')
+    return normalized in EMAIL_OPERATIONS or '\n' in text.strip()
+
+
+def _header_text(value: str) -> str:
+    """Single-line header value; RFC 2047 encoded when not plain ASCII"""
+    value = ' '.join(value.splitlines())  # no header injection via CR/LF
+    return value if value.isascii() else Header(value, 'utf-8').encode(linesep='\r\n')
+
+
+def _format_address(name: str, address: str) -> str:
+    """
+    One address with a non-ASCII display name RFC 2047 encoded and an IDN
+    domain IDNA-encoded; a non-ASCII local part can only be sent as UTF-8
+    (RFC 6532), so that address is written out unencoded
+    """
+    local, at, domain = address.rpartition('@')
+    if at and not domain.isascii():
+        try:
+            domain = domain.encode('idna').decode('ascii')
+        except UnicodeError:
+            pass
+        address = f"{local}@{domain}"
+    if address.isascii():
+        return formataddr((name, address), charset='utf-8')
+    return str(Address(display_name=name, username=local, domain=domain))
+
+
+def _address_list(addresses: List[str]) -> str:
+    """Comma-separated addresses, each formatted by _format_address"""
+    pairs = getaddresses([' '.join(a.splitlines()) for a in addresses])
+    return ', '.join(_format_address(name, addr) for name, addr in pairs)
+
+
+def build_raw_message(to: List[str], subject: str, body: str, cc: List[str] = None, bcc: List[str] = None) -> bytes:
+    """RFC 822 bytes for a plain-text UTF-8 email, assembled without email.mime"""
+    headers = [f"To: {_address_list(to)}"]
+    if cc:
+        headers.append(f"Cc: {_address_list(cc)}")
+    if bcc:
+        headers.append(f"Bcc: {_address_list(bcc)}")  # Gmail strips it when sending
+    headers += [
+        f"Subject: {_header_text(subject)}",
+        f"Date: {formatdate(localtime=True)}",
+        "MIME-Version: 1.0",
+        "Content-Type: text/plain; charset=utf-8",
+        "Content-Transfer-Encoding: base64",
+    ]
+    # ASCII unless an address has a non-ASCII local part, which Gmail sends as SMTPUTF8
+    head = ('\r\n'.join(headers) + '\r\n\r\n').encode('utf-8')
+    return head + base64.encodebytes(body.encode('utf-8')).replace(b'\n', b'\r\n')
 
 class EmailAgent(IntelligentAgent):
     """
@@ -32,6 +143,9 @@ class EmailAgent(IntelligentAgent):
     - Manages email workflows with memory
     """
     
+    PLAN_SCHEMA = EmailPlanSchema
+    DIRECT_RESULT_PROMPT = DIRECT_SEND_PROMPT
+    
     def __init__(self, update_callback=None):
         super().__init__(
             name="EmailAgent",
@@ -48,22 +162,45 @@ class EmailAgent(IntelligentAgent):
             update_callback=update_callback
         )
         self.gmail_service = None
-        self.langchain_llm = None
+        # Exemplar embeddings for _classify_operation, encoded on first use
+        self._op_labels = None
+        self._op_embeddings = None
+        # The Gmail client's HTTP connection is not thread-safe and arun()
+        # executes independent steps in worker threads
+        self._gmail_lock = threading.RLock()
+        self._gmail_creds = None
+        self._token_lock = threading.Lock()
+        self._send_client = None
+        # Langchain is heavy to import; it is set up on first use of langchain_llm
+        self._langchain_llm = None
+        self._langchain_initialized = False
         self.message_history = None
-        self._init_langchain() if LANGCHAIN_AVAILABLE else None
+    
+    @property
+    def langchain_llm(self):
+        """Langchain chat model, initialized on first access (None if unavailable)"""
+        if not self._langchain_initialized:
+            self._langchain_initialized = True
+            self._init_langchain()
+        return self._langchain_llm
     
     def _init_langchain(self):
         """Initialize Langchain LLM for advanced email composition"""
-        if not LANGCHAIN_AVAILABLE:
-            return
-        
         try:
             api_key = os.getenv('OPENAI_API_KEY')
             if not api_key:
                 return
             
+            # Langchain imports (optional - for advanced features)
+            try:
+                from langchain_openai import ChatOpenAI
+                from langchain_community.chat_message_histories import ChatMessageHistory
+            except ImportError:
+                self._langchain_llm = None
+                return
+            
             # Initialize ChatOpenAI for intelligent email composition
-            self.langchain_llm = ChatOpenAI(
+            self._langchain_llm = ChatOpenAI(
                 temperature=0.7,
                 model_name="gpt-4-turbo-preview",
                 api_key=api_key
@@ -85,6 +222,8 @@ class EmailAgent(IntelligentAgent):
             from google.oauth2.credentials import Credentials
             from google_auth_oauthlib.flow import InstalledAppFlow
             from googleapiclient.discovery import build
+            import google_auth_httplib2
+            import httplib2
             
             # Comprehensive Gmail scopes
             SCOPES = [
@@ -115,7 +254,15 @@ class EmailAgent(IntelligentAgent):
                 # Save credentials for next use
                 token_path.write_text(creds.to_json())
             
-            self.gmail_service = build('gmail', 'v1', credentials=creds)
+            # One long-lived authorized connection, deliberately without an HTTP
+            # cache (it would write message metadata and snippets to disk); the
+            # bundled discovery document avoids a fetch on every build()
+            http = google_auth_httplib2.AuthorizedHttp(
+                creds,
+                http=httplib2.Http(timeout=GMAIL_HTTP_TIMEOUT)
+            )
+            self.gmail_service = build('gmail', 'v1', http=http, cache_discovery=False)
+            self._gmail_creds = creds
             self._send_update(AgentStatus.EXECUTING, "Gmail API initialized successfully")
             return True
             
@@ -124,6 +271,63 @@ class EmailAgent(IntelligentAgent):
         except Exception as e:
             raise Exception(f"Gmail API init failed: {str(e)}")
     
+    def _gmail_execute(self, request):
+        """Execute a Gmail API request, one at a time per agent"""
+        with self._gmail_lock:
+            return request.execute()
+    
+    def _get_send_client(self):
+        """Shared httpx client for Gmail sends, or None when httpx is not installed"""
+        if self._send_client is None:
+            try:
+                import httpx
+            except ImportError:
+                return None
+            
+            try:
+                import h2  # noqa: F401 - enables HTTP/2 in httpx
+                http2 = True
+            except ImportError:
+                http2 = False
+            
+            with self._token_lock:
+                if self._send_client is None:
+                    self._send_client = httpx.Client(
+                        http2=http2,
+                        timeout=GMAIL_HTTP_TIMEOUT,
+                        limits=httpx.Limits(max_connections=GMAIL_MAX_CONNECTIONS)
+                    )
+        return self._send_client
+    
+    def _access_token(self) -> str:
+        """OAuth bearer token for direct Gmail calls, refreshed when expired"""
+        with self._token_lock:
+            if not self._gmail_creds.valid:
+                from google.auth.transport.requests import Request
+                self._gmail_creds.refresh(Request())
+            return self._gmail_creds.token
+    
+    def _send_raw(self, raw_message: str) -> Dict[str, Any]:
+        """Send a base64url RFC 822 message; returns Gmail's message resource"""
+        client = self._get_send_client() if self._gmail_creds is not None else None
+        if client is None:
+            return self._gmail_execute(self.gmail_service.users().messages().send(
+                userId='me',
+                body={'raw': raw_message}
+            ))
+        
+        import httpx
+        try:
+            response = client.post(
+                GMAIL_SEND_URL,
+                json={'raw': raw_message},
+                headers={'Authorization': f'Bearer {self._access_token()}'}
+            )
+            response.raise_for_status()  # HTTPStatusError keeps the status for retry checks
+        except httpx.TransportError as e:
+            raise ConnectionError(f"Gmail connection failed: {e}") from e
+        return response.json()
+    
     def execute_step(self, step: Dict[str, Any], context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Execute an email operation step using AI + Gmail API"""
         
@@ -131,9 +335,10 @@ class EmailAgent(IntelligentAgent):
         action = step.get('action', '')
         
         # Initialize Gmail API if needed
-        if not self.gmail_service:
-            self._send_update(AgentStatus.EXECUTING, "Initializing Gmail API...")
-            self._init_gmail_api()
+        with self._gmail_lock:
+            if not self.gmail_service:
+                self._send_update(AgentStatus.EXECUTING, "Initializing Gmail API...")
+                self._init_gmail_api()
         
         # Decide operation
         if tool == 'auto':
@@ -144,7 +349,9 @@ class EmailAgent(IntelligentAgent):
             f"Email operation: {tool} - {action}"
         )
         
-        if tool == 'send_email':
+        if tool == 'direct_result':
+            return self._send_composed(step.get('payload') or {})
+        elif tool == 'send_email':
             return self._send_email(action, context)
         elif tool == 'read_email':
             return self._read_email(action, context)
@@ -153,22 +360,49 @@ class EmailAgent(IntelligentAgent):
         else:
             return self._ai_compose_and_send(action, context)
     
+    def _classify_operation(self, action: str) -> Optional[str]:
+        """Pick the operation by embedding similarity to OPERATION_EXEMPLARS; None if unsure"""
+        if self._op_embeddings is None:
+            labels = [op for op, phrases in OPERATION_EXEMPLARS.items() for _ in phrases]
+            embeddings = semantic_cache.encode([p for phrases in OPERATION_EXEMPLARS.values() for p in phrases])
+            if embeddings is None:
+                return None  # sentence-transformers unavailable
+            self._op_labels, self._op_embeddings = labels, embeddings
+        
+        query = semantic_cache.encode([action])
+        if query is None:
+            return None
+        scores = self._op_embeddings @ query[0]
+        by_operation = {}
+        for label, score in zip(self._op_labels, scores.tolist()):
+            by_operation[label] = max(score, by_operation.get(label, -1.0))
+        ranked = sorted(by_operation.items(), key=lambda item: item[1], reverse=True)
+        (operation, best), (_, runner_up) = ranked[0], ranked[1]
+        if best < LOCAL_ROUTING_MIN_SCORE or best - runner_up < LOCAL_ROUTING_MIN_MARGIN:
+            return None
+        return operation
+    
     def _decide_operation(self, action: str, context: Dict[str, Any]) -> str:
-        """Use AI to decide which email operation"""
+        """Decide which email operation, locally when confident, else with AI"""
         
-        prompt = f"""Given this email task: "{action}"
-Context: {json.dumps(context, indent=2)}
-
-Which operation? Choose from:
-- send_email: Send a new email
-- read_email: Read existing emails
-- search_email: Search for specific emails
-
-Respond with just the operation name."""
+        operation = self._classify_operation(action)
+        if operation is not None:
+            return operation
+        
+        details = f"""Email task: "{action}"
+Context: {dumps_pretty(context)}"""
+        prompt = f"{DECIDE_OPERATION_PREAMBLE}\n{details}"
 
+        cache_namespace = f"{self.name}.decide_operation"
         try:
-            response = self._get_execution_model().generate_content(prompt)
-            return response.text.strip().lower().replace(' ', '_')
+            operation, embedding = semantic_cache.lookup(cache_namespace, details, DECIDE_CACHE_THRESHOLD)
+            if operation is None:
+                # The answer is one word: stop the stream once it is complete
+                reply = stream_text(self._get_execution_model(), prompt, _operation_complete)
+                operation = reply.strip().partition('\n')[0].strip().lower().replace(' ', '_')
+                if operation in EMAIL_OPERATIONS:
+                    semantic_cache.put(cache_namespace, details, operation, semantic=True, embedding=embedding)
+            return operation
         except:
             return 'send_email'  # Default
     
@@ -181,8 +415,9 @@ Respond with just the operation name."""
         )
         
         # Use AI to extract email details and compose content
-        prompt = f"""Task: {action}
-Context: {json.dumps(context, indent=2)}
+        details = f"""Task: {action}
+Context: {dumps_pretty(context)}"""
+        prompt = f"""{details}
 
 Compose a professional email. Provide JSON:
 {{
@@ -199,58 +434,47 @@ Extract all email addresses from the task.
 Make the body well-formatted and professional."""
 
         try:
-            response = self._get_thinking_model().generate_content(prompt)
-            email_text = response.text.strip()
-            
-            if "```json" in email_text:
-                email_text = email_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in email_text:
-                email_text = email_text.split("```")[1].split("```")[0].strip()
-            
-            email_data = json.loads(email_text)
-            
-            self._send_update(
-                AgentStatus.EXECUTING,
-                f"Sending to: {', '.join(email_data.get('to', []))}"
+            response = self._get_thinking_model().generate_content(
+                prompt, generation_config=json_config(EmailComposeSchema)
             )
+            email_text = extract_json(response.text.strip())
+            email_data = loads(email_text)
             
-            return self._send_email_api(
-                to=email_data.get('to', []),
-                subject=email_data.get('subject', 'No Subject'),
-                body=email_data.get('body', ''),
-                cc=email_data.get('cc', []),
-                bcc=email_data.get('bcc', [])
-            )
+            return self._send_composed(email_data)
             
         except Exception as e:
-            raise Exception(f"AI composition failed: {str(e)}")
+            raise Exception(f"AI composition failed: {str(e)}") from e
+    
+    def _send_composed(self, email_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Send an email composed by the model (EmailComposeSchema)"""
+        if not email_data.get('to'):
+            raise Exception("Composed email has no recipients")
+        
+        self._send_update(
+            AgentStatus.EXECUTING,
+            f"Sending to: {', '.join(email_data.get('to', []))}"
+        )
+        
+        return self._send_email_api(
+            to=email_data.get('to', []),
+            subject=email_data.get('subject', 'No Subject'),
+            body=email_data.get('body', ''),
+            cc=email_data.get('cc', []),
+            bcc=email_data.get('bcc', [])
+        )
     
     def _send_email(self, action: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """Send email using Gmail API"""
         return self._ai_compose_and_send(action, context)
     
     def _send_email_api(self, to: List[str], subject: str, body: str, cc: List[str] = None, bcc: List[str] = None) -> Dict[str, Any]:
-        """Actually send the email via Gmail API with HTML support"""
+        """Actually send the email via Gmail API"""
         
         try:
-            message = MIMEMultipart('alternative')
-            message['To'] = ', '.join(to)
-            if cc:
-                message['Cc'] = ', '.join(cc)
-            if bcc:
-                message['Bcc'] = ', '.join(bcc)
-            message['Subject'] = subject
-            message['Date'] = datetime.now().strftime('%a, %d %b %Y %H:%M:%S %z')
-            
-            # Attach both plain text and HTML versions
-            message.attach(MIMEText(body, 'plain'))
-            
-            raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+            message = build_raw_message(to, subject, body, cc, bcc)
+            raw_message = base64.urlsafe_b64encode(message).decode('ascii')  # base64 output is ASCII
             
-            send_message = self.gmail_service.users().messages().send(
-                userId='me',
-                body={'raw': raw_message}
-            ).execute()
+            send_message = self._send_raw(raw_message)
             
             all_recipients = to + (cc or []) + (bcc or [])
             self._send_update(
@@ -271,43 +495,23 @@ Make the body well-formatted and professional."""
             
         except Exception as e:
             self._send_update(AgentStatus.ERROR, f"Email send failed: {str(e)}")
-            raise Exception(f"Email send failed: {str(e)}")
+            raise Exception(f"Email send failed: {str(e)}") from e
     
     def _read_email(self, action: str, context: Dict[str, Any], max_results: int = 10) -> Dict[str, Any]:
-        """Read emails from Gmail with full content"""
+        """Read recent inbox emails (sender, subject, date, snippet)"""
         
         try:
             # Get recent messages
-            results = self.gmail_service.users().messages().list(
+            results = self._gmail_execute(self.gmail_service.users().messages().list(
                 userId='me',
                 maxResults=max_results,
                 q="in:inbox"
-            ).execute()
+            ))
             
             messages = results.get('messages', [])
             
-            # Fetch full message details
-            email_list = []
-            for msg in messages[:5]:  # Limit to 5 for performance
-                try:
-                    full_msg = self.gmail_service.users().messages().get(
-                        userId='me',
-                        id=msg['id'],
-                        format='full'
-                    ).execute()
-                    
-                    headers = full_msg['payload'].get('headers', [])
-                    headers_dict = {h['name']: h['value'] for h in headers}
-                    
-                    email_list.append({
-                        "id": msg['id'],
-                        "from": headers_dict.get('From', 'Unknown'),
-                        "subject": headers_dict.get('Subject', '(No Subject)'),
-                        "date": headers_dict.get('Date', 'Unknown'),
-                        "snippet": full_msg.get('snippet', '')
-                    })
-                except:
-                    pass
+            # Fetch message details
+            email_list = self._fetch_summaries(messages[:5])  # Limit to 5 for performance
             
             self._send_update(
                 AgentStatus.SUCCESS,
@@ -323,7 +527,50 @@ Make the body well-formatted and professional."""
             
         except Exception as e:
             self._send_update(AgentStatus.ERROR, f"Read email failed: {str(e)}")
-            raise Exception(f"Read email failed: {str(e)}")
+            raise Exception(f"Read email failed: {str(e)}") from e
+    
+    def _fetch_summaries(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fetch From/Subject/Date/snippet for messages in one batched HTTP request"""
+        if not messages:
+            return []
+        
+        fetched = {}
+        
+        def collect(request_id, response, exception):
+            if exception is None:
+                fetched[request_id] = response  # failed messages are skipped
+        
+        batch = self.gmail_service.new_batch_http_request(callback=collect)
+        for msg in messages:
+            batch.add(
+                self.gmail_service.users().messages().get(
+                    userId='me',
+                    id=msg['id'],
+                    format='metadata',
+                    metadataHeaders=['From', 'Subject', 'Date'],
+                    fields=SUMMARY_FIELDS
+                ),
+                request_id=msg['id']
+            )
+        self._gmail_execute(batch)
+        
+        email_list = []
+        for msg in messages:
+            full_msg = fetched.get(msg['id'])
+            if full_msg is None:
+                continue
+            
+            headers = full_msg.get('payload', {}).get('headers', [])
+            headers_dict = {h['name']: h['value'] for h in headers}
+            
+            email_list.append({
+                "id": msg['id'],
+                "from": headers_dict.get('From', 'Unknown'),
+                "subject": headers_dict.get('Subject', '(No Subject)'),
+                "date": headers_dict.get('Date', 'Unknown'),
+                "snippet": full_msg.get('snippet', '')
+            })
+        return email_list
     
     def _search_email(self, action: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """Search emails intelligently using AI to generate queries"""
@@ -347,36 +594,16 @@ Respond with just the search query, no explanation."""
             
             self._send_update(AgentStatus.EXECUTING, f"Searching with query: {query}")
             
-            results = self.gmail_service.users().messages().list(
+            results = self._gmail_execute(self.gmail_service.users().messages().list(
                 userId='me',
                 q=query,
                 maxResults=20
-            ).execute()
+            ))
             
             messages = results.get('messages', [])
             
             # Fetch details for found emails
-            email_list = []
-            for msg in messages[:10]:
-                try:
-                    full_msg = self.gmail_service.users().messages().get(
-                        userId='me',
-                        id=msg['id'],
-                        format='full'
-                    ).execute()
-                    
-                    headers = full_msg['payload'].get('headers', [])
-                    headers_dict = {h['name']: h['value'] for h in headers}
-                    
-                    email_list.append({
-                        "id": msg['id'],
-                        "from": headers_dict.get('From', 'Unknown'),
-                        "subject": headers_dict.get('Subject', '(No Subject)'),
-                        "date": headers_dict.get('Date', 'Unknown'),
-                        "snippet": full_msg.get('snippet', '')
-                    })
-                except:
-                    pass
+            email_list = self._fetch_summaries(messages[:10])
             
             self._send_update(
                 AgentStatus.SUCCESS,
@@ -393,4 +620,4 @@ Respond with just the search query, no explanation."""
             
         except Exception as e:
             self._send_update(AgentStatus.ERROR, f"Email search failed: {str(e)}")
-            raise Exception(f"Email search failed: {str(e)}")
+            raise Exception(f"Email search failed: {str(e)}") from e
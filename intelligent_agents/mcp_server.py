@@ -419,7 +419,7 @@ class SIGMAMCPServer:
         try:
             region = params.get('region', 'full')
             
-            result = self.agents['system'].run(
+            result = await self.agents['system'].arun(
                 task="Take screenshot of entire screen",
                 context={'action': 'screenshot', 'region': region}
             )
@@ -5,6 +5,7 @@ Supports multiple AI providers with hot-swapping
 """
 
 import os
+import time
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass, asdict
 from enum import Enum
@@ -34,6 +35,9 @@ except ImportError:
 from dotenv import load_dotenv
 load_dotenv()
 
+# How long a model availability check (.env read + Ollama probe) stays fresh
+AVAILABILITY_TTL_SECONDS = 30
+
 class ModelProvider(Enum):
     GOOGLE = "google"
     OPENAI = "openai"
@@ -65,6 +69,11 @@ class ModelManager:
         self.current_thinking_model = None
         self.current_execution_model = None
         self.usage_count = {}
+        self._availability_checked_at = 0.0
+        # Bumped whenever the model selection, availability or API keys change;
+        # agents reuse their resolved model clients until it moves
+        self.version = 0
+        self._availability_signature = None
         
         # Define available models
         self.available_models = {
@@ -160,11 +169,18 @@ class ModelManager:
         # Set default models
         self._set_defaults()
     
+    def refresh_availability(self, max_age: float = AVAILABILITY_TTL_SECONDS):
+        """Re-check model availability only if the last check is older than max_age seconds"""
+        if time.monotonic() - self._availability_checked_at >= max_age:
+            self._check_availability()
+    
     def _check_availability(self):
         """Check which models have valid API keys (reads from .env dynamically)"""
         from pathlib import Path
         import re
         
+        self._availability_checked_at = time.monotonic()
+        
         # Load .env file dynamically to catch recently saved keys
         env_path = Path(__file__).parent.parent / ".env"
         env_vars = {}
@@ -202,6 +218,14 @@ class ModelManager:
                             target in ollama_tags
                             or f"{target}:latest" in ollama_tags
                         )
+        
+        signature = tuple(
+            (model_id, model.available, os.getenv(model.api_key_env) if model.api_key_env else None)
+            for model_id, model in self.available_models.items()
+        )
+        if signature != self._availability_signature:
+            self._availability_signature = signature
+            self.version += 1
     
     def _set_defaults(self):
         """Set default models based on availability - ALWAYS prefer Groq for speed"""
@@ -244,6 +268,7 @@ class ModelManager:
         """Set the model used for thinking/planning"""
         if model_id in self.available_models and self.available_models[model_id].available:
             self.current_thinking_model = model_id
+            self.version += 1
             return True
         return False
     
@@ -251,6 +276,7 @@ class ModelManager:
         """Set the model used for quick execution"""
         if model_id in self.available_models and self.available_models[model_id].available:
             self.current_execution_model = model_id
+            self.version += 1
             return True
         return False
     
@@ -320,31 +346,67 @@ class ModelManager:
         """Track model usage"""
         self.usage_count[model_id] = self.usage_count.get(model_id, 0) + 1
 
+def _wants_json(generation_config) -> bool:
+    """True when a Gemini-style generation_config asks for a raw JSON reply"""
+    return bool(generation_config) and generation_config.get("response_mime_type") == "application/json"
+
 # Wrapper classes to provide unified interface
+# generate_content() takes Gemini's generation_config; JSON mode maps to each
+# provider's equivalent where one exists (response_schema is Gemini-only)
 class OpenAIWrapper:
     def __init__(self, client, model_name):
         self.client = client
         self.model_name = model_name
     
-    def generate_content(self, prompt):
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        options = {"response_format": {"type": "json_object"}} if _wants_json(generation_config) else {}
+        if stream:
+            return self._stream(prompt, options)
         response = self.client.chat.completions.create(
             model=self.model_name,
-            messages=[{"role": "user", "content": prompt}]
+            messages=[{"role": "user", "content": prompt}],
+            **options
         )
         return TextResponse(response.choices[0].message.content)
+    
+    def _stream(self, prompt, options):
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            **options
+        )
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield TextResponse(chunk.choices[0].delta.content)
+        finally:
+            response.close()  # stops generation when the caller exits early
 
 class AnthropicWrapper:
     def __init__(self, client, model_name):
         self.client = client
         self.model_name = model_name
     
-    def generate_content(self, prompt):
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        # No JSON mode in the Messages API; callers still tolerate fenced JSON
+        if stream:
+            return self._stream(prompt)
         response = self.client.messages.create(
             model=self.model_name,
             max_tokens=8192,
             messages=[{"role": "user", "content": prompt}]
         )
         return TextResponse(response.content[0].text)
+    
+    def _stream(self, prompt):
+        with self.client.messages.stream(
+            model=self.model_name,
+            max_tokens=8192,
+            messages=[{"role": "user", "content": prompt}]
+        ) as response:
+            for text in response.text_stream:
+                yield TextResponse(text)
 
 class OllamaWrapper:
     def __init__(self, model_name):
@@ -367,8 +429,38 @@ class OllamaWrapper:
         except Exception:
             return None
     
-    def generate_content(self, prompt):
+    def _stream(self, prompt, generation_config=None):
+        payload = {"model": self.model_name, "prompt": prompt, "stream": True}
+        if _wants_json(generation_config):
+            payload["format"] = "json"
+        response = requests.post(
+            f"{self.base_url}/api/generate",
+            json=payload,
+            timeout=90,
+            stream=True
+        )
+        try:
+            if response.status_code != 200:
+                # Let the non-streaming path pick a fallback model or raise
+                yield self.generate_content(prompt, generation_config=generation_config)
+                return
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise Exception(data["error"])
+                if data.get("response"):
+                    yield TextResponse(data["response"])
+        finally:
+            response.close()
+
+    def generate_content(self, prompt, stream=False, generation_config=None):
+        if stream:
+            return self._stream(prompt, generation_config)
         payload = {"model": self.model_name, "prompt": prompt, "stream": False}
+        if _wants_json(generation_config):
+            payload["format"] = "json"
         response = requests.post(
             f"{self.base_url}/api/generate",
             json=payload,
@@ -379,7 +471,7 @@ class OllamaWrapper:
         if response.status_code != 200 or "response" not in data:
             fallback = self._choose_fallback_model()
             if fallback and fallback != self.model_name:
-                retry_payload = {"model": fallback, "prompt": prompt, "stream": False}
+                retry_payload = {**payload, "model": fallback}
                 retry = requests.post(
                     f"{self.base_url}/api/generate",
                     json=retry_payload,
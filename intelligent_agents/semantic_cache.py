@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Semantic response cache for agent LLM calls
+Returns a stored response when a new request is identical or, for callers that
+opt in, close enough in meaning
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+MAX_ENTRIES = 10_000
+
+logger = logging.getLogger('sigma.agent.semantic_cache')
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Tokens a near-duplicate prompt must still match exactly: a plan for
+# "email bob@x.com" is no answer for "email alice@y.com", however similar
+_FINGERPRINT_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+|\d+(?:[.:/-]\d+)*|\"[^\"]*\"|'[^']*'")
+
+
+def _normalize(prompt: str) -> str:
+    # Case is kept: an exact hit may be sent verbatim (an email, a plan)
+    return _WHITESPACE_RE.sub(" ", prompt).strip()
+
+
+def _fingerprint(prompt: str) -> frozenset:
+    return frozenset(_FINGERPRINT_RE.findall(prompt))
+
+
+class _Entry:
+    __slots__ = ("text", "fingerprint", "expires")
+
+    def __init__(self, text: str, fingerprint: frozenset, expires: Optional[float]):
+        self.text = text
+        self.fingerprint = fingerprint
+        self.expires = expires  # time.monotonic() deadline, None to keep until evicted
+
+    def expired(self) -> bool:
+        return self.expires is not None and time.monotonic() >= self.expires
+
+
+class _Index:
+    """
+    Unit embeddings of one namespace's semantic entries, one row per entry
+    Rows are appended in place; removed rows are blanked and only dropped
+    when the array next fills up, so puts and evictions stay O(1) amortized
+    """
+    __slots__ = ("keys", "rows", "embeddings")
+
+    def __init__(self, embedding):
+        self.keys: list = []   # row -> entry key, None once removed
+        self.rows: dict = {}   # entry key -> row
+        self.embeddings = np.empty((16, embedding.shape[0]), dtype=embedding.dtype)
+
+    def add(self, key, embedding):
+        row = self.rows.get(key)
+        if row is None:
+            if len(self.keys) == len(self.embeddings):
+                self._resize()
+            row = self.rows[key] = len(self.keys)
+            self.keys.append(key)
+        self.embeddings[row] = embedding
+
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is not None:
+            self.keys[row] = None
+            self.embeddings[row] = 0
+
+    def best(self, embedding):
+        """(entry key, cosine score) of the most similar row, or None when empty"""
+        if not self.rows:
+            return None
+        scores = self.embeddings[:len(self.keys)] @ embedding
+        row = int(np.argmax(scores))
+        return self.keys[row], float(scores[row])
+
+    def _resize(self):
+        """Drop removed rows, doubling the capacity when at least half are live"""
+        live = [row for row, key in enumerate(self.keys) if key is not None]
+        capacity = len(self.embeddings)
+        if len(live) * 2 >= capacity:
+            capacity *= 2
+        embeddings = np.empty((capacity, self.embeddings.shape[1]), dtype=self.embeddings.dtype)
+        embeddings[:len(live)] = self.embeddings[live]
+        self.keys = [self.keys[row] for row in live]
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.embeddings = embeddings
+
+
+class SemanticCache:
+    """
+    LRU cache of LLM responses keyed by (namespace, normalized key)
+    - Keys should be only the variable part of a prompt (task, context): the
+      embedding model reads 256 word pieces, so a long fixed preamble would
+      leave every key with the same embedding
+    - Exact hits are a dict lookup
+    - Entries stored with a ttl stop matching once it has passed
+    - Entries stored with semantic=True are also found by cosine similarity
+      (needs sentence-transformers); use it only for answers that are safe to
+      reuse for a similar request, such as a classification, never for output
+      that gets sent or executed
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, model_name: str = EMBEDDING_MODEL):
+        self.max_entries = max_entries
+        self.model_name = model_name
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        # namespace -> embeddings of its semantic entries
+        self._indexes: Dict[str, _Index] = {}
+        self._encoder = None
+        self._encoder_failed = SentenceTransformer is None or np is None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load_encoder(self) -> bool:
+        """Load the sentence-transformers model on first use; False if unavailable"""
+        if self._encoder_failed:
+            return False
+
+        if self._encoder is None:
+            try:
+                self._encoder = SentenceTransformer(self.model_name)
+            except Exception as e:
+                logger.warning("Semantic cache running exact-match only: %s", e)
+                self._encoder_failed = True
+                return False
+
+        return True
+
+    def _embed(self, normalized: str):
+        """Unit-length embedding, or None when embeddings are unavailable"""
+        if not self._load_encoder():
+            return None
+
+        return self._encoder.encode(normalized, normalize_embeddings=True)
+
+    def encode(self, texts: List[str]):
+        """
+        Unit-length embeddings (one row per text) from the cache's encoder, or
+        None when embeddings are unavailable; lets callers share the loaded model
+        """
+        if not self._load_encoder():
+            return None
+
+        return self._encoder.encode([_normalize(text) for text in texts], normalize_embeddings=True)
+
+    def get(self, namespace: str, key: str, threshold: Optional[float] = None) -> Optional[str]:
+        """Cached response for this key or, given a threshold, one at least that similar"""
+        return self.lookup(namespace, key, threshold)[0]
+
+    def lookup(self, namespace: str, key: str, threshold: Optional[float] = None) -> tuple:
+        """
+        get() that also returns the key's embedding when it computed one (else
+        None); pass it to put() after a miss so the key isn't encoded twice
+        """
+
+        normalized = _normalize(key)
+        entry_key = (namespace, normalized)
+
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                if entry.expired():
+                    self._remove(entry_key)
+                else:
+                    self._entries.move_to_end(entry_key)
+                    self.hits += 1
+                    return entry.text, None
+
+        embedding = self._embed(normalized) if threshold is not None else None
+        if embedding is None:
+            self.misses += 1
+            return None, None
+
+        with self._lock:
+            index = self._indexes.get(namespace)
+            match = index.best(embedding) if index is not None else None
+            if match is not None:
+                best_key, score = match
+                entry = self._entries.get(best_key)
+                if entry is not None and entry.expired():
+                    self._remove(best_key)
+                elif (
+                    score >= threshold
+                    and entry is not None
+                    and entry.fingerprint == _fingerprint(normalized)
+                ):
+                    self._entries.move_to_end(best_key)
+                    self.hits += 1
+                    return entry.text, embedding
+            self.misses += 1
+        return None, embedding
+
+    def put(
+        self,
+        namespace: str,
+        key: str,
+        text: str,
+        semantic: bool = False,
+        embedding=None,
+        ttl: Optional[float] = None,
+    ):
+        """
+        Store a response; callers should only store responses they could parse
+        Only semantic entries are embedded and eligible for similarity hits;
+        `embedding` is the one lookup() returned for this key, if any
+        A `ttl` (seconds) expires answers that depend on changing state
+        """
+
+        normalized = _normalize(key)
+        entry_key = (namespace, normalized)
+        if semantic and embedding is None:
+            embedding = self._embed(normalized)
+
+        with self._lock:
+            expires = time.monotonic() + ttl if ttl is not None else None
+            self._entries[entry_key] = _Entry(text, _fingerprint(normalized), expires)
+            self._entries.move_to_end(entry_key)
+
+            index = self._indexes.get(namespace)
+            if semantic and embedding is not None:
+                if index is None:
+                    index = self._indexes[namespace] = _Index(embedding)
+                index.add(entry_key, embedding)
+            elif index is not None:
+                index.remove(entry_key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_key):
+        """Drop an entry and its embedding row; caller holds the lock"""
+        del self._entries[entry_key]
+        index = self._indexes.get(entry_key[0])
+        if index is not None:
+            index.remove(entry_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+
+
+# Shared across agents; entries are namespaced per agent and call site
+semantic_cache = SemanticCache()
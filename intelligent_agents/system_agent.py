@@ -21,10 +21,20 @@ import shutil
 import platform
 import threading
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from .agent_core import IntelligentAgent, AgentStatus
 from .output_formatter import format_output, OutputFormatter
 
+# How long a cached Pictures-directory existence check stays valid
+PICTURES_RECHECK_SECONDS = 300
+
+# Screenshot command-line tools, tried in order (output path is appended)
+SCREENSHOT_BACKENDS = (
+    ('gnome-screenshot', ('gnome-screenshot', '-f')),
+    ('scrot', ('scrot',)),
+    ('imagemagick', ('import', '-window', 'root')),
+)
+
 class ContextAwareEngine:
     """
     Advanced Context-Aware Engine that automatically detects and tracks:
@@ -307,6 +317,13 @@ class SystemAgent(IntelligentAgent):
         self.desktop = self.context_engine.desktop
         self.cwd = self.context_engine.cwd
         self.os_type = self.context_engine.os_type
+        
+        # Pre-resolved Path objects for the screenshot/AI hot paths
+        self._home_path = Path(self.home)
+        self._desktop_path = Path(self.desktop)
+        self._pictures_path = self._home_path / "Pictures"
+        self._pictures_exists = None
+        self._pictures_checked_at = 0.0
     
     def run(self, task: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Execute a task with optimized performance - try fast path first"""
@@ -697,45 +714,65 @@ class SystemAgent(IntelligentAgent):
                 "results": []
             }
     
+    def _screenshot_dir(self) -> Path:
+        """Pictures directory if present, else Desktop (existence re-checked every 5 minutes)"""
+        now = time.monotonic()
+        if self._pictures_exists is None or now - self._pictures_checked_at > PICTURES_RECHECK_SECONDS:
+            self._pictures_exists = self._pictures_path.exists()
+            self._pictures_checked_at = now
+        return self._pictures_path if self._pictures_exists else self._desktop_path
+    
+    def _capture_screenshot(self, filepath: Path) -> Tuple[bool, str]:
+        """
+        Try each screenshot tool in turn (blocking, 5s timeout each)
+        Callers on an event loop run the agent in a worker thread (asyncio.to_thread)
+        """
+        error_msg = ""
+        for method_name, argv in SCREENSHOT_BACKENDS:
+            try:
+                result = subprocess.run(
+                    [*argv, str(filepath)],
+                    capture_output=True,
+                    text=True,
+                    timeout=5
+                )
+            except FileNotFoundError:
+                error_msg += f" | {method_name} not installed"
+                continue
+            except subprocess.TimeoutExpired:
+                error_msg += f" | {method_name} timed out"
+                continue
+            except Exception as e:
+                # e.g. PermissionError or a broken binary; try the next tool
+                error_msg += f" | {method_name} error: {str(e)}"
+                continue
+
+            if result.returncode == 0 and filepath.exists():
+                return True, error_msg
+            error_msg += f" | {method_name} failed: {result.stderr}"
+        
+        return False, error_msg
+    
     def _take_screenshot_fast(self, context: Dict[str, Any]) -> Dict[str, Any]:
         """Fast screenshot capture"""
         try:
             timestamp = time.strftime("%Y%m%d_%H%M%S")
             filename = f"screenshot_{timestamp}.png"
             
-            pictures_dir = os.path.join(self.home, "Pictures")
-            if os.path.exists(pictures_dir):
-                filepath = Path(pictures_dir) / filename
-            else:
-                filepath = Path(self.desktop) / filename
+            filepath = self._screenshot_dir() / filename
             
             filepath.parent.mkdir(exist_ok=True)
             
             self._send_update(AgentStatus.EXECUTING, "📸 Capturing screenshot...")
             
-            screenshot_taken = False
-            error_msg = ""
-            
             # Try multiple screenshot methods
-            methods = [
-                (['gnome-screenshot', '-f', str(filepath)], 'gnome-screenshot'),
-                (['scrot', str(filepath)], 'scrot'),
-                (['import', '-window', 'root', str(filepath)], 'imagemagick'),
-            ]
-            
-            for cmd, method_name in methods:
-                try:
-                    result = subprocess.run(cmd, capture_output=True, text=True, timeout=5)
-                    if result.returncode == 0 and filepath.exists():
-                        screenshot_taken = True
-                        break
-                except (FileNotFoundError, Exception) as e:
-                    error_msg += f" | {method_name}: {str(e)}"
+            screenshot_taken, error_msg = self._capture_screenshot(filepath)
             
             if not screenshot_taken:
                 raise Exception(f"Screenshot failed. Install: gnome-screenshot, scrot, or imagemagick")
             
-            file_size_kb = filepath.stat().st_size / 1024
+            file_size = filepath.stat().st_size
+            file_size_kb = file_size / 1024
             
             return {
                 "success": True,
@@ -1935,7 +1972,7 @@ JSON Response:"""
                     "success": True,
                     "operation": "deleted",
                     "path": str(path),
-                    "exists": path.exists()
+                    "exists": False  # unlink/rmtree returned, so it is gone
                 }
             
             elif op_type == 'copy':
@@ -1950,6 +1987,8 @@ JSON Response:"""
                     shutil.copy2(path, dest)
                 elif path.is_dir():
                     shutil.copytree(path, dest, dirs_exist_ok=True)
+                else:
+                    raise Exception(f"Path not found: {path}")
                 
                 self._send_update(
                     AgentStatus.EXECUTING,
@@ -1961,7 +2000,7 @@ JSON Response:"""
                     "operation": "copied",
                     "from": str(path),
                     "to": str(dest),
-                    "exists": dest.exists()
+                    "exists": True  # copy2/copytree returned, so dest exists
                 }
             
             elif op_type == 'move':
@@ -1984,7 +2023,7 @@ JSON Response:"""
                     "operation": "moved",
                     "from": str(path),
                     "to": str(dest),
-                    "exists": dest.exists()
+                    "exists": True  # move returned, so dest exists
                 }
             
             else:
@@ -2006,11 +2045,7 @@ JSON Response:"""
             filename = f"screenshot_{timestamp}.png"
             
             # Use Pictures directory or Desktop as fallback
-            pictures_dir = os.path.join(context.get('home'), "Pictures")
-            if os.path.exists(pictures_dir):
-                filepath = Path(pictures_dir) / filename
-            else:
-                filepath = Path(context.get('desktop')) / filename
+            filepath = self._screenshot_dir() / filename
             
             filepath.parent.mkdir(exist_ok=True)
             
@@ -2033,58 +2068,9 @@ JSON Response:"""
             except Exception as e1:
                 error_msg = f"PIL ImageGrab failed: {str(e1)}"
                 
-                # Method 2: Try using gnome-screenshot command
-                try:
-                    result = subprocess.run(
-                        ['gnome-screenshot', '-f', str(filepath)],
-                        capture_output=True,
-                        text=True,
-                        timeout=5
-                    )
-                    if result.returncode == 0 and filepath.exists():
-                        screenshot_taken = True
-                    else:
-                        error_msg += f" | gnome-screenshot failed: {result.stderr}"
-                except FileNotFoundError:
-                    error_msg += " | gnome-screenshot not installed"
-                except Exception as e2:
-                    error_msg += f" | gnome-screenshot error: {str(e2)}"
-                
-                # Method 3: Try using scrot command
-                if not screenshot_taken:
-                    try:
-                        result = subprocess.run(
-                            ['scrot', str(filepath)],
-                            capture_output=True,
-                            text=True,
-                            timeout=5
-                        )
-                        if result.returncode == 0 and filepath.exists():
-                            screenshot_taken = True
-                        else:
-                            error_msg += f" | scrot failed: {result.stderr}"
-                    except FileNotFoundError:
-                        error_msg += " | scrot not installed"
-                    except Exception as e3:
-                        error_msg += f" | scrot error: {str(e3)}"
-                
-                # Method 4: Try ImageMagick's import command
-                if not screenshot_taken:
-                    try:
-                        result = subprocess.run(
-                            ['import', '-window', 'root', str(filepath)],
-                            capture_output=True,
-                            text=True,
-                            timeout=5
-                        )
-                        if result.returncode == 0 and filepath.exists():
-                            screenshot_taken = True
-                        else:
-                            error_msg += f" | imagemagick failed: {result.stderr}"
-                    except FileNotFoundError:
-                        error_msg += " | imagemagick not installed"
-                    except Exception as e4:
-                        error_msg += f" | imagemagick error: {str(e4)}"
+                # Methods 2-4: gnome-screenshot, scrot, ImageMagick's import
+                screenshot_taken, backend_errors = self._capture_screenshot(filepath)
+                error_msg += backend_errors
             
             if not screenshot_taken:
                 raise Exception(f"All screenshot methods failed. {error_msg}\nPlease install one of: gnome-screenshot, scrot, or imagemagick")
@@ -2093,7 +2079,8 @@ JSON Response:"""
             if not filepath.exists():
                 raise Exception(f"Screenshot file was not created at {filepath}")
             
-            file_size_kb = filepath.stat().st_size / 1024
+            file_size = filepath.stat().st_size
+            file_size_kb = file_size / 1024
             
             self._send_update(
                 AgentStatus.SUCCESS,
@@ -2103,7 +2090,7 @@ JSON Response:"""
             self._log_execution("SCREENSHOT", {
                 "path": str(filepath),
                 "size_kb": file_size_kb,
-                "exists": filepath.exists()
+                "exists": True
             })
             
             return {
@@ -2111,8 +2098,8 @@ JSON Response:"""
                 "operation": "screenshot",
                 "message": f"Screenshot saved to {filepath} ({file_size_kb:.1f} KB)",
                 "path": str(filepath),
-                "exists": filepath.exists(),
-                "size": filepath.stat().st_size,
+                "exists": True,
+                "size": file_size,
                 "size_kb": file_size_kb
             }
             
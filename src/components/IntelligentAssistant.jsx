@@ -358,6 +358,8 @@ function IntelligentAssistant() {
 
     try {
       const ws = new WebSocket(BACKEND_WS);
+      // Agent updates arrive as binary JSON frames
+      ws.binaryType = 'arraybuffer';
       
       ws.onopen = () => {
         console.log('✅ Connected to SIGMA-OS Agent System');
@@ -367,7 +369,10 @@ function IntelligentAssistant() {
       
       ws.onmessage = (event) => {
         try {
-          const data = JSON.parse(event.data);
+          const raw = typeof event.data === 'string'
+            ? event.data
+            : new TextDecoder().decode(event.data);
+          const data = JSON.parse(raw);
           
           if (data.type === 'connection') {
             console.log('🔗 Connection confirmed:', data.message);
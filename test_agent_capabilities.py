@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test script for agent capability lookup
+Checks which agents find_capable_agents returns
+"""
+
+import sys
+import os
+
+# Backend automation package lives under backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from automation.orchestrator import AgentCapability, AgentOrchestrator
+
+def orchestrator(**agents):
+    orch = AgentOrchestrator()
+    for name, caps in agents.items():
+        orch.register_agent(name, lambda task, context: None, [AgentCapability(c, c) for c in caps])
+    return orch
+
+def test_exact_and_substring_matches_combine():
+    """An exact match on one agent does not hide substring matches on others"""
+    orch = orchestrator(a=["send_email"], b=["email"], c=["browse"])
+    assert orch.find_capable_agents("email") == ["a", "b"]
+    assert orch.find_capable_agents("send_email") == ["a"]
+    print("✅ Exact and substring matches combined")
+
+def test_case_handling():
+    """Exact names match as written, substrings match the lowercased name"""
+    orch = orchestrator(a=["SendEmail"], b=["Email"])
+    assert orch.find_capable_agents("Email") == ["b"]
+    assert orch.find_capable_agents("email") == ["a", "b"]
+    assert orch.find_capable_agents("fax") == []
+    print("✅ Capability case handled")
+
+def test_unregistered_agents_dropped():
+    """Unregistering an agent removes it from lookups"""
+    orch = orchestrator(a=["send_email"], b=["email"])
+    orch.unregister_agent("b")
+    assert orch.find_capable_agents("email") == ["a"]
+    print("✅ Unregistered agent dropped")
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*80)
+    print("🧪 AGENT CAPABILITY TESTS")
+    print("="*80)
+
+    test_exact_and_substring_matches_combine()
+    test_case_handling()
+    test_unregistered_agents_dropped()
+
+    print("\n✅ All agent capability tests passed!")
+
+if __name__ == "__main__":
+    main()
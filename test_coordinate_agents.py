@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test script for multi-agent coordination
+Checks that parallel layers in coordinate_agents really overlap
+"""
+
+import sys
+import os
+import time
+import asyncio
+import threading
+
+# Backend automation package lives under backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from automation.orchestrator import AgentOrchestrator
+
+def blocking_agent(delay):
+    def agent(task, context):
+        time.sleep(delay)
+        return {"thread": threading.get_ident(), "context": context}
+    return agent
+
+def test_parallel_agents_overlap():
+    """Blocking agents run in worker threads, not one after another on the loop"""
+    orch = AgentOrchestrator()
+    for name in ("a", "b", "c"):
+        orch.register_agent(name, blocking_agent(0.3))
+    
+    start = time.perf_counter()
+    outcome = asyncio.run(orch.coordinate_agents("task", ["a", "b", "c"], "parallel"))
+    elapsed = time.perf_counter() - start
+    
+    assert outcome["success"]
+    assert elapsed < 0.8, elapsed
+    assert threading.get_ident() not in {r["result"]["thread"] for r in outcome["results"].values()}
+    print("✅ Parallel agents overlap")
+
+def test_parallel_limit():
+    """max_parallel_agents bounds how many agents run at once"""
+    orch = AgentOrchestrator(max_parallel_agents=1)
+    for name in ("a", "b"):
+        orch.register_agent(name, blocking_agent(0.2))
+    
+    start = time.perf_counter()
+    asyncio.run(orch.coordinate_agents("task", ["a", "b"], "parallel"))
+    assert time.perf_counter() - start >= 0.4
+    print("✅ Parallel limit respected")
+
+def test_dependency_results_passed_on():
+    """Dependent agents see the results of the agents they need"""
+    orch = AgentOrchestrator()
+    for name in ("a", "b", "c"):
+        orch.register_agent(name, blocking_agent(0))
+    
+    outcome = asyncio.run(orch.coordinate_agents("task", ["a", "b", "c"], "sequential", {"c": ["a", "b"]}))
+    context = outcome["results"]["c"]["result"]["context"]
+    assert set(context["dependency_results"]) == {"a", "b"}
+    print("✅ Dependency results passed on")
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*80)
+    print("🧪 AGENT COORDINATION TESTS")
+    print("="*80)
+
+    test_parallel_agents_overlap()
+    test_parallel_limit()
+    test_dependency_results_passed_on()
+
+    print("\n✅ All agent coordination tests passed!")
+
+if __name__ == "__main__":
+    main()
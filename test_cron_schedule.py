@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test script for cron scheduling
+Covers cron field parsing into bitmasks and next-run calculation
+"""
+
+import sys
+import os
+from datetime import datetime
+
+# Backend automation package lives under backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from automation.task_scheduler import (
+    ALL_DAYS,
+    ALL_HOURS,
+    ALL_MINUTES,
+    ScheduledTask,
+    ScheduleType,
+    _cron_mask,
+)
+
+def bits(*values):
+    return sum(1 << v for v in values)
+
+def next_run(config, from_time):
+    task = ScheduledTask("t", "wf", ScheduleType.CRON, config)
+    return task._calculate_cron_next_run(from_time)
+
+def test_field_masks():
+    """Each field syntax sets exactly the allowed values"""
+    assert _cron_mask("*", 59) == ALL_MINUTES
+    assert _cron_mask("*", 23) == ALL_HOURS
+    assert _cron_mask("*", 6) == ALL_DAYS
+    assert _cron_mask(5, 59) == bits(5)
+    assert _cron_mask("1-3", 23) == bits(1, 2, 3)
+    assert _cron_mask("*/15", 59) == bits(0, 15, 30, 45)
+    assert _cron_mask("0-30/10", 59) == bits(0, 10, 20, 30)
+    assert _cron_mask("1, 3,5", 6) == bits(1, 3, 5)
+    print("✅ Field masks parsed correctly")
+
+def test_sunday_as_seven():
+    """day_of_week accepts 7 for Sunday and folds it onto bit 0"""
+    assert _cron_mask(7, 6) == bits(0)
+    assert _cron_mask("5-7", 6) == bits(0, 5, 6)
+    assert _cron_mask("0,7", 6) == bits(0)
+    print("✅ Sunday accepted as 7")
+
+def test_invalid_fields():
+    """Out-of-range, reversed and non-numeric fields raise ValueError"""
+    for value, high in (("60", 59), ("24", 23), ("8", 6), ("5-1", 59), ("abc", 59), ("-1", 59)):
+        try:
+            _cron_mask(value, high)
+        except ValueError:
+            continue
+        raise AssertionError(f"cron field should be rejected: {value!r}")
+    print("✅ Invalid fields rejected")
+
+def test_daily_and_hourly_runs():
+    """Single minute (and hour) configs use the daily/hourly fast path"""
+    now = datetime(2026, 10, 16, 12, 0, 30)  # Friday
+    assert next_run({"minute": 0, "hour": 12}, now) == datetime(2026, 10, 17, 12, 0)
+    assert next_run({"minute": 30, "hour": 12}, now) == datetime(2026, 10, 16, 12, 30)
+    assert next_run({"minute": 0}, now) == datetime(2026, 10, 16, 13, 0)
+    assert next_run({}, now) == datetime(2026, 10, 16, 12, 1, 30)
+    print("✅ Daily, hourly and every-minute runs calculated")
+
+def test_mask_walk():
+    """Step, range and day-of-week configs find the next allowed minute"""
+    now = datetime(2026, 10, 16, 10, 7)  # Friday
+    assert next_run({"minute": "*/15"}, now) == datetime(2026, 10, 16, 10, 15)
+    assert next_run({"minute": "50-55/5", "hour": "9-10"}, now) == datetime(2026, 10, 16, 10, 50)
+    assert next_run({"minute": 30, "hour": 9, "day_of_week": "1-5"}, now) == datetime(2026, 10, 19, 9, 30)
+    assert next_run({"minute": 0, "hour": 0, "day_of_week": 7}, now) == datetime(2026, 10, 18, 0, 0)
+
+    # Rolls over the end of the day, month and year
+    assert next_run({"minute": "0,30", "hour": "*/6"}, datetime(2026, 12, 31, 23, 59)) == datetime(2027, 1, 1, 0, 0)
+    print("✅ Mask walk found the next run")
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*80)
+    print("🧪 CRON SCHEDULE TESTS")
+    print("="*80)
+
+    test_field_masks()
+    test_sunday_as_seven()
+    test_invalid_fields()
+    test_daily_and_hourly_runs()
+    test_mask_walk()
+
+    print("\n✅ All cron schedule tests passed!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for outgoing email assembly
+Parses build_raw_message output back with the stdlib email parser
+"""
+
+import sys
+import os
+from email import message_from_bytes, message_from_string, policy
+from email.header import decode_header, make_header
+from email.utils import getaddresses
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from intelligent_agents.email_agent import build_raw_message
+
+def decoded(value):
+    return str(make_header(decode_header(value)))
+
+def test_headers_and_body():
+    """Recipients, subject and body round-trip through the parser"""
+    raw = build_raw_message(["bob@example.com", "Carol <carol@example.com>"], "Weekly report",
+                            "Numbers attached.\nThanks", cc=["dave@example.com"], bcc=["eve@example.com"])
+    message = message_from_bytes(raw)
+
+    assert getaddresses([message["To"]]) == [("", "bob@example.com"), ("Carol", "carol@example.com")]
+    assert message["Cc"] == "dave@example.com"
+    assert message["Bcc"] == "eve@example.com"
+    assert message["Subject"] == "Weekly report"
+    assert message["Date"]
+    assert message.get_content_type() == "text/plain"
+    assert message.get_content_charset() == "utf-8"
+    assert message.get_payload(decode=True).decode("utf-8") == "Numbers attached.\nThanks"
+    print("✅ Headers and body round-trip")
+
+def test_optional_headers_omitted():
+    """No Cc/Bcc headers when there are no such recipients"""
+    message = message_from_bytes(build_raw_message(["bob@example.com"], "Hi", "Hello"))
+    assert message["Cc"] is None
+    assert message["Bcc"] is None
+    print("✅ Empty Cc/Bcc omitted")
+
+def test_crlf_line_endings():
+    """Every line ends in CRLF, including the base64 body"""
+    raw = build_raw_message(["bob@example.com"], "Hi", "line one\n" * 40)
+    assert b"\r\n\r\n" in raw
+    assert raw.replace(b"\r\n", b"").count(b"\n") == 0
+    assert raw.replace(b"\r\n", b"").count(b"\r") == 0
+    print("✅ CRLF line endings")
+
+def test_non_ascii_encoding():
+    """Non-ASCII subjects and display names are RFC 2047 encoded, the rest stays ASCII"""
+    raw = build_raw_message(["Zoë Müller <zoe@example.com>"], "Café menu ✓", "Grüße")
+    raw.decode("ascii")
+    message = message_from_bytes(raw)
+
+    assert decoded(message["Subject"]) == "Café menu ✓"
+    assert getaddresses([decoded(message["To"])]) == [("Zoë Müller", "zoe@example.com")]
+    assert message.get_payload(decode=True).decode("utf-8") == "Grüße"
+    print("✅ Non-ASCII subject, name and body encoded")
+
+def test_international_addresses():
+    """IDN domains are IDNA-encoded; a non-ASCII local part is sent as UTF-8"""
+    raw = build_raw_message(["Zoë <zoe@bücher.de>"], "Hi", "body")
+    raw.decode("ascii")
+    assert getaddresses([decoded(message_from_bytes(raw)["To"])]) == [("Zoë", "zoe@xn--bcher-kva.de")]
+
+    raw = build_raw_message(["José <josé@exämple.com>", "bob@example.com"], "Café", "body")
+    message = message_from_string(raw.decode("utf-8"), policy=policy.default)
+    assert [(a.display_name, a.username, a.domain) for a in message["To"].addresses] == [
+        ("José", "josé", "xn--exmple-cua.com"),
+        ("", "bob", "example.com"),
+    ]
+    assert message["Subject"] == "Café"
+    print("✅ International addresses encoded")
+
+def test_no_header_injection():
+    """CR/LF in a subject or address can't start a new header"""
+    raw = build_raw_message(["bob@example.com\r\nBcc: mallory@example.com"],
+                            "Hello\r\nBcc: mallory@example.com", "body")
+    message = message_from_bytes(raw)
+
+    assert message.get_all("Bcc") is None
+    assert "\n" not in decoded(message["Subject"])
+    assert len(message.get_all("To")) == 1
+    assert message.keys() == ["To", "Subject", "Date", "MIME-Version", "Content-Type", "Content-Transfer-Encoding"]
+    print("✅ Header injection blocked")
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*80)
+    print("🧪 EMAIL MESSAGE TESTS")
+    print("="*80)
+
+    test_headers_and_body()
+    test_optional_headers_omitted()
+    test_crlf_line_endings()
+    test_non_ascii_encoding()
+    test_international_addresses()
+    test_no_header_injection()
+
+    print("\n✅ All email message tests passed!")
+
+if __name__ == "__main__":
+    main()
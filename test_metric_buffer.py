@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test script for metric buffers
+Checks stats and time-range lookups against the buffered entries
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Backend automation package lives under backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from automation.monitoring import MetricBuffer
+
+T0 = datetime(2026, 1, 1)
+
+def filled(values, max_size=5):
+    buffer = MetricBuffer(max_size=max_size)
+    for i, value in enumerate(values):
+        buffer.add_value(value, T0 + timedelta(seconds=i))
+    return buffer
+
+def test_stats_cover_buffered_values_only():
+    """Evicted samples drop out of the stats, non-numeric entries are skipped"""
+    buffer = filled([100, 1, "up", 2, "down", 3, "up"], max_size=5)
+    assert buffer.get_stats() == {"count": 2, "min": 2.0, "max": 3.0, "avg": 2.5, "sum": 5.0}
+    assert filled(["up", "down"]).get_stats() == {}
+    assert MetricBuffer().get_stats() == {}
+    print("✅ Stats cover buffered values only")
+
+def test_small_series_stay_small():
+    """Rings start small and grow with the buffer up to max_size"""
+    buffer = filled([1.0], max_size=1000)
+    assert len(buffer._values) < 1000
+    buffer = filled(range(1500), max_size=1000)
+    assert len(buffer._values) == 1000
+    assert buffer.get_stats()["min"] == 500.0
+    print("✅ Rings grow on demand")
+
+def test_range_after_wraparound():
+    """get_range returns entries in buffer order once the ring has wrapped"""
+    buffer = filled(range(12), max_size=5)
+    found = buffer.get_range(T0 + timedelta(seconds=8), T0 + timedelta(seconds=10))
+    assert [m.value for m in found] == [8, 9, 10]
+    assert buffer.get_range(T0, T0 + timedelta(seconds=6)) == []
+    print("✅ Range lookups after wraparound")
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*80)
+    print("🧪 METRIC BUFFER TESTS")
+    print("="*80)
+
+    test_stats_cover_buffered_values_only()
+    test_small_series_stay_small()
+    test_range_after_wraparound()
+
+    print("\n✅ All metric buffer tests passed!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Test script for plan step grouping
+Checks which plan steps _plan_levels lets run concurrently
+"""
+
+import sys
+import os
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from intelligent_agents.agent_core import IntelligentAgent, _plan_levels
+
+class PlanAgent(IntelligentAgent):
+    """Agent with a fixed plan whose steps just sleep"""
+    def __init__(self, steps):
+        super().__init__("Plan", ["testing"])
+        self.steps = steps
+
+    def think(self, task, context=None):
+        return {"steps": self.steps}
+
+    def execute_step(self, step, context=None):
+        time.sleep(0.2)
+        return {"step": step["step"]}
+
+class OwnRunAgent(IntelligentAgent):
+    """Agent with its own run(), like SystemAgent"""
+    def __init__(self):
+        super().__init__("OwnRun", ["testing"])
+
+    def run(self, task, context=None):
+        return {"success": True, "own_run": task}
+
+def step(number, *depends_on):
+    return {"step": number, "action": f"step {number}", "depends_on": list(depends_on)}
+
+def test_no_dependency_info_runs_sequentially():
+    """Plans without any depends_on keep the old one-by-one order"""
+    steps = [{"step": 1, "action": "a"}, {"step": 2, "action": "b"}, {"step": 3, "action": "c"}]
+    assert _plan_levels(steps) == [[0], [1], [2]]
+    assert _plan_levels([]) == []
+    print("✅ Plans without depends_on run sequentially")
+
+def test_independent_steps_share_a_level():
+    """Steps 1 and 3 are independent, 2 needs 1 and 4 needs 2 and 3"""
+    steps = [step(1), step(2, 1), step(3), step(4, 2, 3)]
+    assert _plan_levels(steps) == [[0, 2], [1], [3]]
+    print("✅ Independent steps grouped into one level")
+
+def test_positions_not_step_numbers():
+    """Levels hold 0-based positions even when step numbers don't start at 1"""
+    steps = [step(10), step(20, 10), step(30, 10)]
+    assert _plan_levels(steps) == [[0], [1, 2]]
+    print("✅ Levels use positions in the plan")
+
+def test_forward_and_unknown_dependencies_ignored():
+    """Only earlier steps count as dependencies, so cycles and typos can't stall a plan"""
+    steps = [step(1, 2), step(2, 1), step(3, 99), step(4, 4)]
+    assert _plan_levels(steps) == [[0, 2, 3], [1]]
+    print("✅ Forward, unknown and self dependencies ignored")
+
+def test_missing_depends_on_in_mixed_plan():
+    """Once any step declares depends_on, steps without it have no dependencies"""
+    steps = [step(1), {"step": 2, "action": "b"}, step(3, 1)]
+    assert _plan_levels(steps) == [[0, 1], [2]]
+    print("✅ Steps without depends_on start in the first level")
+
+def test_arun_runs_levels_concurrently():
+    """arun overlaps independent steps and keeps results in plan order"""
+    agent = PlanAgent([step(1), step(2), step(3), step(4, 1, 2, 3)])
+    start = time.perf_counter()
+    result = asyncio.run(agent.arun("task"))
+    elapsed = time.perf_counter() - start
+    assert result["success"]
+    assert [r["step"] for r in result["results"]] == [1, 2, 3, 4]
+    assert elapsed < 0.7, elapsed
+    print("✅ arun runs independent steps concurrently")
+
+def test_arun_uses_overridden_run():
+    """Agents that override run() keep their own loop under arun"""
+    result = asyncio.run(OwnRunAgent().arun("task"))
+    assert result == {"success": True, "own_run": "task"}
+    print("✅ arun delegates to an overridden run()")
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*80)
+    print("🧪 PLAN LEVEL TESTS")
+    print("="*80)
+
+    test_no_dependency_info_runs_sequentially()
+    test_independent_steps_share_a_level()
+    test_positions_not_step_numbers()
+    test_forward_and_unknown_dependencies_ignored()
+    test_missing_depends_on_in_mixed_plan()
+    test_arun_runs_levels_concurrently()
+    test_arun_uses_overridden_run()
+
+    print("\n✅ All plan level tests passed!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Test script for the LLM response cache
+Covers exact hits, LRU eviction and ttl expiry
+"""
+
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from intelligent_agents.semantic_cache import SemanticCache
+
+def test_exact_hits():
+    """Keys match after whitespace normalization, per namespace"""
+    cache = SemanticCache()
+    cache.put("agent.think", "list  files\n", "plan")
+    assert cache.get("agent.think", "list files") == "plan"
+    assert cache.get("agent.other", "list files") is None
+    print("✅ Exact hits")
+
+def test_lru_eviction():
+    """The least recently used entry goes first"""
+    cache = SemanticCache(max_entries=2)
+    cache.put("ns", "a", "1")
+    cache.put("ns", "b", "2")
+    cache.get("ns", "a")
+    cache.put("ns", "c", "3")
+    assert cache.get("ns", "b") is None
+    assert cache.get("ns", "a") == "1"
+    print("✅ LRU eviction")
+
+def test_ttl_expiry():
+    """Entries stored with a ttl miss once it has passed"""
+    cache = SemanticCache()
+    cache.put("ns", "short", "x", ttl=0.05)
+    cache.put("ns", "forever", "y")
+    assert cache.get("ns", "short") == "x"
+    time.sleep(0.1)
+    assert cache.get("ns", "short") is None
+    assert cache.get("ns", "forever") == "y"
+    print("✅ ttl expiry")
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*80)
+    print("🧪 RESPONSE CACHE TESTS")
+    print("="*80)
+
+    test_exact_hits()
+    test_lru_eviction()
+    test_ttl_expiry()
+
+    print("\n✅ All response cache tests passed!")
+
+if __name__ == "__main__":
+    main()
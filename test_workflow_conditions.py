@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test script for workflow step conditions
+Covers the condition parser/evaluator and how conditions gate step execution
+"""
+
+import sys
+import os
+import asyncio
+
+# Backend automation package lives under backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from automation.workflow_engine import (
+    Workflow,
+    WorkflowEngine,
+    WorkflowStep,
+    TaskStatus,
+    _compile_condition,
+)
+
+def make_workflow(**fetch):
+    """Workflow with a finished 'fetch' step and a pending 'report' step"""
+    step = WorkflowStep("fetch", "fetch data")
+    step.status = fetch.get("status", TaskStatus.SUCCESS)
+    step.result = fetch.get("result")
+    step.error = fetch.get("error")
+    step.attempts = fetch.get("attempts", 1)
+    return Workflow("wf", "conditions", [step, WorkflowStep("report", "write report")])
+
+def test_status_comparison():
+    """status compares by its string value"""
+    workflow = make_workflow()
+    assert _compile_condition("fetch.status == 'success'")(workflow) is True
+    assert _compile_condition("fetch.status != 'success'")(workflow) is False
+    assert _compile_condition("fetch.status in ('failed', 'skipped')")(workflow) is False
+    print("✅ Status comparisons evaluated correctly")
+
+def test_contains():
+    """.contains() searches text, stringifies other values and is False for None"""
+    workflow = make_workflow(result="3 rows fetched", error=None)
+    assert _compile_condition("fetch.result.contains('rows')")(workflow) is True
+    assert _compile_condition("not fetch.result.contains('error')")(workflow) is True
+    assert _compile_condition("fetch.error.contains('timeout')")(workflow) is False
+
+    workflow = make_workflow(result={"rows": 3})
+    assert _compile_condition("fetch.result.contains('rows')")(workflow) is True
+    print("✅ .contains() evaluated correctly")
+
+def test_chained_and_boolean():
+    """Chained comparisons and and/or combine like Python"""
+    workflow = make_workflow(attempts=2)
+    assert _compile_condition("1 <= fetch.attempts < 3")(workflow) is True
+    assert _compile_condition("1 < fetch.attempts < 2")(workflow) is False
+    assert _compile_condition("fetch.status == 'failed' or fetch.attempts > 1")(workflow) is True
+    assert _compile_condition("fetch.status == 'success' and fetch.attempts > 5")(workflow) is False
+    print("✅ Chained and boolean conditions evaluated correctly")
+
+def test_unknown_field_and_bad_syntax():
+    """Unknown fields, unsupported syntax and syntax errors are rejected when parsed"""
+    for expr in (
+        "fetch.secret == 1",          # not a step field
+        "__import__('os')",           # calls other than .contains()
+        "fetch.attempts + 1 > 2",     # arithmetic
+        "fetch.status ==",            # syntax error
+    ):
+        try:
+            _compile_condition(expr)
+        except ValueError:
+            continue
+        raise AssertionError(f"condition should be rejected: {expr!r}")
+
+    # An invalid condition is dropped when the step is built, so the step runs
+    assert WorkflowStep("s", "cmd", condition="fetch.status ==")._condition_fn is None
+    print("✅ Invalid conditions rejected")
+
+def test_unknown_step_passes():
+    """A condition naming a step that isn't in the workflow doesn't block the step"""
+    engine = WorkflowEngine(agent_executor=None)
+    step = WorkflowStep("report", "write report", condition="missing.status == 'success'")
+    workflow = Workflow("wf", "conditions", [step])
+    assert engine._check_condition(step, workflow) is True
+    print("✅ Unknown step ids leave the step enabled")
+
+def test_false_condition_skips_step():
+    """A step whose condition is false is marked SKIPPED and never executed"""
+    executed = []
+
+    async def executor(command, agent, timeout):
+        executed.append(command)
+        return {"success": True, "output": "ok"}
+
+    engine = WorkflowEngine(agent_executor=executor)
+    workflow = Workflow("wf", "conditions", [
+        WorkflowStep("fetch", "fetch data"),
+        WorkflowStep("alert", "send alert", depends_on=["fetch"], condition="fetch.status == 'failed'"),
+    ])
+    asyncio.run(engine.execute_workflow(workflow))
+
+    assert executed == ["fetch data"]
+    assert workflow.steps["alert"].status == TaskStatus.SKIPPED
+    print("✅ False condition skipped the step")
+
+def main():
+    """Run all tests"""
+    print("\n" + "="*80)
+    print("🧪 WORKFLOW CONDITION TESTS")
+    print("="*80)
+
+    test_status_comparison()
+    test_contains()
+    test_chained_and_boolean()
+    test_unknown_field_and_bad_syntax()
+    test_unknown_step_passes()
+    test_false_condition_skips_step()
+
+    print("\n✅ All workflow condition tests passed!")
+
+if __name__ == "__main__":
+    main()